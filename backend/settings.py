@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import tempfile
 from pathlib import Path
 from datetime import timedelta
 from decouple import config, Csv
@@ -62,11 +63,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.QueryBudgetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'shop.middleware.PageCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -86,6 +89,7 @@ TEMPLATES = [
                 'django.contrib.messages.context_processors.messages',
                 'shop.context_processors.categories',
                 'shop.context_processors.cart_wishlist_counts',
+                'shop.context_processors.page_cache',
             ],
         },
     },
@@ -162,11 +166,125 @@ STATICFILES_DIRS = [
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Uploads are stored under the SHA-256 of their content (shop.storage), which
+# deduplicates identical images and lets them be cached forever. Orphaned files
+# are removed with `manage.py gc_media`.
+STORAGES = {
+    'default': {'BACKEND': 'shop.storage.ContentAddressedStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+# Serve MEDIA_URL from Django (off by default in production, where the web server
+# should serve media/content/ with the same immutable Cache-Control header)
+SERVE_MEDIA = config('SERVE_MEDIA', default=DEBUG, cast=bool)
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Default number of products per page on /api/products/ (override with ?page_size=)
+PRODUCT_API_PAGE_SIZE = config('PRODUCT_API_PAGE_SIZE', default=24, cast=int)
+
+# Product search index: cap on ranked results and the snapshot written by
+# `manage.py rebuild_search_index` (loaded by workers on first search)
+SEARCH_MAX_RESULTS = config('SEARCH_MAX_RESULTS', default=500, cast=int)
+SEARCH_INDEX_PATH = config('SEARCH_INDEX_PATH', default=str(BASE_DIR / 'search_index.pickle'))
+# Seconds between checks of the catalog for writes the index has not seen. Product saves
+# trigger a check at once through the shared cache; this bounds bulk writes.
+SEARCH_FRESHNESS_INTERVAL = config('SEARCH_FRESHNESS_INTERVAL', default=60, cast=int)
+
+# Lower bounds (₹) of the price histogram buckets returned by the product facets
+PRODUCT_PRICE_BUCKETS = [0, 500, 1000, 5000, 10000, 50000]
+
+# Cache shared by all worker processes. The home feed, the page cache, the navigation
+# categories and the per-user cart/wishlist counts stay correct by invalidating or
+# incrementing entries that every process must see, so production (several gunicorn
+# workers) needs REDIS_URL. Without SHARED_CACHE those caches are bypassed and the page
+# cache is off; it defaults on with DEBUG because runserver is a single process. Set
+# SHARED_CACHE=True when CACHES points at another shared backend (e.g. memcached).
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+SHARED_CACHE = config('SHARED_CACHE', default=bool(REDIS_URL) or DEBUG, cast=bool)
+
+# Seconds the cached home feed (shop.home_feed) lives; Product/Category/ProductImage
+# saves invalidate it immediately, this only bounds writes that bypass signals
+HOME_FEED_TIMEOUT = config('HOME_FEED_TIMEOUT', default=300, cast=int)
+
+# Seconds the catalog pages stay in the page cache (shop.page_cache, 0 disables it).
+# Product/Category/Review writes invalidate the affected pages immediately.
+PAGE_CACHE_TIMEOUT = config('PAGE_CACHE_TIMEOUT', default=600, cast=int)
+
+# Seconds rendered product cards (shop.product_cards) stay cached. Cards are keyed by
+# product updated_at, so edits show at once; this only bounds template/media changes.
+PRODUCT_CARD_TIMEOUT = config('PRODUCT_CARD_TIMEOUT', default=60 * 60 * 24, cast=int)
+
+# Related products (shop.recommendations): neighbours stored per product and the
+# largest wishlist+cart basket counted. Refresh with `manage.py build_recommendations`.
+RECOMMENDATION_COUNT = config('RECOMMENDATION_COUNT', default=8, cast=int)
+RECOMMENDATION_MAX_BASKET = config('RECOMMENDATION_MAX_BASKET', default=50, cast=int)
+
+# Seconds after which the admin dashboard recounts its stored statistics
+# (shop.dashboard_stats) on load; 0 leaves it to `manage.py reconcile_dashboard_stats`.
+DASHBOARD_STATS_MAX_AGE = config('DASHBOARD_STATS_MAX_AGE', default=60 * 60 * 24, cast=int)
+
+# Resized copies of product images (shop.image_variants): widths in pixels, WebP/JPEG
+# quality and the size of the process pool rendering them (0 renders inline).
+# Existing media is processed with `manage.py generate_image_variants`.
+IMAGE_VARIANT_WIDTHS = [320, 640, 1280]
+IMAGE_VARIANT_QUALITY = config('IMAGE_VARIANT_QUALITY', default=80, cast=int)
+IMAGE_VARIANT_WORKERS = config('IMAGE_VARIANT_WORKERS', default=2, cast=int)
+
+# Uploads from the product add/edit pages are moved here and processed in the same
+# pool (shop.uploads): decoded, EXIF-stripped, capped at IMAGE_UPLOAD_MAX_DIMENSION
+# pixels and recompressed. Keep it on the same filesystem as the upload temp dir
+# so staging is a rename.
+UPLOAD_STAGING_DIR = config('UPLOAD_STAGING_DIR', default=str(Path(tempfile.gettempdir()) / 'jeetech-uploads'))
+IMAGE_UPLOAD_MAX_DIMENSION = config('IMAGE_UPLOAD_MAX_DIMENSION', default=2560, cast=int)
+IMAGE_UPLOAD_QUALITY = config('IMAGE_UPLOAD_QUALITY', default=85, cast=int)
+
+# Query budgets per URL name (shop/urls.py, shop/api_urls.py), enforced by
+# shop.middleware.QueryBudgetMiddleware together with an N+1 check that flags
+# any query shape repeated QUERY_REPEAT_THRESHOLD times in one request.
+# Violations are logged as warnings; with QUERY_BUDGET_RAISE they raise
+# (tests opt in via shop.query_budget.enforce_query_budgets). Budgets for
+# cached pages and counters cover the cache-miss rebuild, and public pages are
+# budgeted at the signed-in cost (cart/wishlist counts and hearts), with or
+# without SHARED_CACHE.
+QUERY_BUDGETS = {
+    'home': 9,
+    'product_list': 12,
+    'product_detail': 15,
+    'category_products': 8,
+    'cart': 8,
+    'wishlist': 8,
+    'profile': 10,
+    'about': 4,
+    'checkout_whatsapp': 5,
+    'admin_dashboard': 14,
+    'admin_products': 9,
+    'api_products': 4,
+    'api_product_facets': 3,
+    'api_featured_products': 7,
+    'api_product_detail': 3,
+    'api_product_related': 6,
+    'api_product_similar': 5,
+    'api_categories': 3,
+    'api_wishlist': 4,
+    'api_cart': 4,
+    'api_cart_batch': 11,
+    'api_cart_summary': 2,
+    'api_checkout_whatsapp': 4,
+}
+QUERY_REPEAT_THRESHOLD = 5
+QUERY_BUDGET_RAISE = config('QUERY_BUDGET_RAISE', default=False, cast=bool)
+
 # WhatsApp admin phone (include country code, no plus). Example: '919999999999'
 WHATSAPP_NUMBER = '919344998602'
 
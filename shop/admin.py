@@ -5,6 +5,8 @@ from django.utils.html import format_html
 from django.conf import settings
 from django import forms
 from .models import Category, Product, ProductImage, Wishlist, CartItem, Review, UserProfile
+from .dashboard_stats import get_dashboard_stats
+from .pagination import EstimatedCountPaginator
 
 # Custom Admin Site Configuration
 class CustomAdminSite(admin.AdminSite):
@@ -16,13 +18,13 @@ class CustomAdminSite(admin.AdminSite):
         """Custom admin index with helpful information"""
         extra_context = extra_context or {}
         
-        # Add quick stats and helpful info
-        from django.contrib.auth.models import User
-        
+        # Add quick stats (from the row shop.dashboard_stats keeps current) and helpful info
+        stats = get_dashboard_stats()
         extra_context.update({
-            'total_users': User.objects.count(),
-            'admin_users': User.objects.filter(is_staff=True).count(),
-            'superusers': User.objects.filter(is_superuser=True).count(),
+            'total_users': stats.user_count,
+            'admin_users': stats.staff_count,
+            'superusers': stats.superuser_count,
+            'stats_updated_at': stats.updated_at,
             'show_admin_help': True,
         })
         
@@ -57,7 +59,7 @@ class CategoryForm(forms.ModelForm):
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     form = CategoryForm
-    list_display = ('id', 'name', 'slug', 'product_count')
+    list_display = ('id', 'name', 'slug', 'product_count', 'in_stock_count')
     prepopulated_fields = {'slug': ('name',)}
     search_fields = ('name',)
     list_per_page = 20
@@ -77,27 +79,8 @@ class CategoryAdmin(admin.ModelAdmin):
             form.base_fields['slug'].required = False
         return form
     
-    def product_count(self, obj):
-        return obj.products.count()
-    product_count.short_description = 'Products'
-    
     def save_model(self, request, obj, form, change):
-        # Ensure slug is generated if not provided
-        if not obj.slug:
-            from django.utils.text import slugify
-            base_slug = slugify(obj.name)
-            if not base_slug:  # If name is empty or only special chars
-                base_slug = f"category-{obj.pk or 'new'}"
-            
-            # Ensure unique slug
-            slug = base_slug
-            counter = 1
-            while Category.objects.filter(slug=slug).exclude(pk=obj.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            obj.slug = slug
-        
+        # Category.save() allocates a unique slug when none is provided
         try:
             super().save_model(request, obj, form, change)
             if not change:  # New category
@@ -115,7 +98,7 @@ class ProductImageInline(admin.TabularInline):
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 100px; max-width: 100px;" />', obj.image.url)
+            return format_html('<img src="{}" loading="lazy" style="max-height: 100px; max-width: 100px;" />', obj.thumbnail_url)
         return "No image"
     image_preview.short_description = 'Preview'
 
@@ -129,6 +112,7 @@ class ProductAdmin(admin.ModelAdmin):
     date_hierarchy = 'created_at'
     readonly_fields = ('slug', 'image_preview', 'created_at', 'updated_at')
     inlines = [ProductImageInline]
+    list_select_related = ('category',)
     
     fieldsets = (
         ('Basic Information', {
@@ -148,33 +132,16 @@ class ProductAdmin(admin.ModelAdmin):
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 150px; max-width: 150px; border-radius: 8px;" />', obj.image.url)
+            return format_html('<img src="{}" loading="lazy" style="max-height: 150px; max-width: 150px; border-radius: 8px;" />', obj.thumbnail_url)
         return "No main image"
     image_preview.short_description = 'Main Image Preview'
     
     def additional_images_count(self, obj):
-        count = obj.additional_images.count()
+        count = sum(1 for entry in obj.image_manifest if not entry['is_main'])
         if count > 0:
             return format_html('<span style="color: green; font-weight: bold;">{} images</span>', count)
         return format_html('<span style="color: #999;">No additional images</span>')
     additional_images_count.short_description = 'Additional Images'
-    
-    def save_model(self, request, obj, form, change):
-        # Ensure slug is generated if not provided
-        if not obj.slug:
-            from django.utils.text import slugify
-            base_slug = slugify(obj.name)
-            if not base_slug:
-                base_slug = f"product-{obj.pk or 'new'}"
-            
-            slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exclude(pk=obj.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            obj.slug = slug
-        super().save_model(request, obj, form, change)
 
 @admin.register(ProductImage)
 class ProductImageAdmin(admin.ModelAdmin):
@@ -183,19 +150,34 @@ class ProductImageAdmin(admin.ModelAdmin):
     search_fields = ('product__name', 'alt_text')
     list_editable = ('order', 'alt_text')
     readonly_fields = ('image_preview', 'created_at')
+    list_select_related = ('product',)
+    raw_id_fields = ('product',)
     
     def image_preview(self, obj):
         if obj.image:
-            return format_html('<img src="{}" style="max-height: 80px; max-width: 80px; border-radius: 4px;" />', obj.image.url)
+            return format_html('<img src="{}" loading="lazy" style="max-height: 80px; max-width: 80px; border-radius: 4px;" />', obj.thumbnail_url)
         return "No image"
     image_preview.short_description = 'Preview'
 
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for the per-user tables that grow to millions of rows:
+    related objects joined in the page query, no second COUNT(*) for the
+    "n of N" total, an estimated count for the unfiltered list and raw id
+    widgets instead of <select>s listing every user and product.
+    """
+    list_select_related = ('user', 'product')
+    raw_id_fields = ('user', 'product')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
 @admin.register(Wishlist)
-class WishlistAdmin(admin.ModelAdmin):
+class WishlistAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'product')
+    search_fields = ('user__username', 'product__name')
 
 @admin.register(CartItem)
-class CartItemAdmin(admin.ModelAdmin):
+class CartItemAdmin(LargeTableAdmin):
     list_display = ('id', 'user', 'product', 'quantity', 'created_at')
     list_filter = ('created_at',)
     search_fields = ('user__username', 'product__name')
@@ -203,6 +185,8 @@ class CartItemAdmin(admin.ModelAdmin):
 @admin.register(Review)
 class ReviewAdmin(admin.ModelAdmin):
     list_display = ('id', 'product', 'user', 'rating', 'created_at')
+    list_select_related = ('product', 'user')
+    raw_id_fields = ('product', 'user')
     list_filter = ('rating', 'created_at')
     search_fields = ('product__name', 'user__username', 'comment')
     readonly_fields = ('created_at',)
@@ -300,6 +284,8 @@ class CustomUserAdmin(BaseUserAdmin):
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('id', 'user', 'phone', 'created_at', 'updated_at')
+    list_select_related = ('user',)
+    raw_id_fields = ('user',)
     search_fields = ('user__username', 'user__email', 'phone')
     readonly_fields = ('created_at', 'updated_at')
     list_filter = ('created_at', 'updated_at')
\ No newline at end of file
@@ -6,12 +6,17 @@ urlpatterns = [
     path('api_home/', api_views.api_home, name='api_home_explicit'),
     path('categories/', api_views.CategoryListAPI.as_view(), name='api_categories'),
     path('products/', api_views.ProductListAPI.as_view(), name='api_products'),
+    path('products/facets/', api_views.ProductFacetsAPI.as_view(), name='api_product_facets'),
     path('products/featured/', api_views.FeaturedProductsAPI.as_view(), name='api_featured_products'),
     path('products/<int:pk>/', api_views.ProductDetailAPI.as_view(), name='api_product_detail'),
+    path('products/<int:pk>/related/', api_views.RelatedProductsAPI.as_view(), name='api_product_related'),
+    path('products/<int:pk>/similar/', api_views.SimilarProductsAPI.as_view(), name='api_product_similar'),
     path('wishlist/', api_views.WishlistAPI.as_view(), name='api_wishlist'),
     path('wishlist/<int:pk>/', api_views.WishlistDetailAPI.as_view(), name='api_wishlist_detail'),
     path('wishlist/move_to_cart/', api_views.WishlistMoveToCartAPI.as_view(), name='api_wishlist_move_to_cart'),
     path('cart/', api_views.CartAPI.as_view(), name='api_cart'),
+    path('cart/summary/', api_views.CartSummaryAPI.as_view(), name='api_cart_summary'),
+    path('cart/batch/', api_views.CartBatchAPI.as_view(), name='api_cart_batch'),
     path('cart/<int:pk>/', api_views.CartDetailAPI.as_view(), name='api_cart_detail'),
     path('checkout/whatsapp/', api_views.CheckoutWhatsAppAPI.as_view(), name='api_checkout_whatsapp'),
     path('signup/', api_views.SignupAPI.as_view(), name='api_signup'),
@@ -1,14 +1,32 @@
 from rest_framework import generics, permissions
 from rest_framework.response import Response
 from rest_framework.views import APIView
-from django.db.models import Q
 from django.http import JsonResponse
 from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
 from urllib.parse import quote
+from .conditional import (
+    conditional_page, product_list_api_validators, product_detail_api_validators,
+    featured_products_api_validators, category_list_api_validators,
+    product_facets_api_validators, related_products_api_validators, similar_products_api_validators,
+)
+from .facets import product_facets
+from .cart_summary import cart_summary, format_amount
+from .dashboard_stats import count_cart_user
+from .home_feed import get_home_feed
+from .user_counts import set_cart_count
+from .filters import filter_products
 from .models import Category, Product, Wishlist, CartItem
+from .pagination import ProductCursorPagination
+from .recommendations import basket_changed, batched_basket_changes, related_products
+from .search import rank_queryset, similar_products
 from .serializers import (
-    CategorySerializer, ProductSerializer,
-    WishlistSerializer, CartItemSerializer,
+    CategorySerializer, ProductSerializer, ProductRowSerializer,
+    WishlistSerializer, CartItemSerializer, CartBatchSerializer,
+    CartSummarySerializer,
     UserSerializer,
 )
 
@@ -18,8 +36,11 @@ def api_home(request):
         "endpoints": [
             "/api/categories/",
             "/api/products/",
+            "/api/products/facets/",
             "/api/wishlist/",
             "/api/cart/",
+            "/api/cart/batch/",
+            "/api/cart/summary/",
             "/api/wishlist/move_to_cart/",
             "/api/checkout/whatsapp/",
             "/api/signup/",
@@ -29,67 +50,90 @@ def api_home(request):
     })
 
 # -------- Products --------
+@method_decorator(conditional_page(product_list_api_validators), name='get')
 class ProductListAPI(generics.ListAPIView):
     serializer_class = ProductSerializer
+    pagination_class = ProductCursorPagination
 
     def get_queryset(self):
-        qs = Product.objects.all()
         params = self.request.query_params
-        category = params.get('category')
-        price_min = params.get('price_min')
-        price_max = params.get('price_max')
-        name = params.get('name')
-        featured = params.get('featured')
-
-        if category:
-            qs = qs.filter(category_id=category)
-        if price_min:
-            qs = qs.filter(price__gte=price_min)
-        if price_max:
-            qs = qs.filter(price__lte=price_max)
-        if name:
-            qs = qs.filter(Q(name__icontains=name) | Q(description__icontains=name))
-        if featured and featured.lower() in ['true', '1', 'yes']:
-            qs = qs.filter(is_featured=True)
-        
-        return qs.order_by('-created_at')
+        # Search results keep their rank order and are paged by offset;
+        # otherwise ProductCursorPagination orders by (-created_at, -id)
+        self.ranked = bool(params.get('name'))
+        return filter_products(Product.objects.all(), params)
+
+    def list(self, request, *args, **kwargs):
+        # Read-only fast path: .values() rows instead of model instances
+        queryset = self.filter_queryset(self.get_queryset()).values(*ProductRowSerializer.values_fields)
+        page = self.paginate_queryset(queryset)
+        data = ProductRowSerializer(context=self.get_serializer_context()).serialize(page)
+        return self.get_paginated_response(data)
+
+
+@method_decorator(conditional_page(product_facets_api_validators), name='get')
+class ProductFacetsAPI(APIView):
+    """Category counts and price histogram for the /api/products/ filter set"""
+
+    def get(self, request):
+        params = request.query_params.copy()
+        category = params.pop('category', [None])[0]
+        queryset = filter_products(Product.objects.all(), params, ranked=False)
+        return Response(product_facets(queryset, category=category))
 
 
+@method_decorator(conditional_page(product_detail_api_validators), name='get')
 class ProductDetailAPI(generics.RetrieveAPIView):
-    queryset = Product.objects.all()
+    queryset = Product.objects.select_related('category')
+    serializer_class = ProductSerializer
+
+
+@method_decorator(conditional_page(related_products_api_validators), name='get')
+class RelatedProductsAPI(generics.ListAPIView):
+    """Products wishlisted or carted together with this one, topped up from its category"""
     serializer_class = ProductSerializer
 
+    def get_queryset(self):
+        product = get_object_or_404(Product.objects.only('pk', 'category_id', 'recommended_ids'), pk=self.kwargs['pk'])
+        return related_products(product)
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_queryset().values(*ProductRowSerializer.values_fields)
+        data = ProductRowSerializer(context=self.get_serializer_context()).serialize(rows)
+        return Response(data)
+
+
+@method_decorator(conditional_page(similar_products_api_validators), name='get')
+class SimilarProductsAPI(generics.ListAPIView):
+    """Products whose name, description and category read most like this one's"""
+    serializer_class = ProductSerializer
+
+    def get_queryset(self):
+        product = get_object_or_404(Product.objects.only('pk'), pk=self.kwargs['pk'])
+        return rank_queryset(Product.objects.select_related('category'), similar_products(product.pk))
+
+    def list(self, request, *args, **kwargs):
+        rows = self.get_queryset().values(*ProductRowSerializer.values_fields)
+        data = ProductRowSerializer(context=self.get_serializer_context()).serialize(rows)
+        return Response(data)
+
 
+@method_decorator(conditional_page(featured_products_api_validators), name='get')
 class FeaturedProductsAPI(generics.ListAPIView):
     """API endpoint specifically for featured products on home page"""
     serializer_class = ProductSerializer
     
     def get_queryset(self):
-        # Return featured products, or if none exist, return latest products
-        featured_products = Product.objects.filter(is_featured=True).order_by('-created_at')
-        if featured_products.exists():
-            return featured_products[:8]  # Limit to 8 featured products
-        else:
-            # Fallback to latest products if no featured products exist
-            return Product.objects.all().order_by('-created_at')[:8]
+        return Product.objects.filter(is_featured=True).order_by('-created_at')
     
     def list(self, request, *args, **kwargs):
-        queryset = self.get_queryset()
-        serializer = self.get_serializer(queryset, many=True)
-        
-        # Add debug info
-        featured_count = Product.objects.filter(is_featured=True).count()
-        total_count = Product.objects.count()
-        
-        print(f"Featured Products API called:")
-        print(f"  - Featured products in DB: {featured_count}")
-        print(f"  - Total products in DB: {total_count}")
-        print(f"  - Returning {len(serializer.data)} products")
-        
-        return Response(serializer.data)
+        # Featured products (or the latest ones when none are featured) come from the shared home feed cache
+        rows = get_home_feed()['featured_rows']
+        data = ProductRowSerializer(context=self.get_serializer_context()).serialize(rows)
+        return Response(data)
 
 
 # -------- Categories --------
+@method_decorator(conditional_page(category_list_api_validators), name='get')
 class CategoryListAPI(generics.ListAPIView):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
@@ -101,7 +145,7 @@ class WishlistAPI(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return Wishlist.objects.filter(user=self.request.user)
+        return Wishlist.objects.filter(user=self.request.user).select_related('product__category')
 
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
@@ -121,7 +165,7 @@ class CartAPI(generics.ListCreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return CartItem.objects.filter(user=self.request.user)
+        return CartItem.objects.filter(user=self.request.user).select_related('product__category')
 
     def perform_create(self, serializer):
         # upsert: if already in cart, increment quantity
@@ -141,7 +185,94 @@ class CartDetailAPI(generics.RetrieveUpdateDestroyAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get_queryset(self):
-        return CartItem.objects.filter(user=self.request.user)
+        return CartItem.objects.filter(user=self.request.user).select_related('product__category')
+
+
+class CartSummaryAPI(APIView):
+    """Cart lines with exact Decimal line totals, item count and grand total"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get(self, request):
+        return Response(CartSummarySerializer(cart_summary(request.user)).data)
+
+
+class CartBatchAPI(APIView):
+    """
+    Apply several cart mutations in one request and one transaction:
+
+        {"operations": [
+            {"op": "add", "product_id": 3, "quantity": 1},
+            {"op": "set", "product_id": 5, "quantity": 2},
+            {"op": "remove", "product_id": 7}
+        ]}
+
+    A "set" to quantity 0 removes the product. Operations are folded in
+    order, then written with one bulk insert, one bulk update and one delete.
+    Responds with the resulting cart.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        serializer = CartBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data['operations']
+        product_ids = {op['product_id'] for op in operations}
+
+        try:
+            # Recommendations are flagged once for the whole batch, before the commit
+            with transaction.atomic(), batched_basket_changes():
+                existing = {
+                    item.product_id: item
+                    for item in CartItem.objects.select_for_update().filter(
+                        user=request.user, product_id__in=product_ids
+                    )
+                }
+                known = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
+                missing = sorted(product_ids - known)
+                if missing:
+                    return Response({"detail": f"Products not found: {missing}"}, status=404)
+
+                quantities = {pid: item.quantity for pid, item in existing.items()}
+                for op in operations:
+                    pid = op['product_id']
+                    if op['op'] == 'add':
+                        quantities[pid] = (quantities.get(pid) or 0) + op.get('quantity', 1)
+                    elif op['op'] == 'set':
+                        quantities[pid] = op['quantity'] or None
+                    else:
+                        quantities[pid] = None
+
+                now = timezone.now()
+                to_create, to_update, to_delete = [], [], []
+                for pid, quantity in quantities.items():
+                    item = existing.get(pid)
+                    if quantity is None:
+                        if item is not None:
+                            to_delete.append(item.pk)
+                    elif item is None:
+                        to_create.append(CartItem(user=request.user, product_id=pid, quantity=quantity))
+                    elif item.quantity != quantity:
+                        item.quantity = quantity
+                        item.updated_at = now
+                        to_update.append(item)
+
+                if to_create:
+                    CartItem.objects.bulk_create(to_create)
+                    # bulk_create skips the receivers flagging the basket's recommendations
+                    # and counting the user's cart on the dashboard
+                    basket_changed(request.user.pk, [item.product_id for item in to_create])
+                    count_cart_user(request.user.pk)
+                if to_update:
+                    CartItem.objects.bulk_update(to_update, ['quantity', 'updated_at'])
+                if to_delete:
+                    CartItem.objects.filter(pk__in=to_delete).delete()
+        except IntegrityError:
+            return Response({"detail": "Cart was modified concurrently, please retry"}, status=409)
+
+        items = list(CartItem.objects.filter(user=request.user).select_related('product__category'))
+        # bulk_create/bulk_update skip the signals that keep the cached count current
+        transaction.on_commit(lambda: set_cart_count(request.user, len(items)))
+        return Response(CartItemSerializer(items, many=True, context={"request": request}).data)
 
 
 # -------- Wishlist -> Cart (move one) --------
@@ -176,19 +307,14 @@ class CheckoutWhatsAppAPI(APIView):
         admin_number = getattr(settings, 'WHATSAPP_NUMBER', None)
         if not admin_number:
             return Response({"detail": "WhatsApp number not configured"}, status=500)
-        items = CartItem.objects.filter(user=request.user).select_related('product')
-        if not items:
+        summary = cart_summary(request.user)
+        if not summary['items']:
             return Response({"detail": "Cart is empty"}, status=400)
 
         lines = ["Order Request:"]
-        total = 0.0
-        for it in items:
-            line_total = float(it.product.price) * it.quantity
-            total += line_total
-            amount = int(line_total) if float(line_total).is_integer() else round(line_total, 2)
-            lines.append(f"{it.quantity}x {it.product.name} = ₹{amount}")
-        total_amount = int(total) if float(total).is_integer() else round(total, 2)
-        lines.append(f"Total = ₹{total_amount}")
+        for it in summary['items']:
+            lines.append(f"{it.quantity}x {it.product.name} = ₹{format_amount(it.line_total)}")
+        lines.append(f"Total = ₹{format_amount(summary['total'])}")
         message = quote("\n".join(lines))
         wa_url = f"https://wa.me/{admin_number}?text={message}"
         return Response({"wa_url": wa_url})
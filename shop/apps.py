@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ShopConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'shop'
+
+    def ready(self):
+        # Connects the post_save/post_delete receivers keeping caches, images and the search index current
+        from . import (  # noqa: F401
+            context_processors, dashboard_stats, home_feed, image_manifest, image_variants, page_cache, recommendations,
+            search, uploads, user_counts,
+        )
@@ -0,0 +1,64 @@
+"""
+Versioned cache namespaces.
+
+Cached data is stored under ``shop:<name>:<version>:...`` keys. Invalidating
+swaps in a new random version instead of deleting keys, so every entry of the
+namespace is dropped at once (on any cache backend) and a rebuild that raced
+with the write cannot store outdated data under the new version.
+
+A bump only reaches the processes that share the cache. Unless
+``SHARED_CACHE`` says the backend is shared, the caches invalidated this way
+are bypassed (see ``cache_is_shared``).
+"""
+import uuid
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import cache
+
+
+def cache_is_shared():
+    """True when every process uses the same cache, so invalidations and counters reach them all."""
+    return getattr(settings, 'SHARED_CACHE', False)
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [checks.Warning(
+        'SHARED_CACHE is off, so the home feed, page cache, navigation categories and cart/wishlist '
+        'counts are not cached.',
+        hint='Set REDIS_URL (or configure another shared CACHES backend and set SHARED_CACHE=True).',
+        id='shop.W001',
+    )]
+
+
+def _version_key(name):
+    return f'shop:{name}:version'
+
+
+def cache_version(name):
+    key = _version_key(name)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def versioned_key(name, *parts, version=None):
+    if version is None:
+        version = cache_version(name)
+    return ':'.join(['shop', name, version, *map(str, parts)])
+
+
+def bump_cache_version(name):
+    cache.set(_version_key(name), uuid.uuid4().hex, None)
+
+
+def current_versions(names):
+    """``{name: version}`` for ``names`` in one cache read; namespaces without a version are left out."""
+    keys = {_version_key(name): name for name in names}
+    return {keys[key]: version for key, version in cache.get_many(list(keys)).items()}
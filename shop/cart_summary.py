@@ -0,0 +1,56 @@
+"""
+Cart totals computed by the database in exact Decimal arithmetic.
+
+``cart_lines`` annotates each cart row with ``line_total`` (quantity * price)
+so pages that list the items get totals from the same single query;
+``cart_totals`` returns just the counts and grand total in one aggregate.
+"""
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Sum
+from django.db.models.functions import Coalesce
+
+from .models import CartItem
+
+MONEY = DecimalField(max_digits=14, decimal_places=2)
+ZERO = Decimal('0.00')
+
+
+def line_total_expression():
+    return ExpressionWrapper(F('quantity') * F('product__price'), output_field=MONEY)
+
+
+def cart_lines(user):
+    """The user's cart items with ``product`` loaded and ``line_total`` annotated."""
+    return (
+        CartItem.objects.filter(user=user)
+        .select_related('product__category')
+        .annotate(line_total=line_total_expression())
+    )
+
+
+def cart_totals(user):
+    """``{'line_count', 'item_count', 'total'}`` for the user's cart in one query."""
+    return CartItem.objects.filter(user=user).aggregate(
+        line_count=Count('id'),
+        item_count=Coalesce(Sum('quantity'), 0),
+        total=Coalesce(Sum(line_total_expression()), ZERO, output_field=MONEY),
+    )
+
+
+def cart_summary(user):
+    """Cart lines plus their totals, all from the single ``cart_lines`` query."""
+    items = list(cart_lines(user))
+    return {
+        'items': items,
+        'line_count': len(items),
+        'item_count': sum(item.quantity for item in items),
+        'total': sum((item.line_total for item in items), ZERO),
+    }
+
+
+def format_amount(amount):
+    """Whole rupees without decimals, otherwise two decimal places."""
+    if amount == amount.to_integral_value():
+        return str(int(amount))
+    return str(amount.quantize(Decimal('0.01')))
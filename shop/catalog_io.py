@@ -0,0 +1,187 @@
+"""
+Streaming catalog export and bulk import (CSV or JSON Lines).
+
+Both directions work row by row so memory stays flat however large the
+catalog is. The importer buffers ``chunk_size`` rows, resolves their
+categories and existing products with one query each, then writes the chunk
+with ``bulk_create`` / ``bulk_update`` inside a transaction. Rows are matched
+to existing products by ``slug``; rows without a known slug are created with
+a unique slug allocated in bulk by ``shop.slugs.SlugAllocator``.
+
+``bulk_create`` / ``bulk_update`` skip ``save()`` and its signals, so the
+search index and conditional-GET validators pick the changes up through
+their ``max(updated_at)`` watermarks instead.
+"""
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Category, Product
+from .slugs import SlugAllocator
+
+FIELDS = ['slug', 'name', 'category', 'description', 'price', 'stock', 'is_featured', 'image']
+UPDATE_FIELDS = ['name', 'category', 'description', 'price', 'stock', 'is_featured', 'image', 'updated_at']
+FORMATS = ('csv', 'jsonl')
+TRUE_VALUES = {'1', 'true', 'yes', 'y', 't'}
+
+
+class CatalogRowError(ValueError):
+    pass
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if str(path).endswith(('.jsonl', '.ndjson')) else 'csv'
+
+
+# -------- Export --------
+def export_rows(queryset=None, chunk_size=2000):
+    """Yield one dict per product (``FIELDS`` keys) without loading the table."""
+    if queryset is None:
+        queryset = Product.objects.all()
+    rows = queryset.order_by('id').values_list(
+        'slug', 'name', 'category__name', 'description', 'price', 'stock', 'is_featured', 'image')
+    for row in rows.iterator(chunk_size=chunk_size):
+        yield dict(zip(FIELDS, row))
+
+
+def write_rows(rows, stream, fmt):
+    """Write ``rows`` to the text ``stream``; returns the number written."""
+    count = 0
+    if fmt == 'csv':
+        writer = csv.DictWriter(stream, fieldnames=FIELDS)
+        writer.writeheader()
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+    else:
+        for row in rows:
+            row['price'] = str(row['price'])
+            stream.write(json.dumps(row, ensure_ascii=False))
+            stream.write('\n')
+            count += 1
+    return count
+
+
+# -------- Import --------
+def read_rows(stream, fmt):
+    """Yield ``(line_number, dict)`` pairs from a CSV or JSON Lines stream."""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            if line.strip():
+                try:
+                    yield line_number, json.loads(line)
+                except ValueError as exc:
+                    yield line_number, CatalogRowError(f'invalid JSON: {exc}')
+
+
+def clean_row(row):
+    """Validate and coerce one raw row into model field values."""
+    if isinstance(row, Exception):
+        raise row
+    name = (row.get('name') or '').strip()
+    if not name:
+        raise CatalogRowError('name is required')
+    category = (row.get('category') or '').strip()
+    if not category:
+        raise CatalogRowError('category is required')
+    try:
+        price = Decimal(str(row.get('price'))).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        raise CatalogRowError(f"invalid price {row.get('price')!r}")
+    try:
+        stock = int(row.get('stock') or 0)
+    except (TypeError, ValueError):
+        raise CatalogRowError(f"invalid stock {row.get('stock')!r}")
+    if stock < 0:
+        raise CatalogRowError('stock cannot be negative')
+    featured = row.get('is_featured')
+    if not isinstance(featured, bool):
+        featured = str(featured or '').strip().lower() in TRUE_VALUES
+    return {
+        'slug': (row.get('slug') or '').strip() or None,
+        'name': name,
+        'category': category,
+        'description': row.get('description') or '',
+        'price': price,
+        'stock': stock,
+        'is_featured': featured,
+        'image': row.get('image') or '',
+    }
+
+
+class CatalogImporter:
+    def __init__(self, chunk_size=1000, dry_run=False):
+        self.chunk_size = chunk_size
+        self.dry_run = dry_run
+        self.created = self.updated = 0
+        self.errors = []
+        self.categories = {}
+        for pk, name in Category.objects.order_by('-id').values_list('id', 'name'):
+            self.categories[name] = pk  # the oldest category wins on duplicate names
+        self.category_slugs = SlugAllocator(Category, 'category')
+        self.product_slugs = SlugAllocator(Product, 'product')
+
+    def run(self, rows):
+        chunk = []
+        for line_number, row in rows:
+            try:
+                chunk.append(clean_row(row))
+            except CatalogRowError as exc:
+                self.errors.append((line_number, str(exc)))
+                continue
+            if len(chunk) >= self.chunk_size:
+                self.write_chunk(chunk)
+                chunk = []
+        if chunk:
+            self.write_chunk(chunk)
+        return self
+
+    def resolve_categories(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.categories]
+        if not missing:
+            return
+        new = self.category_slugs.assign(Category(name=name) for name in missing)
+        if not self.dry_run:
+            Category.objects.bulk_create(new)
+        for category in new:
+            self.categories[category.name] = category.pk
+
+    def write_chunk(self, chunk):
+        with transaction.atomic():
+            self.resolve_categories(row['category'] for row in chunk)
+            slugs = [row['slug'] for row in chunk if row['slug']]
+            existing = Product.objects.order_by().in_bulk(slugs, field_name='slug') if slugs else {}
+
+            self.product_slugs.reserve(self.product_slugs.base(row['name']) for row in chunk
+                                       if row['slug'] not in existing)
+            now = timezone.now()
+            to_create, to_update = {}, {}
+            for row in chunk:
+                row['category_id'] = self.categories[row.pop('category')]
+                product = existing.get(row['slug']) or to_create.get(row['slug'])
+                if product is None:
+                    if not row['slug'] or not self.product_slugs.claim(row['slug']):
+                        row['slug'] = self.product_slugs.allocate(row['name'])
+                    to_create[row['slug']] = Product(**row)
+                    continue
+                # A repeated slug means the later row wins
+                for field, value in row.items():
+                    setattr(product, field, value)
+                if product.pk is not None:
+                    product.updated_at = now
+                    to_update[product.pk] = product
+
+            if not self.dry_run:
+                Product.objects.bulk_create(to_create.values())
+                Product.objects.bulk_update(list(to_update.values()), UPDATE_FIELDS)
+            self.created += len(to_create)
+            self.updated += len(to_update)
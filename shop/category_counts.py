@@ -0,0 +1,42 @@
+"""
+Rebuilding the per-category ``product_count`` / ``in_stock_count``.
+
+The Product receivers in ``shop.models`` keep both counts current with
+``F()`` updates. Bulk writes skip those signals, so ``rebuild_category_counts``
+(run after imports and periodically, e.g. from cron) recomputes every
+category in one grouped query and writes only the ones that drifted.
+"""
+from django.db import transaction
+from django.db.models import Count, Q
+
+from .cache_versions import bump_cache_version
+from .context_processors import CATEGORIES_NAMESPACE
+from .home_feed import invalidate_home_feed
+from .models import Category, Product
+
+COUNT_FIELDS = ['product_count', 'in_stock_count']
+
+
+def rebuild_category_counts():
+    """Recompute the counts of every category; returns the categories that changed."""
+    actual = {
+        row.pop('category_id'): row
+        for row in Product.objects.order_by().values('category_id').annotate(
+            product_count=Count('id'),
+            in_stock_count=Count('id', filter=Q(stock__gt=0)),
+        )
+    }
+    empty = dict.fromkeys(COUNT_FIELDS, 0)
+    changed = []
+    for category in Category.objects.only('id', 'name', *COUNT_FIELDS):
+        expected = actual.get(category.pk, empty)
+        if any(getattr(category, field) != expected[field] for field in COUNT_FIELDS):
+            for field in COUNT_FIELDS:
+                setattr(category, field, expected[field])
+            changed.append(category)
+    if changed:
+        Category.objects.bulk_update(changed, COUNT_FIELDS)
+        # bulk_update skips the signals that invalidate the cached copies
+        transaction.on_commit(invalidate_home_feed)
+        transaction.on_commit(lambda: bump_cache_version(CATEGORIES_NAMESPACE))
+    return changed
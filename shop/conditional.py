@@ -0,0 +1,148 @@
+"""
+Conditional GET support (ETag / Last-Modified) for the catalog views.
+
+Validators are derived from ``Product.updated_at`` plus row counts, so a
+request carrying ``If-None-Match`` or ``If-Modified-Since`` is answered with a
+304 after one or two aggregate queries instead of a full query + render.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.db.models import Count, Max, Q
+from django.views.decorators.http import condition
+
+from .filters import ProductFilter, filter_products
+from .models import Category, Product, Review
+from .recommendations import similar_fallback_ids
+from .search import similar_products
+
+
+def queryset_state(queryset, field='updated_at'):
+    """Return ``(max(field), row count)`` for ``queryset`` in a single query."""
+    state = queryset.order_by().aggregate(last_modified=Max(field), count=Count('id'))
+    return state['last_modified'], state['count']
+
+
+def category_state():
+    """Digest of the category table (small) used by nav menus and filters."""
+    rows = Category.objects.order_by('id').values_list('id', 'name', 'slug')
+    return hashlib.md5(repr(list(rows)).encode()).hexdigest()
+
+
+def related_products_scope(product, similar_ids):
+    """Products ``related_products`` picks from, for a ``{'category_id', 'recommended_ids'}`` row."""
+    preferred = [*product['recommended_ids'], *similar_ids]
+    return Product.objects.filter(Q(category_id=product['category_id']) | Q(pk__in=preferred))
+
+
+def conditional_page(compute):
+    """
+    Turn ``compute(request, *args, **kwargs)`` into Django's ``condition``
+    decorator. ``compute`` returns ``(etag_parts, last_modified)``, or ``None``
+    to skip conditional handling; it is evaluated once per request.
+    """
+    attr = f'_validators_{compute.__name__}'
+
+    def validators(request, *args, **kwargs):
+        if not hasattr(request, attr):
+            setattr(request, attr, compute(request, *args, **kwargs))
+        return getattr(request, attr)
+
+    def etag_func(request, *args, **kwargs):
+        result = validators(request, *args, **kwargs)
+        if result is None:
+            return None
+        parts = [request.get_full_path(), request.META.get('HTTP_ACCEPT', '')] + list(result[0])
+        return hashlib.md5('|'.join(str(p) for p in parts).encode()).hexdigest()
+
+    def last_modified_func(request, *args, **kwargs):
+        result = validators(request, *args, **kwargs)
+        return result[1] if result is not None else None
+
+    return condition(etag_func=etag_func, last_modified_func=last_modified_func)
+
+
+def _is_shared_page(request):
+    """HTML pages are only identical across requests for anonymous visitors
+    without pending flash messages."""
+    return not request.user.is_authenticated and not len(get_messages(request))
+
+
+# -------- API validators --------
+def product_list_api_validators(request, *args, **kwargs):
+    # Every match, not just the ranked page: a change to any of them can move the ranking
+    last_modified, count = queryset_state(filter_products(Product.objects.all(), request.GET, ranked=False))
+    return (last_modified, count), last_modified
+
+
+def product_facets_api_validators(request, *args, **kwargs):
+    params = request.GET.copy()
+    params.pop('category', None)
+    last_modified, count = queryset_state(filter_products(Product.objects.all(), params, ranked=False))
+    return (last_modified, count), last_modified
+
+
+def product_detail_api_validators(request, pk, *args, **kwargs):
+    last_modified = Product.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    if last_modified is None:
+        return None
+    return (pk, last_modified), last_modified
+
+
+def related_products_api_validators(request, pk, *args, **kwargs):
+    product = Product.objects.filter(pk=pk).values('category_id', 'recommended_ids').first()
+    if product is None:
+        return None
+    similar_ids = similar_fallback_ids(pk, product['recommended_ids'])
+    last_modified, count = queryset_state(related_products_scope(product, similar_ids).exclude(pk=pk))
+    return (pk, last_modified, count, product['recommended_ids'], similar_ids), last_modified
+
+
+def similar_products_api_validators(request, pk, *args, **kwargs):
+    similar_ids = similar_products(pk)
+    last_modified, count = queryset_state(Product.objects.filter(pk__in=similar_ids))
+    return (pk, last_modified, count, similar_ids), last_modified
+
+
+def featured_products_api_validators(request, *args, **kwargs):
+    # The featured list falls back to the latest products, so any product
+    # change may alter it.
+    last_modified, count = queryset_state(Product.objects.all())
+    return (last_modified, count), last_modified
+
+
+def category_list_api_validators(request, *args, **kwargs):
+    return (category_state(),), None
+
+
+# -------- HTML validators --------
+def product_list_validators(request, *args, **kwargs):
+    if not _is_shared_page(request):
+        return None
+    params = request.GET.copy()
+    params.pop('category', None)
+    # Covers the facet counts, which span every category
+    products = ProductFilter(params, queryset=Product.objects.filter(stock__gt=0), ranked=False).qs
+    last_modified, count = queryset_state(products)
+    return (last_modified, count, category_state()), last_modified
+
+
+def product_detail_validators(request, slug, *args, **kwargs):
+    if not _is_shared_page(request):
+        return None
+    product = Product.objects.filter(slug=slug).values('id', 'category_id', 'recommended_ids').first()
+    if product is None and slug.isdigit():
+        product = Product.objects.filter(id=int(slug)).values('id', 'category_id', 'recommended_ids').first()
+    if product is None:
+        return None
+    similar_ids = similar_fallback_ids(product['id'], product['recommended_ids'])
+    products_modified, products_count = queryset_state(related_products_scope(product, similar_ids))
+    reviews_modified, reviews_count = queryset_state(
+        Review.objects.filter(product_id=product['id']), field='created_at'
+    )
+    last_modified = max(filter(None, [products_modified, reviews_modified]), default=None)
+    return (
+        product['id'], products_modified, products_count, product['recommended_ids'], similar_ids,
+        reviews_modified, reviews_count, category_state(),
+    ), last_modified
+
@@ -1,9 +1,33 @@
-from .models import Category, CartItem, Wishlist
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject, lazy
+
+from .cache_versions import bump_cache_version, cache_is_shared, versioned_key
+from .models import Category, Product
+from .page_cache import CSRF_MARKER, is_priming
+from .user_counts import get_user_counts
+
+CATEGORIES_NAMESPACE = 'nav_categories'
+CATEGORIES_TIMEOUT = 60 * 60
+
+
+def nav_categories():
+    if not cache_is_shared():
+        return list(Category.objects.all()[:10])
+    key = versioned_key(CATEGORIES_NAMESPACE, 'list')
+    categories = cache.get(key)
+    if categories is None:
+        categories = list(Category.objects.all()[:10])
+        cache.set(key, categories, CATEGORIES_TIMEOUT)
+    return categories
+
 
 def categories(request):
-    """Make categories available in all templates"""
+    """Make categories available in all templates (read from the cache only when used)"""
     return {
-        'categories': Category.objects.all()[:10]
+        'categories': SimpleLazyObject(nav_categories)
     }
 
 def cart_wishlist_counts(request):
@@ -14,7 +38,26 @@ def cart_wishlist_counts(request):
     }
     
     if request.user.is_authenticated:
-        context['cart_count'] = CartItem.objects.filter(user=request.user).count()
-        context['wishlist_count'] = Wishlist.objects.filter(user=request.user).count()
+        # Cached per user and only looked up when a template renders a badge
+        counts = SimpleLazyObject(lambda: get_user_counts(request.user))
+        context['cart_count'] = lazy(lambda: counts['cart_count'], int)()
+        context['wishlist_count'] = lazy(lambda: counts['wishlist_count'], int)()
     
     return context
+
+
+def page_cache(request):
+    """While a page is rendered for the page cache, put a marker in place of the CSRF token"""
+    if is_priming(request):
+        return {'csrf_token': CSRF_MARKER}
+    return {}
+
+
+def invalidate_nav_categories():
+    transaction.on_commit(lambda: bump_cache_version(CATEGORIES_NAMESPACE))
+
+
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Product)  # product saves move the category counts
+def nav_categories_changed(sender, **kwargs):
+    invalidate_nav_categories()
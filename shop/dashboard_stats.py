@@ -0,0 +1,181 @@
+"""
+Materialized counts for the admin dashboards.
+
+``views.admin_dashboard`` and ``CustomAdminSite.index`` used to count
+products, low-stock products, customers, staff, superusers and the users
+with something in their cart on every load. The counts now live in the
+single ``DashboardStats`` row, so a load reads one row.
+
+The receivers below adjust the row by the change each write makes, after the
+transaction commits so that busy cart writes do not queue on the row's lock.
+A user counts as having a cart while ``UserProfile.has_cart_items`` is set;
+the flag is flipped with a conditional UPDATE, so deleting several cart
+items at once still changes the count only once.
+
+Bulk writes skip the receivers. ``reconcile_dashboard_stats`` recounts
+everything; it runs from ``manage.py reconcile_dashboard_stats`` and by
+itself when the dashboard is loaded more than ``DASHBOARD_STATS_MAX_AGE``
+seconds after the last reconciliation.
+"""
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Count, Exists, F, OuterRef, Q
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import CartItem, DashboardStats, Product, UserProfile
+
+STATS_PK = 1
+LOW_STOCK_THRESHOLD = 10
+COUNT_FIELDS = [
+    'product_count', 'low_stock_count', 'customer_count', 'staff_count', 'superuser_count', 'cart_user_count',
+]
+
+
+def max_age():
+    return getattr(settings, 'DASHBOARD_STATS_MAX_AGE', 60 * 60 * 24)
+
+
+def is_low_stock(stock):
+    return stock < LOW_STOCK_THRESHOLD
+
+
+def get_dashboard_stats():
+    """The ``DashboardStats`` row, reconciled first when missing or older than ``DASHBOARD_STATS_MAX_AGE``."""
+    stats = DashboardStats.objects.filter(pk=STATS_PK).first()
+    if stats is None or (max_age() and stats.reconciled_at < timezone.now() - timedelta(seconds=max_age())):
+        stats = reconcile_dashboard_stats(stats)[0]
+    return stats
+
+
+def reconcile_dashboard_stats(stats=None):
+    """
+    Recount every statistic and the users' ``has_cart_items`` flags into
+    ``stats`` (the stored row, loaded when not given). Returns ``(stats,
+    {field: (stored, actual)})`` for the counts that had drifted.
+    """
+    has_cart_items = Exists(CartItem.objects.filter(user_id=OuterRef('user_id')))
+    UserProfile.objects.exclude(has_cart_items=has_cart_items).update(has_cart_items=has_cart_items)
+    actual = {
+        **Product.objects.aggregate(
+            product_count=Count('id'),
+            low_stock_count=Count('id', filter=Q(stock__lt=LOW_STOCK_THRESHOLD)),
+        ),
+        **User.objects.aggregate(
+            customer_count=Count('id', filter=Q(is_staff=False)),
+            staff_count=Count('id', filter=Q(is_staff=True)),
+            superuser_count=Count('id', filter=Q(is_superuser=True)),
+        ),
+        'cart_user_count': CartItem.objects.values('user').distinct().count(),
+    }
+    if stats is None:
+        stats = DashboardStats.objects.filter(pk=STATS_PK).first()
+    stats = stats or DashboardStats(pk=STATS_PK)
+    drifted = {
+        field: (getattr(stats, field), actual[field])
+        for field in COUNT_FIELDS if not stats._state.adding and getattr(stats, field) != actual[field]
+    }
+    for field, value in actual.items():
+        setattr(stats, field, value)
+    stats.updated_at = stats.reconciled_at = timezone.now()
+    stats.save(force_insert=stats._state.adding)
+    return stats, drifted
+
+
+# -------- Incremental updates --------
+def adjust_stats(**deltas):
+    """Add ``deltas`` (field: change) to the stored counts once the transaction commits."""
+    deltas = {field: delta for field, delta in deltas.items() if delta}
+    if deltas:
+        transaction.on_commit(partial(_apply_deltas, deltas))
+
+
+def _apply_deltas(deltas):
+    DashboardStats.objects.filter(pk=STATS_PK).update(
+        updated_at=timezone.now(),
+        # Drift from writes that skipped the receivers must not push a count below zero
+        **{field: Greatest(F(field) + delta, 0) for field, delta in deltas.items()},
+    )
+
+
+def role_counts(is_staff, is_superuser):
+    return {'customer_count': int(not is_staff), 'staff_count': int(is_staff), 'superuser_count': int(is_superuser)}
+
+
+def count_cart_user(user_id):
+    """Count ``user_id`` among the users with a cart, unless already counted."""
+    if UserProfile.objects.filter(user_id=user_id, has_cart_items=False).update(has_cart_items=True):
+        adjust_stats(cart_user_count=1)
+
+
+def uncount_cart_user(user_id):
+    """Stop counting ``user_id`` among the users with a cart once the cart is empty."""
+    emptied = UserProfile.objects.filter(user_id=user_id, has_cart_items=True).filter(
+        ~Exists(CartItem.objects.filter(user_id=OuterRef('user_id')))
+    )
+    if emptied.update(has_cart_items=False):
+        adjust_stats(cart_user_count=-1)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    low_stock = is_low_stock(instance.stock)
+    if created:
+        adjust_stats(product_count=1, low_stock_count=int(low_stock))
+    elif getattr(instance, '_loaded_stock', None) is not None:
+        adjust_stats(low_stock_count=int(low_stock) - int(is_low_stock(instance._loaded_stock)))
+    instance._loaded_stock = instance.stock
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    stock = getattr(instance, '_loaded_stock', instance.stock)
+    adjust_stats(product_count=-1, low_stock_count=-int(is_low_stock(stock)))
+
+
+@receiver(pre_save, sender=User)
+def user_saving(sender, instance, update_fields=None, **kwargs):
+    # Logins save only last_login; only role changes move users between counts
+    if instance.pk is None or (update_fields is not None and not {'is_staff', 'is_superuser'} & set(update_fields)):
+        return
+    instance._stored_roles = sender.objects.filter(pk=instance.pk).values_list('is_staff', 'is_superuser').first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    stored, instance._stored_roles = getattr(instance, '_stored_roles', None), None
+    current = role_counts(instance.is_staff, instance.is_superuser)
+    if created:
+        adjust_stats(**current)
+    elif stored is not None:
+        previous = role_counts(*stored)
+        adjust_stats(**{field: current[field] - previous[field] for field in current})
+
+
+@receiver(pre_delete, sender=User)
+def user_deleting(sender, instance, **kwargs):
+    # Counted out before the cascade, which may delete the profile before the cart items
+    if UserProfile.objects.filter(user_id=instance.pk, has_cart_items=True).update(has_cart_items=False):
+        adjust_stats(cart_user_count=-1)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    adjust_stats(**{field: -count for field, count in role_counts(instance.is_staff, instance.is_superuser).items()})
+
+
+@receiver(post_save, sender=CartItem)
+def cart_item_added(sender, instance, created, **kwargs):
+    if created:
+        count_cart_user(instance.user_id)
+
+
+@receiver(post_delete, sender=CartItem)
+def cart_item_removed(sender, instance, **kwargs):
+    uncount_cart_user(instance.user_id)
@@ -0,0 +1,67 @@
+"""
+Faceted counts for the product catalog.
+
+Category counts and the price histogram for a filter set come from one
+grouped query: rows are grouped by category and each price bucket is a
+conditional ``COUNT``. Category counts ignore the category filter itself so
+shoppers can see how many results every other category would give; the
+price histogram honours it.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+from django.db.models import Count, Q
+
+
+def price_buckets():
+    """``[(min, max), ...]`` ranges built from ``PRODUCT_PRICE_BUCKETS``; the last is open-ended."""
+    bounds = [Decimal(str(b)) for b in getattr(settings, 'PRODUCT_PRICE_BUCKETS', [0, 500, 1000, 5000, 10000])]
+    return list(zip(bounds, bounds[1:] + [None]))
+
+
+def product_facets(queryset, category=None):
+    """
+    Return ``{'total', 'categories', 'price_ranges'}`` for ``queryset``, which
+    should carry every active filter except the category one; ``category`` is
+    that filter's value (an id), if any.
+    """
+    buckets = price_buckets()
+    aggregates = {'count': Count('id')}
+    for i, (low, high) in enumerate(buckets):
+        condition = Q(price__gte=low)
+        if high is not None:
+            condition &= Q(price__lt=high)
+        aggregates[f'bucket_{i}'] = Count('id', filter=condition)
+
+    rows = (
+        queryset.order_by()
+        .values('category_id', 'category__name', 'category__slug')
+        .annotate(**aggregates)
+        .order_by('category__name')
+    )
+
+    selected = str(category) if category not in (None, '') else None
+    bucket_counts = [0] * len(buckets)
+    categories = []
+    total = 0
+    for row in rows:
+        categories.append({
+            'id': row['category_id'],
+            'name': row['category__name'],
+            'slug': row['category__slug'],
+            'count': row['count'],
+            'selected': str(row['category_id']) == selected,
+        })
+        if selected is None or str(row['category_id']) == selected:
+            total += row['count']
+            for i in range(len(buckets)):
+                bucket_counts[i] += row[f'bucket_{i}']
+
+    return {
+        'total': total,
+        'categories': categories,
+        'price_ranges': [
+            {'min': low, 'max': high, 'count': count}
+            for (low, high), count in zip(buckets, bucket_counts)
+        ],
+    }
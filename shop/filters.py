@@ -1,8 +1,9 @@
 import django_filters
 from .models import Product, Category
+from .search import search_queryset
 
 class ProductFilter(django_filters.FilterSet):
-    name = django_filters.CharFilter(lookup_expr='icontains', label='Search')
+    name = django_filters.CharFilter(method='filter_search', label='Search')
     category = django_filters.ModelChoiceFilter(
         queryset=Category.objects.all(),
         empty_label='All Categories',
@@ -24,3 +25,43 @@ class ProductFilter(django_filters.FilterSet):
     class Meta:
         model = Product
         fields = ['category', 'name', 'price_min', 'price_max']
+
+    def __init__(self, *args, ranked=True, **kwargs):
+        # Facet counts pass ranked=False: they count every match, not the ranked page
+        self.ranked = ranked
+        super().__init__(*args, **kwargs)
+
+    def filter_queryset(self, queryset):
+        # Search runs last so it ranks only the products the other filters kept
+        for name, value in self.form.cleaned_data.items():
+            if name != 'name':
+                queryset = self.filters[name].filter(queryset, value)
+        return self.filters['name'].filter(queryset, self.form.cleaned_data.get('name'))
+
+    def filter_search(self, queryset, name, value):
+        return search_queryset(queryset, value, ranked=self.ranked)
+
+
+def filter_products(queryset, params, ranked=True):
+    """
+    Apply the product API query parameters to ``queryset``. ``ranked=False``
+    keeps every search match unordered, for the facet counts.
+    """
+    category = params.get('category')
+    price_min = params.get('price_min')
+    price_max = params.get('price_max')
+    name = params.get('name')
+    featured = params.get('featured')
+
+    if category:
+        queryset = queryset.filter(category_id=category)
+    if price_min:
+        queryset = queryset.filter(price__gte=price_min)
+    if price_max:
+        queryset = queryset.filter(price__lte=price_max)
+    if featured and featured.lower() in ['true', '1', 'yes']:
+        queryset = queryset.filter(is_featured=True)
+    if name:
+        # Applied last: ranks within the other filters and orders by search rank
+        queryset = search_queryset(queryset, name, ranked=ranked)
+    return queryset
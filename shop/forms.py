@@ -1,7 +1,10 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import UploadedFile
+from django.core.validators import validate_image_file_extension
 from .models import Review, CartItem, UserProfile, Product, Category, ProductImage
+from .uploads import stage_upload
 
 class SignUpForm(UserCreationForm):
     email = forms.EmailField(required=True, widget=forms.EmailInput(attrs={'class': 'form-control'}))
@@ -95,7 +98,43 @@ class CategoryForm(forms.ModelForm):
             raise forms.ValidationError("Category name is required.")
         return name.strip()
 
-class ProductForm(forms.ModelForm):
+class StagedImageMixin:
+    """
+    Accepts the ``image`` upload without decoding or storing it in the request:
+    only the extension is checked, and on save the file is staged for
+    ``shop.uploads`` to validate, clean and store in the background.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['image'] = forms.FileField(
+            required=self.fields['image'].required and not self.instance.pending_image,
+            widget=self.fields['image'].widget,
+            validators=[validate_image_file_extension],
+        )
+        self.staged_upload = None
+
+    def _get_validation_exclusions(self):
+        exclude = super()._get_validation_exclusions()
+        if self.instance.pending_image:
+            # The image arrives once the pending upload is processed
+            exclude.add('image')
+        return exclude
+
+    def _post_clean(self):
+        stored_image = self.instance.image.name
+        super()._post_clean()
+        upload = self.cleaned_data.get('image')
+        if isinstance(upload, UploadedFile):
+            # Keep the stored image until the upload has been processed
+            self.staged_upload = upload
+            self.instance.image = stored_image
+
+    def stage_image(self):
+        if self.staged_upload is not None:
+            self.instance.pending_image = stage_upload(self.staged_upload)
+            self.staged_upload = None
+
+class ProductForm(StagedImageMixin, forms.ModelForm):
     # Add option to create new category
     new_category = forms.CharField(
         max_length=100, 
@@ -178,10 +217,11 @@ class ProductForm(forms.ModelForm):
             instance.category = category
         
         if commit:
+            self.stage_image()
             instance.save()
         return instance
 
-class ProductImageForm(forms.ModelForm):
+class ProductImageForm(StagedImageMixin, forms.ModelForm):
     class Meta:
         model = ProductImage
         fields = ['image', 'alt_text', 'order']
@@ -200,6 +240,11 @@ class ProductImageForm(forms.ModelForm):
                 'value': '0'
             })
         }
+    
+    def save(self, commit=True):
+        if commit:
+            self.stage_image()
+        return super().save(commit)
 
 # Formset for multiple images
 ProductImageFormSet = forms.inlineformset_factory(
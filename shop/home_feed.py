@@ -0,0 +1,104 @@
+"""
+Cached home feed shared by ``views.home`` and ``FeaturedProductsAPI``.
+
+The feed (featured and latest in-stock products, the top categories with
+their product counts, and the rows behind the featured API) is identical for
+every visitor, so it is built once and kept in the cache until a Product,
+Category or ProductImage write invalidates it.
+
+Invalidation swaps in a new feed version (``shop.cache_versions``), so a
+rebuild that raced with the write can never store outdated data under the
+current version. Only the request holding the rebuild lock (``cache.add``)
+queries the database; concurrent requests are served the previous feed, or
+wait briefly for the first build when there is none yet. Without a shared
+cache (``SHARED_CACHE``) the feed is built on every request.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_versions import bump_cache_version, cache_is_shared, cache_version, versioned_key
+from .models import Category, Product, ProductImage
+
+NAMESPACE = 'home_feed'
+STALE_KEY = 'shop:home_feed:stale'
+
+FEED_SIZE = 8
+CATEGORY_COUNT = 6
+# How long a rebuild may hold the lock, and how long others wait for a first build
+LOCK_TIMEOUT = 30
+WAIT_STEP = 0.05
+WAIT_STEPS = 40
+
+
+def feed_timeout():
+    # Safety net for writes that bypass signals (queryset.update, bulk_create)
+    return getattr(settings, 'HOME_FEED_TIMEOUT', 300)
+
+
+def build_home_feed():
+    from .serializers import ProductRowSerializer
+
+    products = Product.objects.select_related('category')
+    in_stock = products.filter(stock__gt=0)
+
+    featured_rows = Product.objects.filter(is_featured=True).order_by('-created_at')
+    featured_rows = list(featured_rows.values(*ProductRowSerializer.values_fields)[:FEED_SIZE])
+    if not featured_rows:
+        # Fall back to the latest products when nothing is featured
+        latest_rows = Product.objects.order_by('-created_at')
+        featured_rows = list(latest_rows.values(*ProductRowSerializer.values_fields)[:FEED_SIZE])
+
+    return {
+        'featured_products': list(in_stock.filter(is_featured=True)[:FEED_SIZE]),
+        'latest_products': list(in_stock[:FEED_SIZE]),
+        'categories': list(Category.objects.all()[:CATEGORY_COUNT]),
+        'featured_rows': featured_rows,
+    }
+
+
+def get_home_feed():
+    if not cache_is_shared():
+        return build_home_feed()
+    version = cache_version(NAMESPACE)
+    key = versioned_key(NAMESPACE, 'feed', version=version)
+    feed = cache.get(key)
+    if feed is not None:
+        return feed
+
+    lock = versioned_key(NAMESPACE, 'lock', version=version)
+    if cache.add(lock, True, LOCK_TIMEOUT):
+        try:
+            feed = build_home_feed()
+            cache.set(key, feed, feed_timeout())
+            cache.set(STALE_KEY, feed, None)
+        finally:
+            cache.delete(lock)
+        return feed
+
+    # Another request is rebuilding this version: serve the previous feed
+    feed = cache.get(STALE_KEY)
+    if feed is not None:
+        return feed
+    for _ in range(WAIT_STEPS):
+        time.sleep(WAIT_STEP)
+        feed = cache.get(key)
+        if feed is not None:
+            return feed
+    return build_home_feed()
+
+
+def invalidate_home_feed():
+    bump_cache_version(NAMESPACE)
+
+
+# -------- Invalidation --------
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductImage)
+def home_feed_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_home_feed)
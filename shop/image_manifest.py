@@ -0,0 +1,121 @@
+"""
+Denormalised list of each product's images.
+
+Every product card, the wishlist, the detail gallery and the API used to
+query ``additional_images`` (or prefetch it) just to show a picture. The
+images rarely change, so ``Product.image_manifest`` keeps them on the row::
+
+    [{'image': 'content/9f/9f86...png', 'image_variants': {...},
+      'pending_image': '', 'alt_text': '', 'order': -1, 'is_main': True},
+     {'image': 'content/1b/1b4f...jpg', ...,  'order': 0, 'is_main': False}]
+
+The main image comes first (``order`` -1), followed by the additional images
+in gallery order. Entries hold storage names rather than URLs so a change of
+``MEDIA_URL`` needs no rebuild; ``Product.gallery`` wraps them for templates.
+
+The receivers below rebuild the manifest when an image row is saved or
+deleted, or when a product save changes its main image (``Product.save``
+never writes the manifest back). Code that changes image fields with
+``QuerySet.update()`` (uploads, variants, ``rehash_media``) calls
+``rebuild_image_manifest`` itself, and ``manage.py rebuild_image_manifests``
+rebuilds every product.
+"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Product, ProductImage
+
+ENTRY_FIELDS = ('image', 'image_variants', 'pending_image')
+
+
+def manifest_entry(row, alt_text='', order=-1, is_main=True):
+    variants = row['image_variants'] or {}
+    return {
+        'image': row['image'] or '',
+        # Metadata left over from an earlier image is dropped rather than copied
+        'image_variants': variants if row['image'] and variants.get('source') == row['image'] else {},
+        'pending_image': row['pending_image'],
+        'alt_text': alt_text,
+        'order': order,
+        'is_main': is_main,
+    }
+
+
+def build_image_manifest(product, images):
+    """
+    The manifest for ``product`` (a dict of ``ENTRY_FIELDS``) and ``images``,
+    its ProductImage rows as dicts of ``ENTRY_FIELDS`` plus ``alt_text`` and
+    ``order``, already in gallery order.
+    """
+    manifest = []
+    if product['image'] or product['pending_image']:
+        manifest.append(manifest_entry(product))
+    for image in images:
+        if image['image'] or image['pending_image']:
+            manifest.append(manifest_entry(image, image['alt_text'], image['order'], is_main=False))
+    return manifest
+
+
+def image_rows(product_ids):
+    """ProductImage rows of ``product_ids`` in gallery order, grouped by product id."""
+    grouped = {}
+    rows = ProductImage.objects.filter(product_id__in=product_ids).order_by('order', 'created_at')
+    for row in rows.values('product_id', 'alt_text', 'order', *ENTRY_FIELDS):
+        grouped.setdefault(row['product_id'], []).append(row)
+    return grouped
+
+
+def rebuild_image_manifest(product_id):
+    """Rebuild and save the manifest of one product; returns it (None if the product is gone)."""
+    product = Product.objects.filter(pk=product_id).values(*ENTRY_FIELDS).first()
+    if product is None:
+        return None
+    manifest = build_image_manifest(product, image_rows([product_id]).get(product_id, []))
+    Product.objects.filter(pk=product_id).update(image_manifest=manifest)
+    return manifest
+
+
+def rebuild_image_manifests(batch_size=500):
+    """Rebuild every product's manifest; returns the number of products changed."""
+    changed = 0
+    product_ids = list(Product.objects.order_by('pk').values_list('pk', flat=True))
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        images = image_rows(batch)
+        products = Product.objects.filter(pk__in=batch).only('pk', 'image_manifest', *ENTRY_FIELDS)
+        stale = []
+        for product in products:
+            row = {field: getattr(product, field) for field in ENTRY_FIELDS}
+            row['image'] = product.image.name
+            manifest = build_image_manifest(row, images.get(product.pk, []))
+            if manifest != product.image_manifest:
+                product.image_manifest = manifest
+                stale.append(product)
+        Product.objects.bulk_update(stale, ['image_manifest'])
+        changed += len(stale)
+    return changed
+
+
+# -------- Triggers --------
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    if created:
+        # A new product has no additional images yet, so no query is needed
+        row = {field: getattr(instance, field) for field in ENTRY_FIELDS}
+        row['image'] = instance.image.name
+        manifest = build_image_manifest(row, [])
+        if manifest != instance.image_manifest:
+            sender.objects.filter(pk=instance.pk).update(image_manifest=manifest)
+    elif getattr(instance, '_loaded_images', None) != instance.main_image_fields():
+        manifest = rebuild_image_manifest(instance.pk)
+    else:
+        # The stored manifest is current: save() leaves it alone
+        return
+    instance.image_manifest = manifest
+    instance._loaded_images = instance.main_image_fields()
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def product_image_changed(sender, instance, **kwargs):
+    rebuild_image_manifest(instance.product_id)
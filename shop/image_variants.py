@@ -0,0 +1,216 @@
+"""
+Resized copies of product images.
+
+Uploads are multi-megabyte screenshots, while list cards, gallery thumbnails
+and the admin only need a few hundred pixels. After a Product or ProductImage
+image changes, the original is rendered at each width in
+``IMAGE_VARIANT_WIDTHS`` as WebP plus a copy in the upload's own format (JPEG
+or PNG). The files are saved through the image storage (content-addressed,
+see ``shop.storage``) and described in the row's ``image_variants`` field::
+
+    {'source': 'content/9f/9f86...png', 'width': 2560, 'height': 1440,
+     'variants': [{'name': 'content/1b/1b4f...webp', 'width': 320,
+                   'height': 180, 'format': 'webp'}, ...]}
+
+Rendering is CPU bound, so it runs in a process pool (``IMAGE_VARIANT_WORKERS``
+processes; 0 renders inline). Workers only see and return bytes, which keeps
+them free of Django state; the parent writes the files through the storage
+and records the metadata. Until that happens, ``ImageVariantsMixin`` falls
+back to the original upload. Variant files are never deleted here, since
+identical images share them; ``manage.py gc_media`` removes unreferenced ones.
+"""
+import io
+import logging
+import posixpath
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .home_feed import invalidate_home_feed
+from .image_manifest import rebuild_image_manifest
+from .models import Product, ProductImage
+from .page_cache import invalidate_product_pages
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'variants'
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg', 'png': 'png'}
+
+_executor = None
+
+
+def variant_widths():
+    return sorted(getattr(settings, 'IMAGE_VARIANT_WIDTHS', [320, 640, 1280]))
+
+
+def variant_quality():
+    return getattr(settings, 'IMAGE_VARIANT_QUALITY', 80)
+
+
+def worker_count():
+    return getattr(settings, 'IMAGE_VARIANT_WORKERS', 2)
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=worker_count())
+    return _executor
+
+
+# -------- Rendering (runs in the worker processes) --------
+def render_variants(data, widths, quality):
+    """
+    Render ``data`` (an encoded image) at each width narrower than the
+    original, or once at its own width when it is already small.
+
+    Returns ``{'width', 'height', 'variants': [{'width', 'height', 'format',
+    'extension', 'content'}]}`` with ``content`` holding the encoded bytes.
+    """
+    with Image.open(io.BytesIO(data)) as source:
+        # Photos stay JPEG; screenshots, logos and anything else fall back to PNG
+        fallback = 'jpeg' if source.format == 'JPEG' else 'png'
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            has_alpha = 'A' in image.getbands() or 'transparency' in image.info
+            image = image.convert('RGBA' if has_alpha else 'RGB')
+        width, height = image.size
+
+    options = {
+        'webp': {'quality': quality, 'method': 4},
+        'jpeg': {'quality': quality, 'optimize': True, 'progressive': True},
+        'png': {'optimize': True},
+    }
+    variants = []
+    for target in [target for target in widths if target < width] or [width]:
+        size = (target, max(1, round(height * target / width)))
+        resized = image.resize(size, Image.Resampling.LANCZOS) if target != width else image
+        for image_format in ('webp', fallback):
+            frame = resized.convert('RGB') if image_format == 'jpeg' else resized
+            buffer = io.BytesIO()
+            frame.save(buffer, format=image_format.upper(), **options[image_format])
+            if image_format != 'webp' and buffer.tell() >= len(data):
+                # Not worth a copy; browsers without WebP get the original
+                continue
+            variants.append({
+                'width': size[0],
+                'height': size[1],
+                'format': image_format,
+                'extension': EXTENSIONS[image_format],
+                'content': buffer.getvalue(),
+            })
+    return {'width': width, 'height': height, 'variants': variants}
+
+
+# -------- Storing (runs in the web/command process) --------
+def variant_name(source_name, width, extension):
+    stem = posixpath.splitext(source_name)[0]
+    return posixpath.join(VARIANT_DIR, f'{stem}-{width}w.{extension}')
+
+
+def read_source(model, source_name):
+    storage = model._meta.get_field('image').storage
+    with storage.open(source_name, 'rb') as source:
+        return source.read()
+
+
+def store_variants(model, pk, source_name, rendered):
+    """
+    Write ``rendered`` (from ``render_variants``) and record it on row ``pk``,
+    unless the row's image changed while the variants were being rendered.
+    Returns True when the metadata was saved.
+    """
+    storage = model._meta.get_field('image').storage
+    variants = []
+    for variant in rendered['variants']:
+        name = variant_name(source_name, variant['width'], variant['extension'])
+        variants.append({
+            'name': storage.save(name, ContentFile(variant['content'])),
+            'width': variant['width'],
+            'height': variant['height'],
+            'format': variant['format'],
+        })
+    metadata = {
+        'source': source_name,
+        'width': rendered['width'],
+        'height': rendered['height'],
+        'variants': variants,
+    }
+
+    current = model.objects.filter(pk=pk, image=source_name)
+    with transaction.atomic():
+        updated = current.update(image_variants=metadata)
+        if updated:
+            # Payloads and the cached home feed now carry the variant URLs
+            product_id = pk if model is Product else current.values_list('product_id', flat=True).first()
+            Product.objects.filter(pk=product_id).update(updated_at=timezone.now())
+            rebuild_image_manifest(product_id)
+            invalidate_product_pages(product_id)
+            transaction.on_commit(invalidate_home_feed)
+    return bool(updated)
+
+
+def generate_variants(model, pk, source_name):
+    """Render and store the variants of one row in this process."""
+    rendered = render_variants(read_source(model, source_name), variant_widths(), variant_quality())
+    return store_variants(model, pk, source_name, rendered)
+
+
+def _store_rendered(model, pk, source_name, future):
+    # Runs on the pool's result thread, which keeps its own DB connection
+    close_old_connections()
+    try:
+        store_variants(model, pk, source_name, future.result())
+    except Exception:
+        logger.exception('Could not create image variants for %s %s (%s)', model.__name__, pk, source_name)
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(model, pk, source_name):
+    """Render the variants of one row in the process pool (inline without workers)."""
+    if worker_count() == 0:
+        try:
+            generate_variants(model, pk, source_name)
+        except Exception:
+            logger.exception('Could not create image variants for %s %s (%s)', model.__name__, pk, source_name)
+        return
+    try:
+        data = read_source(model, source_name)
+    except OSError:
+        logger.exception('Could not read %s for image variants', source_name)
+        return
+    future = get_executor().submit(render_variants, data, variant_widths(), variant_quality())
+    future.add_done_callback(partial(_store_rendered, model, pk, source_name))
+
+
+def needs_variants(instance):
+    return bool(instance.image) and instance.image_variants.get('source') != instance.image.name
+
+
+def pending_variants(force=False):
+    """``(model, pk, image name)`` of every image without current variants (all images with ``force``)."""
+    for model in (Product, ProductImage):
+        rows = model.objects.exclude(image='').order_by('pk').values_list('pk', 'image', 'image_variants')
+        for pk, name, variants in rows.iterator(chunk_size=2000):
+            if force or (variants or {}).get('source') != name:
+                yield model, pk, name
+
+
+# -------- Triggers --------
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def image_saved(sender, instance, **kwargs):
+    if needs_variants(instance):
+        transaction.on_commit(partial(schedule_variants, sender, instance.pk, instance.image.name))
+    elif not instance.image and instance.image_variants:
+        # Image cleared: forget the copies of the previous one
+        sender.objects.filter(pk=instance.pk).update(image_variants={})
+        instance.image_variants = {}
@@ -0,0 +1,70 @@
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from shop.models import Category, Product
+from shop.serializers import ProductRowSerializer, ProductSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compare ProductSerializer with the ProductRowSerializer fast path on synthetic catalogs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, nargs='+', default=[1000, 10000, 100000],
+                            help='Catalog sizes to benchmark (default: 1000 10000 100000)')
+        parser.add_argument('--query', default='', help='Query string for the simulated request, e.g. "compact=1"')
+
+    def handle(self, *args, **options):
+        request = Request(RequestFactory().get(f"/api/products/?{options['query']}", HTTP_HOST='localhost'))
+        context = {'request': request}
+        renderer = JSONRenderer()
+
+        identical = True
+        self.stdout.write(f"{'rows':>8} {'ProductSerializer':>18} {'fast path':>10} {'speedup':>8}")
+        for rows in options['rows']:
+            with transaction.atomic():
+                product_ids = self.create_catalog(rows)
+                products = Product.objects.filter(id__in=product_ids) if len(product_ids) < 1000 else \
+                    Product.objects.filter(id__gte=min(product_ids), id__lte=max(product_ids))
+                products = products.order_by('id')
+
+                started = time.perf_counter()
+                slow = ProductSerializer(products.select_related('category'), many=True, context=context).data
+                slow_bytes = renderer.render(slow)
+                slow_time = time.perf_counter() - started
+
+                started = time.perf_counter()
+                fast = ProductRowSerializer(context).serialize(products.values(*ProductRowSerializer.values_fields))
+                fast_bytes = renderer.render(fast)
+                fast_time = time.perf_counter() - started
+
+                transaction.set_rollback(True)
+
+            if fast_bytes != slow_bytes:
+                self.stdout.write(self.style.ERROR(f'{rows}: fast path output differs from ProductSerializer'))
+                identical = False
+                continue
+            self.stdout.write(f'{rows:>8} {slow_time:>17.3f}s {fast_time:>9.3f}s {slow_time / fast_time:>7.1f}x')
+
+        if identical:
+            self.stdout.write(self.style.SUCCESS('Outputs were byte-identical for every size'))
+
+    def create_catalog(self, rows):
+        category = Category.objects.create(name='Benchmark')
+        Product.objects.bulk_create(
+            (Product(
+                category=category,
+                name=f'Benchmark product {i}',
+                description=f'Synthetic product {i} used to benchmark catalog serialization.',
+                price=Decimal(i % 5000) + Decimal('0.99'),
+                stock=i % 50,
+                image=f'products/benchmark_{i}.png' if i % 2 else '',
+            ) for i in range(rows)),
+            batch_size=2000,
+        )
+        return list(Product.objects.filter(category=category).values_list('id', flat=True))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from shop.recommendations import refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = ('Recompute the related products of products whose wishlist/cart baskets changed '
+            '(schedule periodically, e.g. every few minutes, and with --full nightly)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every product, not only the stale ones')
+
+    def handle(self, *args, **options):
+        recomputed, changed = refresh_recommendations(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(f'Recommendations recomputed for {recomputed} products ({changed} changed)'))
@@ -0,0 +1,36 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.catalog_io import FORMATS, detect_format, export_rows, write_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream the product catalog to a CSV or JSON Lines file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Output file, or "-" for stdout')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Output format (default: from the file extension, else csv)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='Rows fetched from the database per round trip (default: 2000)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        rows = export_rows(chunk_size=options['chunk_size'])
+
+        started = time.monotonic()
+        if path == '-':
+            count = write_rows(rows, sys.stdout, fmt)
+            report = self.stderr
+        else:
+            with open(path, 'w', encoding='utf-8', newline='') as fh:
+                count = write_rows(rows, fh, fmt)
+            report = self.stdout
+        elapsed = time.monotonic() - started
+
+        rate = count / elapsed if elapsed else 0
+        report.write(self.style.SUCCESS(
+            f'Exported {count} products in {elapsed:.2f}s ({rate:,.0f} rows/sec)'))
@@ -1,30 +1,34 @@
 from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
 from shop.models import Product, Category
+from shop.slugs import bulk_assign_slugs
 
 class Command(BaseCommand):
     help = 'Generate slugs for products and categories that don\'t have them'
 
     def handle(self, *args, **options):
-        # Fix product slugs
-        products_without_slugs = Product.objects.filter(slug__isnull=True)
-        products_count = products_without_slugs.count()
+        # Fix product slugs (allocated in bulk, a few queries per 500 products)
+        products_without_slugs = list(Product.objects.filter(Q(slug__isnull=True) | Q(slug='None')).only('id', 'name', 'slug').order_by('id'))
+        products_count = len(products_without_slugs)
         
         if products_count > 0:
             self.stdout.write(f'Found {products_count} products without slugs')
+            now = timezone.now()
             for product in products_without_slugs:
-                product.save()  # This will trigger the slug generation in the save method
+                product.updated_at = now
+            bulk_assign_slugs(Product, products_without_slugs, 'product', update_fields=('slug', 'updated_at'))
             self.stdout.write(self.style.SUCCESS(f'Generated slugs for {products_count} products'))
         else:
             self.stdout.write('All products already have slugs')
         
         # Fix category slugs
-        categories_without_slugs = Category.objects.filter(slug__isnull=True)
-        categories_count = categories_without_slugs.count()
+        categories_without_slugs = list(Category.objects.filter(slug__isnull=True).only('id', 'name', 'slug').order_by('id'))
+        categories_count = len(categories_without_slugs)
         
         if categories_count > 0:
             self.stdout.write(f'Found {categories_count} categories without slugs')
-            for category in categories_without_slugs:
-                category.save()  # This will trigger the slug generation in the save method
+            bulk_assign_slugs(Category, categories_without_slugs, 'category')
             self.stdout.write(self.style.SUCCESS(f'Generated slugs for {categories_count} categories'))
         else:
             self.stdout.write('All categories already have slugs')
@@ -0,0 +1,47 @@
+import os
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.media_files import delete_files, find_orphans
+
+MAX_REPORTED_FILES = 20
+
+
+class Command(BaseCommand):
+    help = ('Delete media files that no product or product image references any more '
+            '(replaced uploads, variants of deleted images, duplicates merged by content hashing)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='List orphaned files without deleting them')
+        parser.add_argument('--grace-hours', type=float, default=24,
+                            help='Keep files modified more recently than this (default: 24), '
+                                 'so uploads still being processed are never collected')
+        parser.add_argument('--workers', type=int, default=min(32, (os.cpu_count() or 1) * 4),
+                            help='Threads scanning and deleting in parallel (default: 4 per CPU, at most 32)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        orphans = find_orphans(settings.MEDIA_ROOT, options['workers'], options['grace_hours'] * 3600)
+        total_size = sum(size for _, size in orphans)
+        for name, size in orphans[:MAX_REPORTED_FILES]:
+            self.stdout.write(f'{name} ({size:,} bytes)')
+        if len(orphans) > MAX_REPORTED_FILES:
+            self.stdout.write(f'... and {len(orphans) - MAX_REPORTED_FILES} more')
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(
+                f'Dry run: {len(orphans)} orphaned files ({total_size / 1024 / 1024:.1f} MB) would be deleted'))
+            return
+        deleted, kept, failed = delete_files(
+            default_storage, [name for name, _ in orphans], options['workers'], options['grace_hours'] * 3600)
+        for name in failed[:MAX_REPORTED_FILES]:
+            self.stderr.write(f'Could not delete {name}')
+        sizes = dict(orphans)
+        deleted_size = sum(sizes[name] for name in deleted)
+        style = self.style.WARNING if failed else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Deleted {len(deleted)} orphaned files ({deleted_size / 1024 / 1024:.1f} MB), '
+            f'{len(kept)} referenced again since the scan, {len(failed)} failed'))
@@ -0,0 +1,66 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.image_variants import (
+    pending_variants, read_source, render_variants, store_variants, variant_quality, variant_widths,
+)
+
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = ('Create the resized thumbnail and WebP copies of product images that do not have '
+            'them yet, e.g. media uploaded before the variants existed or imported in bulk')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Re-render every image, e.g. after changing IMAGE_VARIANT_WIDTHS')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Worker processes rendering images (default: one per CPU)')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1')
+        widths, quality = variant_widths(), variant_quality()
+        # Bound the encoded images held in memory at once
+        window = options['workers'] * 2
+        done, errors = 0, []
+
+        started = time.monotonic()
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            running = {}
+            pending = pending_variants(force=options['force'])
+            while True:
+                for model, pk, name in pending:
+                    try:
+                        data = read_source(model, name)
+                    except OSError as exc:
+                        errors.append(f'{model.__name__} {pk}: {exc}')
+                        continue
+                    running[executor.submit(render_variants, data, widths, quality)] = (model, pk, name)
+                    if len(running) >= window:
+                        break
+                if not running:
+                    break
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    model, pk, name = running.pop(future)
+                    try:
+                        if store_variants(model, pk, name, future.result()):
+                            done += 1
+                    except Exception as exc:
+                        errors.append(f'{model.__name__} {pk} ({name}): {exc}')
+        elapsed = time.monotonic() - started
+
+        for error in errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(error)
+        if len(errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f'... and {len(errors) - MAX_REPORTED_ERRORS} more failures')
+        rate = done / elapsed if elapsed else 0
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(
+            f'Created variants for {done} images, {len(errors)} failed, '
+            f'in {elapsed:.2f}s ({rate:,.1f} images/sec)'))
@@ -0,0 +1,71 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_io import FORMATS, CatalogImporter, detect_format, read_rows
+from shop.category_counts import rebuild_category_counts
+from shop.context_processors import invalidate_nav_categories
+from shop.dashboard_stats import reconcile_dashboard_stats
+from shop.home_feed import invalidate_home_feed
+from shop.image_manifest import rebuild_image_manifests
+from shop.page_cache import CATEGORIES_TAG, PRODUCTS_TAG, invalidate_pages
+from shop.search import invalidate_search_index
+
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = ('Bulk import products from a CSV or JSON Lines file. Rows whose slug matches an '
+            'existing product update it; other rows create new products.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Input file, or "-" for stdin')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='Input format (default: from the file extension, else csv)')
+        parser.add_argument('--chunk-size', type=int, default=1000,
+                            help='Rows written per bulk_create/bulk_update transaction (default: 1000)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Validate and count the rows without writing anything')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        importer = CatalogImporter(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+
+        started = time.monotonic()
+        if path == '-':
+            importer.run(read_rows(sys.stdin, fmt))
+        else:
+            try:
+                with open(path, encoding='utf-8-sig', newline='') as fh:
+                    importer.run(read_rows(fh, fmt))
+            except FileNotFoundError:
+                raise CommandError(f'File not found: {path}')
+        elapsed = time.monotonic() - started
+        if not options['dry_run']:
+            # Bulk writes skip the signals that maintain category counts, image manifests,
+            # dashboard statistics and caches
+            rebuild_category_counts()
+            rebuild_image_manifests()
+            reconcile_dashboard_stats()
+            invalidate_home_feed()
+            invalidate_nav_categories()
+            invalidate_search_index()
+            # Every detail page depends on the categories tag as well
+            invalidate_pages(PRODUCTS_TAG, CATEGORIES_TAG)
+
+        for line_number, error in importer.errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f'Line {line_number}: {error}')
+        if len(importer.errors) > MAX_REPORTED_ERRORS:
+            self.stderr.write(f'... and {len(importer.errors) - MAX_REPORTED_ERRORS} more invalid rows')
+
+        total = importer.created + importer.updated
+        rate = total / elapsed if elapsed else 0
+        prefix = 'Dry run: would have created' if options['dry_run'] else 'Created'
+        style = self.style.WARNING if importer.errors else self.style.SUCCESS
+        self.stdout.write(style(
+            f'{prefix} {importer.created} and updated {importer.updated} products, '
+            f'skipped {len(importer.errors)} invalid rows in {elapsed:.2f}s ({rate:,.0f} rows/sec)'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.category_counts import rebuild_category_counts
+
+
+class Command(BaseCommand):
+    help = ('Recompute the product and in-stock counts stored on each category '
+            '(schedule periodically, e.g. nightly, to repair drift from bulk writes)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = rebuild_category_counts()
+        for category in changed:
+            self.stdout.write(f'{category.name}: {category.product_count} products, {category.in_stock_count} in stock')
+        self.stdout.write(self.style.SUCCESS(f'Category counts rebuilt ({len(changed)} corrected)'))
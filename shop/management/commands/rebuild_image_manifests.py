@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.home_feed import invalidate_home_feed
+from shop.image_manifest import rebuild_image_manifests
+
+
+class Command(BaseCommand):
+    help = ('Recompute the image list stored on each product (run after writing images '
+            'with bulk updates or raw SQL, which skip the signals that keep it current)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            changed = rebuild_image_manifests()
+        if changed:
+            invalidate_home_feed()
+        self.stdout.write(self.style.SUCCESS(f'Image manifests rebuilt ({changed} corrected)'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.search import index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index and write its snapshot for the web workers'
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = index.rebuild()
+        self.stdout.write(f'Indexed {count} products ({len(index.postings)} terms) '
+                          f'in {time.monotonic() - started:.2f}s')
+
+        path = index.save_snapshot()
+        if path:
+            self.stdout.write(self.style.SUCCESS(f'Search index snapshot written to {path}'))
+        else:
+            self.stdout.write(self.style.WARNING('SEARCH_INDEX_PATH is not set; no snapshot written'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.dashboard_stats import reconcile_dashboard_stats
+
+
+class Command(BaseCommand):
+    help = ('Recount the statistics stored for the admin dashboards '
+            '(schedule periodically, e.g. nightly, to repair drift from bulk writes)')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            stats, drifted = reconcile_dashboard_stats()
+        for field, (stored, actual) in drifted.items():
+            self.stdout.write(f'{field}: {stored} -> {actual}')
+        self.stdout.write(self.style.SUCCESS(f'Dashboard stats reconciled ({len(drifted)} corrected)'))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from shop.review_stats import find_drift, repair_drift
+
+
+class Command(BaseCommand):
+    help = 'Recompute the review count, rating sum and star histogram stored on each product'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drifted products without fixing them')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drifted = find_drift()
+            for product in drifted[:20]:
+                self.stdout.write(f'Product {product.pk}: {product.review_count} reviews, rating sum {product.rating_sum}')
+            if not drifted:
+                self.stdout.write(self.style.SUCCESS('Review stats are consistent'))
+            elif options['dry_run']:
+                self.stdout.write(self.style.WARNING(f'{len(drifted)} products have drifted review stats'))
+            else:
+                repair_drift(drifted)
+                self.stdout.write(self.style.SUCCESS(f'Repaired review stats on {len(drifted)} products'))
@@ -0,0 +1,22 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.media_files import rehash_media
+from shop.storage import ContentAddressedStorage
+
+MAX_REPORTED_ERRORS = 20
+
+
+class Command(BaseCommand):
+    help = ('Move product images and variants saved under their upload names to content-hashed '
+            'names, so they are deduplicated and served as immutable. Run gc_media afterwards '
+            'to delete the old copies.')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError('The default storage is not shop.storage.ContentAddressedStorage')
+        moved, errors = rehash_media(default_storage)
+        for label, error in errors[:MAX_REPORTED_ERRORS]:
+            self.stderr.write(f'{label}: {error}')
+        style = self.style.WARNING if errors else self.style.SUCCESS
+        self.stdout.write(style(f'Moved {moved} images to content-hashed names, {len(errors)} failed'))
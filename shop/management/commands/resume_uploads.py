@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.uploads import resume_upload, stranded_uploads
+
+
+class Command(BaseCommand):
+    help = ('Process the product image uploads left pending by a process that stopped before '
+            'storing them (run on deploy, after the previous web processes are gone)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--grace-minutes', type=int, default=10,
+                            help='Skip uploads staged more recently than this, which may still be '
+                                 'processing (default: 10)')
+
+    def handle(self, *args, **options):
+        if options['grace_minutes'] < 0:
+            raise CommandError('--grace-minutes cannot be negative')
+        stored = rejected = 0
+        for model, pk, staged in stranded_uploads(options['grace_minutes'] * 60):
+            if resume_upload(model, pk, staged):
+                stored += 1
+            else:
+                rejected += 1
+                self.stderr.write(f'{model.__name__} {pk}: discarded upload {staged}')
+        style = self.style.WARNING if rejected else self.style.SUCCESS
+        self.stdout.write(style(f'Stored {stored} pending uploads, discarded {rejected}'))
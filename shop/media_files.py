@@ -0,0 +1,154 @@
+"""
+Maintenance of the files under MEDIA_ROOT.
+
+With content-addressed storage (``shop.storage``) a file can be shared by
+several rows, so files are never deleted when a row changes. ``find_orphans``
+lists the files no Product or ProductImage references any more, as image or
+as variant, scanning the media directories in parallel threads (the scan is
+dominated by ``scandir``/``stat`` round trips, which release the GIL).
+
+``rehash_media`` moves files saved before the content-addressed backend to
+their hashed names so they are deduplicated and cacheable too.
+"""
+import os
+import posixpath
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.db import transaction
+from django.utils import timezone
+
+from .home_feed import invalidate_home_feed
+from .image_manifest import rebuild_image_manifest
+from .models import Product, ProductImage
+from .storage import CONTENT_DIR, is_content_addressed
+
+# Directories the shop writes to; anything else under MEDIA_ROOT is left alone
+MANAGED_DIRS = (CONTENT_DIR, 'products', 'variants')
+
+
+def referenced_names():
+    names = set()
+    for model in (Product, ProductImage):
+        rows = model.objects.values_list('image', 'image_variants')
+        for image, variants in rows.iterator(chunk_size=2000):
+            if image:
+                names.add(image)
+            names.update(variant['name'] for variant in (variants or {}).get('variants', []))
+    return names
+
+
+def scan_directory(root, relative):
+    """``([(name, size, mtime)], [subdirectory])`` for one directory."""
+    files, subdirectories = [], []
+    with os.scandir(os.path.join(root, relative)) as entries:
+        for entry in entries:
+            name = posixpath.join(relative, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(name)
+            elif entry.is_file(follow_symlinks=False):
+                stat = entry.stat(follow_symlinks=False)
+                files.append((name, stat.st_size, stat.st_mtime))
+    return files, subdirectories
+
+
+def scan_media(root, workers, directories=MANAGED_DIRS):
+    """Yield ``(name, size, mtime)`` for every file below ``directories``, one directory per task."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {
+            executor.submit(scan_directory, root, directory)
+            for directory in directories if os.path.isdir(os.path.join(root, directory))
+        }
+        while running:
+            finished, running = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                files, subdirectories = future.result()
+                yield from files
+                running |= {executor.submit(scan_directory, root, name) for name in subdirectories}
+
+
+def find_orphans(root, workers, grace_seconds):
+    """
+    ``[(name, size)]`` of unreferenced files older than ``grace_seconds``.
+    The grace period covers files written just before the row pointing at
+    them (uploads and variants are stored before their metadata).
+    """
+    referenced = referenced_names()
+    cutoff = time.time() - grace_seconds
+    return [
+        (name, size) for name, size, mtime in scan_media(root, workers)
+        if name not in referenced and mtime < cutoff
+    ]
+
+
+def delete_files(storage, names, workers, grace_seconds):
+    """
+    Delete the orphans ``names`` in parallel. Returns ``(deleted, kept,
+    failed)`` name lists: files referenced again or modified within
+    ``grace_seconds`` since ``find_orphans`` looked (an upload reusing the
+    content refreshes the mtime) are kept.
+    """
+    referenced = referenced_names()
+    cutoff = time.time() - grace_seconds
+
+    def delete(name):
+        try:
+            # Checked again just before the delete, the scan may be minutes old
+            if name in referenced or os.path.getmtime(storage.path(name)) >= cutoff:
+                return 'kept'
+            storage.delete(name)
+        except OSError:
+            return 'failed'
+        return 'deleted'
+
+    results = {'deleted': [], 'kept': [], 'failed': []}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, result in zip(names, executor.map(delete, names)):
+            results[result].append(name)
+    return results['deleted'], results['kept'], results['failed']
+
+
+def rehash_file(storage, name):
+    if is_content_addressed(name):
+        return name
+    with storage.open(name, 'rb') as source:
+        return storage.save(name, source)
+
+
+def rehash_media(storage):
+    """
+    Re-save images and variants not yet stored under hashed names and point
+    the rows at the new names. Returns ``(moved, [(row label, error)])``; the
+    old files are left for ``gc_media``.
+    """
+    moved, errors, product_ids = 0, [], set()
+    for model in (Product, ProductImage):
+        product_field = 'id' if model is Product else 'product_id'
+        rows = model.objects.exclude(image='').values_list('pk', product_field, 'image', 'image_variants')
+        for pk, product_id, name, variants in list(rows):
+            variants = variants or {}
+            current = variants.get('source') == name
+            names = [name]
+            if current:
+                names += [variant['name'] for variant in variants['variants']]
+            if all(is_content_addressed(n) for n in names):
+                continue
+            try:
+                new_name = rehash_file(storage, name)
+                if current:
+                    variants = {**variants, 'source': new_name, 'variants': [
+                        {**variant, 'name': rehash_file(storage, variant['name'])} for variant in variants['variants']
+                    ]}
+            except OSError as exc:
+                errors.append((f'{model.__name__} {pk}', exc))
+                continue
+            if model.objects.filter(pk=pk, image=name).update(image=new_name, image_variants=variants):
+                moved += 1
+                product_ids.add(product_id)
+    if product_ids:
+        with transaction.atomic():
+            Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+            for product_id in product_ids:
+                rebuild_image_manifest(product_id)
+            transaction.on_commit(invalidate_home_feed)
+    return moved, errors
@@ -0,0 +1,62 @@
+import logging
+
+from django.conf import settings
+
+from . import page_cache
+from .query_budget import QueryBudgetExceeded, QueryRecorder, budget_for
+
+logger = logging.getLogger('shop.query_budget')
+
+
+class QueryBudgetMiddleware:
+    """
+    Record the queries of every request and check them against the budget
+    declared for its URL name in settings.QUERY_BUDGETS, plus a repeated
+    query-shape (N+1) check for every URL.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with QueryRecorder() as recorder:
+            response = self.get_response(request)
+
+        match = getattr(request, 'resolver_match', None)
+        url_name = match.url_name if match else None
+        problems = recorder.problems(budget_for(url_name))
+        if problems:
+            message = f'{request.method} {request.path} ({url_name}): ' + '; '.join(problems)
+            if getattr(settings, 'QUERY_BUDGET_RAISE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        if settings.DEBUG:
+            response['X-Query-Count'] = str(recorder.count)
+        return response
+
+
+class PageCacheMiddleware:
+    """
+    Serve the catalog pages from ``shop.page_cache`` before their view runs,
+    and store the pages rendered on a miss. Must come after the session,
+    CSRF, authentication and message middleware, whose state fills the holes.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if page_cache.is_priming(request):
+            response = page_cache.finish_priming(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not page_cache.is_cacheable(request):
+            return None
+        page = page_cache.get_page(request)
+        if page is not None:
+            return page_cache.cached_response(request, page)
+        page_cache.start_priming(request)
+        return None
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:09
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_category_counts(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    Product = apps.get_model('shop', 'Product')
+    counts = Product.objects.order_by().values('category_id').annotate(
+        product_count=Count('id'),
+        in_stock_count=Count('id', filter=Q(stock__gt=0)),
+    )
+    for row in counts:
+        Category.objects.filter(pk=row.pop('category_id')).update(**row)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0006_product_review_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='in_stock_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='product_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_category_counts, migrations.RunPython.noop),
+    ]
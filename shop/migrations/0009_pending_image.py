@@ -0,0 +1,23 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0008_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='pending_image',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+        migrations.AddField(
+            model_name='productimage',
+            name='pending_image',
+            field=models.CharField(blank=True, editable=False, max_length=150),
+        ),
+    ]
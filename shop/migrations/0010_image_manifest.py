@@ -0,0 +1,48 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:26
+
+from django.db import migrations, models
+
+
+def entry(row, alt_text='', order=-1, is_main=True):
+    variants = row['image_variants'] or {}
+    return {
+        'image': row['image'] or '',
+        'image_variants': variants if row['image'] and variants.get('source') == row['image'] else {},
+        'pending_image': row['pending_image'],
+        'alt_text': alt_text,
+        'order': order,
+        'is_main': is_main,
+    }
+
+
+def backfill_image_manifests(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    ProductImage = apps.get_model('shop', 'ProductImage')
+    fields = ('image', 'image_variants', 'pending_image')
+    manifests = {
+        row['id']: [entry(row)] if row['image'] or row['pending_image'] else []
+        for row in Product.objects.values('id', *fields)
+    }
+    images = ProductImage.objects.order_by('order', 'created_at').values('product_id', 'alt_text', 'order', *fields)
+    for row in images:
+        if row['image'] or row['pending_image']:
+            manifests[row['product_id']].append(entry(row, row['alt_text'], row['order'], is_main=False))
+    for product_id, manifest in manifests.items():
+        if manifest:
+            Product.objects.filter(pk=product_id).update(image_manifest=manifest)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0009_pending_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_manifest',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(backfill_image_manifests, migrations.RunPython.noop),
+    ]
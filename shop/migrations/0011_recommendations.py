@@ -0,0 +1,29 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:38
+
+from django.db import migrations, models
+
+
+def mark_all_stale(apps, schema_editor):
+    # The first `manage.py build_recommendations` then computes every product
+    apps.get_model('shop', 'Product').objects.update(recommendations_stale=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0010_image_manifest'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='recommendations_stale',
+            field=models.BooleanField(db_index=True, default=False, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='recommended_ids',
+            field=models.JSONField(blank=True, default=list, editable=False),
+        ),
+        migrations.RunPython(mark_all_stale, migrations.RunPython.noop),
+    ]
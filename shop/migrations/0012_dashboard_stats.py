@@ -0,0 +1,35 @@
+# Generated by Django 5.1.3 on 2026-10-16 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0011_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DashboardStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('product_count', models.PositiveIntegerField(default=0)),
+                ('low_stock_count', models.PositiveIntegerField(default=0)),
+                ('customer_count', models.PositiveIntegerField(default=0)),
+                ('staff_count', models.PositiveIntegerField(default=0)),
+                ('superuser_count', models.PositiveIntegerField(default=0)),
+                ('cart_user_count', models.PositiveIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(null=True)),
+                ('reconciled_at', models.DateTimeField(null=True)),
+            ],
+            options={
+                'verbose_name_plural': 'Dashboard stats',
+            },
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='has_cart_items',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-17 00:26
+
+import shop.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_review_stats_not_editable'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=shop.models.NullsLastIndex(models.OrderBy(models.F('created_at'), descending=True, nulls_last=True), models.OrderBy(models.F('id'), descending=True), name='product_created_keyset_idx'),
+        ),
+    ]
@@ -1,38 +1,135 @@
 from django.db import models
+from django.db.models import Case, F, IntegerField, OrderBy, Q, Value, When
+from django.db.models.fields.files import FieldFile
 from django.contrib.auth.models import User
-from django.utils.text import slugify
 from django.urls import reverse
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
+from django.utils import timezone
+
+from .slugs import save_with_unique_slug
+
+class ImageVariantsMixin:
+    """
+    Read side of the resized copies made by ``shop.image_variants``.
+
+    ``image_variants`` describes the WebP and fallback-format copies of
+    ``image``; while they are still being rendered, or were rendered for an
+    earlier upload, every helper falls back to the original file.
+    ``pending_image`` names an upload that ``shop.uploads`` has yet to store.
+    """
+    # Width the card/thumbnail ``src`` should be at least as wide as
+    THUMBNAIL_WIDTH = 320
+
+    @staticmethod
+    def current_variants(name, variants):
+        """The variants in ``variants`` metadata that belong to image ``name``."""
+        if not name or not variants or variants.get('source') != name:
+            return []
+        return variants.get('variants', [])
+
+    def _variants(self, webp):
+        variants = self.current_variants(self.image.name, self.image_variants)
+        return [variant for variant in variants if (variant['format'] == 'webp') == webp]
+
+    def _srcset(self, webp):
+        storage = self.image.storage
+        return ', '.join(f"{storage.url(variant['name'])} {variant['width']}w" for variant in self._variants(webp))
+
+    @property
+    def image_processing(self):
+        return bool(self.pending_image)
+
+    @property
+    def webp_srcset(self):
+        return self._srcset(webp=True)
+
+    @property
+    def image_srcset(self):
+        """srcset of the copies in the upload's own format (for browsers without WebP)."""
+        return self._srcset(webp=False)
+
+    @property
+    def thumbnail_url(self):
+        if not self.image:
+            return None
+        for variant in self._variants(webp=False):
+            if variant['width'] >= self.THUMBNAIL_WIDTH:
+                return self.image.storage.url(variant['name'])
+        return self.image.url
+
+class ManifestImage(ImageVariantsMixin):
+    """One entry of ``Product.image_manifest``, with the same helpers as the image models."""
+
+    def __init__(self, field, entry, alt_text):
+        self.image = FieldFile(None, field, entry['image'])
+        self.image_variants = entry['image_variants']
+        self.pending_image = entry['pending_image']
+        self.alt_text = entry['alt_text'] or alt_text
+        self.order = entry['order']
+        self.is_main = entry['is_main']
+
+    @property
+    def url(self):
+        return self.image.url if self.image else None
+
+class NullsLastIndex(models.Index):
+    """
+    Index whose ``nulls_last`` descending expressions match an ``ORDER BY ...
+    DESC NULLS LAST``. PostgreSQL and Oracle need the modifier in the index;
+    SQLite and MySQL reject it there but already sort NULLs last descending.
+    """
+
+    def create_sql(self, model, schema_editor, using='', **kwargs):
+        index = self
+        if schema_editor.connection.vendor not in ('postgresql', 'oracle'):
+            index = self.clone()
+            index.expressions = tuple(
+                OrderBy(expression.expression, descending=True)
+                if isinstance(expression, OrderBy) and expression.descending else expression
+                for expression in self.expressions
+            )
+        return super(NullsLastIndex, index).create_sql(model, schema_editor, using=using, **kwargs)
+
+def exclude_maintained_fields(instance, kwargs, maintained):
+    """
+    Leave the ``maintained`` fields out of an ordinary ``save()`` of a stored
+    row. They are only changed in place (``F()`` updates, ``bulk_update``) by
+    the code keeping them, and the copy held in memory may predate that.
+    """
+    if instance._state.adding or kwargs.get('update_fields') is not None or kwargs.get('force_insert'):
+        return
+    deferred = instance.get_deferred_fields()
+    kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in maintained and field.attname not in deferred
+    ]
 
 class Category(models.Model):
     name = models.CharField(max_length=100)
     slug = models.SlugField(unique=True, blank=True, null=True)
+    # Maintained by the Product receivers below (rebuild with `manage.py rebuild_category_counts`)
+    product_count = models.PositiveIntegerField(default=0, editable=False)
+    in_stock_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Written only by the receivers keeping them
+    MAINTAINED_FIELDS = ('product_count', 'in_stock_count')
 
     class Meta:
         verbose_name_plural = "Categories"
         ordering = ['name']
 
     def save(self, *args, **kwargs):
+        exclude_maintained_fields(self, kwargs, self.MAINTAINED_FIELDS)
         if not self.slug:
-            base_slug = slugify(self.name)
-            if not base_slug:  # If name is empty or only special chars
-                base_slug = f"category-{self.pk or 'new'}"
-            
-            # Ensure unique slug
-            slug = base_slug
-            counter = 1
-            while Category.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            self.slug = slug
+            # Allocates a unique slug from the name and saves, retrying on conflicts
+            return save_with_unique_slug(self, super().save, 'category', *args, **kwargs)
         super().save(*args, **kwargs)
 
     def __str__(self):
         return self.name
 
-class Product(models.Model):
+class Product(ImageVariantsMixin, models.Model):
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name="products")
     name = models.CharField(max_length=200)
     slug = models.SlugField(unique=True, blank=True, null=True)
@@ -40,75 +137,156 @@ class Product(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
     image = models.ImageField(upload_to="products/", blank=True)
+    # Resized copies of `image`, written by shop.image_variants
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    # Staged upload that shop.uploads will process into `image`
+    pending_image = models.CharField(max_length=150, blank=True, editable=False)
+    # Main and additional images with their variants, kept by shop.image_manifest
+    # (rebuild with `manage.py rebuild_image_manifests`)
+    image_manifest = models.JSONField(default=list, blank=True, editable=False)
+    # Nearest products by wishlist/cart co-occurrence, best first, kept by
+    # shop.recommendations (`manage.py build_recommendations`)
+    recommended_ids = models.JSONField(default=list, blank=True, editable=False)
+    recommendations_stale = models.BooleanField(default=False, db_index=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True, null=True)
-    updated_at = models.DateTimeField(auto_now=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True, null=True, db_index=True)
     is_featured = models.BooleanField(default=False)
+    # Review aggregates maintained by the Review receivers below
+    # (repair drift with `manage.py reconcile_review_stats`)
+    review_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_sum = models.PositiveIntegerField(default=0, editable=False)
+    rating_1_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_2_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_3_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_4_count = models.PositiveIntegerField(default=0, editable=False)
+    rating_5_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Written only by shop.image_manifest, shop.recommendations and the Review receivers
+    MAINTAINED_FIELDS = (
+        'image_manifest', 'recommended_ids', 'recommendations_stale', 'review_count', 'rating_sum',
+        'rating_1_count', 'rating_2_count', 'rating_3_count', 'rating_4_count', 'rating_5_count',
+    )
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Keyset order of the product API (shop.pagination.ProductCursorPagination)
+            NullsLastIndex(F('created_at').desc(nulls_last=True), F('id').desc(), name='product_created_keyset_idx'),
+        ]
 
     def save(self, *args, **kwargs):
+        exclude_maintained_fields(self, kwargs, self.MAINTAINED_FIELDS)
         if not self.slug or self.slug == 'None':
-            base_slug = slugify(self.name)
-            if not base_slug:  # If name is empty or only special chars
-                base_slug = f"product-{self.pk or 'new'}"
-            
-            # Ensure unique slug
-            slug = base_slug
-            counter = 1
-            while Product.objects.filter(slug=slug).exclude(pk=self.pk).exists():
-                slug = f"{base_slug}-{counter}"
-                counter += 1
-            
-            self.slug = slug
+            # Allocates a unique slug from the name and saves, retrying on conflicts
+            return save_with_unique_slug(self, super().save, 'product', *args, **kwargs)
         super().save(*args, **kwargs)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the category counts currently include for this product
+        if 'category_id' in field_names and 'stock' in field_names:
+            instance._loaded_counts = (instance.category_id, instance.stock > 0)
+        # and the stock the dashboard's low-stock count saw
+        if 'stock' in field_names:
+            instance._loaded_stock = instance.stock
+        # and the fields the main entry of image_manifest was built from
+        if {'image', 'image_variants', 'pending_image'} <= set(field_names):
+            instance._loaded_images = instance.main_image_fields()
+        return instance
+
+    def main_image_fields(self):
+        """The fields behind the main entry of ``image_manifest``, for change detection."""
+        return (self.image.name or '', dict(self.image_variants or {}), self.pending_image)
+
     def get_absolute_url(self):
         return reverse('product_detail', kwargs={'slug': self.slug})
 
     @property
     def in_stock(self):
         return self.stock > 0
+
+    @staticmethod
+    def average_rating(review_count, rating_sum):
+        """Mean rating rounded to one decimal, or None without reviews."""
+        if not review_count:
+            return None
+        return round(rating_sum / review_count, 1)
+
+    @property
+    def avg_rating(self):
+        return self.average_rating(self.review_count, self.rating_sum)
+
+    @property
+    def rating_histogram(self):
+        """``[(stars, count, percent), ...]`` from 5 stars down to 1."""
+        histogram = []
+        for stars in range(5, 0, -1):
+            count = getattr(self, f'rating_{stars}_count')
+            percent = round(100 * count / self.review_count) if self.review_count else 0
+            histogram.append((stars, count, percent))
+        return histogram
     
+    @property
+    def gallery(self):
+        """``ManifestImage`` for the main and each additional image, main image first, without queries."""
+        images = []
+        for entry in self.image_manifest:
+            model = Product if entry['is_main'] else ProductImage
+            default_alt = f"{self.name} - Main Image" if entry['is_main'] else f"{self.name} - Image {entry['order']}"
+            images.append(ManifestImage(model._meta.get_field('image'), entry, default_alt))
+        return images
+
+    def get_related_products(self, limit=4, similar_ids=()):
+        """
+        The stored recommendations, then ``similar_ids`` (content-similar
+        products, see shop.recommendations.related_products), then the latest
+        products of the same category: ``limit`` in all, in one query.
+        """
+        preferred = [pk for pk in [*self.recommended_ids, *similar_ids] if pk != self.pk]
+        rank = Case(
+            *(When(pk=pk, then=Value(position)) for position, pk in enumerate(preferred)),
+            default=Value(len(preferred)), output_field=IntegerField(),
+        )
+        return (
+            Product.objects.filter(Q(pk__in=preferred) | Q(category_id=self.category_id))
+            .exclude(pk=self.pk).select_related('category')
+            .annotate(recommendation_rank=rank).order_by('recommendation_rank', '-created_at')[:limit]
+        )
+
     def get_all_images(self):
         """Get all images for this product (main image + additional images)"""
-        images = []
-        if self.image:
-            images.append({
-                'url': self.image.url,
-                'alt_text': f"{self.name} - Main Image",
-                'is_main': True,
-                'order': -1  # Main image comes first
-            })
-        
-        for img in self.additional_images.all():
-            images.append({
-                'url': img.image.url,
-                'alt_text': img.alt_text or f"{self.name} - Image {img.order}",
-                'is_main': False,
-                'order': img.order
-            })
-        
-        # Sort by order (main image first, then by order field)
-        return sorted(images, key=lambda x: x['order'])
+        return [
+            {
+                'url': image.url,
+                'thumbnail_url': image.thumbnail_url,
+                'srcset': image.webp_srcset,
+                'alt_text': image.alt_text,
+                'is_main': image.is_main,
+                'order': image.order,
+            }
+            for image in self.gallery if image.image  # Skip uploads still processing
+        ]
     
+    def get_main_image(self):
+        """The product itself when it has a main image, else its first additional image"""
+        if self.image:
+            return self
+        return next((image for image in self.gallery if image.image), None)
+
     def get_main_image_url(self):
         """Get the main image URL or first additional image if no main image"""
-        if self.image:
-            return self.image.url
-        
-        first_additional = self.additional_images.first()
-        if first_additional:
-            return first_additional.image.url
-        
-        return None
+        main_image = self.get_main_image()
+        return main_image.image.url if main_image else None
 
     def __str__(self):
         return self.name
 
-class ProductImage(models.Model):
+class ProductImage(ImageVariantsMixin, models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='additional_images')
     image = models.ImageField(upload_to="products/additional/")
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    pending_image = models.CharField(max_length=150, blank=True, editable=False)
     alt_text = models.CharField(max_length=200, blank=True)
     order = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -167,6 +345,14 @@ class Review(models.Model):
         unique_together = ("user", "product")
         ordering = ['-created_at']
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the product's aggregates currently count for this review
+        if 'product_id' in field_names and 'rating' in field_names:
+            instance._loaded_stats = (instance.product_id, instance.rating)
+        return instance
+
     def __str__(self):
         return f"{self.user.username} - {self.product.name} ({self.rating} stars)"
 
@@ -174,12 +360,45 @@ class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     address = models.TextField(blank=True, null=True, help_text="Full address including street, city, state, postal code")
     phone = models.CharField(max_length=15, blank=True, null=True)
+    # Whether the user has anything in the cart; kept by shop.dashboard_stats
+    # so the active cart count changes exactly once per user
+    has_cart_items = models.BooleanField(default=False, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    def save(self, *args, **kwargs):
+        # has_cart_items is only changed in place by shop.dashboard_stats; a
+        # profile held in memory (e.g. user.profile) must not write it back
+        exclude_maintained_fields(self, kwargs, ('has_cart_items',))
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"{self.user.username}'s Profile"
 
+class DashboardStats(models.Model):
+    """
+    Store-wide counts shown on the admin dashboards: a single row kept current
+    by shop.dashboard_stats (repair drift with `manage.py reconcile_dashboard_stats`).
+    """
+    product_count = models.PositiveIntegerField(default=0)
+    low_stock_count = models.PositiveIntegerField(default=0)
+    customer_count = models.PositiveIntegerField(default=0)
+    staff_count = models.PositiveIntegerField(default=0)
+    superuser_count = models.PositiveIntegerField(default=0)
+    cart_user_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(null=True)
+    reconciled_at = models.DateTimeField(null=True)
+
+    class Meta:
+        verbose_name_plural = "Dashboard stats"
+
+    @property
+    def user_count(self):
+        return self.customer_count + self.staff_count
+
+    def __str__(self):
+        return f"Dashboard stats (reconciled {self.reconciled_at})"
+
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
     if created:
@@ -190,4 +409,68 @@ def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
         instance.profile.save()
     else:
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
+        UserProfile.objects.create(user=instance)
+
+@receiver(post_save, sender=Category)
+def touch_category_products(sender, instance, created, **kwargs):
+    # Product payloads embed the category name, so bump updated_at to
+    # invalidate the conditional GET validators derived from it.
+    if not created:
+        Product.objects.filter(category=instance).update(updated_at=timezone.now())
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def touch_image_product(sender, instance, **kwargs):
+    Product.objects.filter(pk=instance.product_id).update(updated_at=timezone.now())
+
+def review_stats_delta(rating, sign):
+    """``update()`` kwargs adding (sign=1) or removing (sign=-1) one review."""
+    return {
+        'review_count': F('review_count') + sign,
+        'rating_sum': F('rating_sum') + sign * rating,
+        f'rating_{rating}_count': F(f'rating_{rating}_count') + sign,
+        'updated_at': timezone.now(),
+    }
+
+@receiver(post_save, sender=Review)
+def add_review_stats(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_stats', None)
+    if not created:
+        if loaded is None or loaded == (instance.product_id, instance.rating):
+            return
+        # Rating (or product) edited: move the review between buckets
+        product_id, rating = loaded
+        Product.objects.filter(pk=product_id).update(**review_stats_delta(rating, -1))
+    Product.objects.filter(pk=instance.product_id).update(**review_stats_delta(instance.rating, 1))
+    instance._loaded_stats = (instance.product_id, instance.rating)
+
+@receiver(post_delete, sender=Review)
+def remove_review_stats(sender, instance, **kwargs):
+    product_id, rating = getattr(instance, '_loaded_stats', None) or (instance.product_id, instance.rating)
+    Product.objects.filter(pk=product_id).update(**review_stats_delta(rating, -1))
+
+def adjust_category_counts(category_id, products, in_stock):
+    if products or in_stock:
+        Category.objects.filter(pk=category_id).update(
+            product_count=F('product_count') + products,
+            in_stock_count=F('in_stock_count') + in_stock,
+        )
+
+@receiver(post_save, sender=Product)
+def update_category_counts(sender, instance, created, **kwargs):
+    current = (instance.category_id, instance.stock > 0)
+    loaded = getattr(instance, '_loaded_counts', None)
+    if created:
+        adjust_category_counts(current[0], 1, int(current[1]))
+    elif loaded is not None and loaded != current:
+        if loaded[0] == current[0]:
+            adjust_category_counts(current[0], 0, int(current[1]) - int(loaded[1]))
+        else:
+            adjust_category_counts(loaded[0], -1, -int(loaded[1]))
+            adjust_category_counts(current[0], 1, int(current[1]))
+    instance._loaded_counts = current
+
+@receiver(post_delete, sender=Product)
+def remove_category_counts(sender, instance, **kwargs):
+    category_id, in_stock = getattr(instance, '_loaded_counts', None) or (instance.category_id, instance.stock > 0)
+    adjust_category_counts(category_id, -1, -int(in_stock))
@@ -0,0 +1,258 @@
+"""
+Full-page cache for the catalog pages, with holes for the personal bits.
+
+``home``, ``product_list``, ``category_products`` and ``product_detail`` render
+the same HTML for every visitor apart from a few details. For GET requests
+to these views ``PageCacheMiddleware`` (shop.middleware) answers from the
+cache before the view runs. Pages are stored per audience (anonymous, signed
+in, staff: the navigation differs) under the path plus the sorted query
+string, for ``PAGE_CACHE_TIMEOUT`` seconds.
+
+The personal bits are holes. While a page is rendered for the cache, the
+``{% personal %}`` and ``{% personal_value %}`` tags (shop.templatetags.
+page_cache) and ``{% csrf_token %}`` emit markers instead of their output;
+``fill_holes`` then resolves the markers for each request: cart and wishlist
+counts, wishlist hearts, flash messages and the CSRF token. Outside the page
+cache the same tags render their output directly.
+
+Each page records the versions of its invalidation tags (``products``,
+``categories``, ``product:<id>``, ``category:<id>``; see ``shop.
+cache_versions``) and is ignored once the Product, Category, Review or
+ProductImage receivers below have bumped any of them. Those bumps must reach
+every process, so pages are only cached with a shared cache (``SHARED_CACHE``).
+"""
+import hashlib
+import re
+from functools import partial
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response
+from django.utils.functional import cached_property
+from django.utils.http import parse_http_date_safe, urlencode
+from django.utils.safestring import mark_safe
+
+from .cache_versions import bump_cache_version, cache_is_shared, cache_version, current_versions
+from .models import Category, Product, ProductImage, Review, Wishlist
+from .user_counts import get_user_counts
+
+PRODUCTS_TAG = 'page:products'
+CATEGORIES_TAG = 'page:categories'
+
+# Cached views (URL names) and the tags every page of the view depends on
+CACHED_VIEWS = {
+    'home': (PRODUCTS_TAG, CATEGORIES_TAG),
+    'product_list': (PRODUCTS_TAG, CATEGORIES_TAG),
+    'category_products': (PRODUCTS_TAG, CATEGORIES_TAG),
+    'product_detail': (CATEGORIES_TAG,),  # plus the product and category tags it adds
+}
+
+# Response headers kept with a cached page
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+CSRF_MARKER = 'page-cache-csrf-token'
+CONDITION_RE = re.compile(
+    r'<!--personal:if (\w+) ([\w-]*)-->(.*?)<!--personal:else-->(.*?)<!--personal:endif-->', re.S)
+VALUE_RE = re.compile(r'<!--personal:value (\w+)-->')
+
+
+def product_tag(product_id):
+    return f'page:product:{product_id}'
+
+
+def category_tag(category_id):
+    return f'page:category:{category_id}'
+
+
+def page_timeout():
+    return getattr(settings, 'PAGE_CACHE_TIMEOUT', 600)
+
+
+# -------- Holes --------
+class Personalization:
+    """Values for the holes of one request, each looked up when first needed."""
+
+    def __init__(self, request):
+        self.request = request
+        self.user = request.user
+
+    @cached_property
+    def counts(self):
+        if not self.user.is_authenticated:
+            return {'cart_count': 0, 'wishlist_count': 0}
+        return get_user_counts(self.user)
+
+    @cached_property
+    def wishlist_product_ids(self):
+        if not self.user.is_authenticated:
+            return set()
+        return set(Wishlist.objects.filter(user=self.user).values_list('product_id', flat=True))
+
+    def messages(self):
+        return render_to_string('shop/messages.html', {'messages': get_messages(self.request)})
+
+
+# ``{% personal name arg %}`` conditions and ``{% personal_value name %}`` values
+CONDITIONS = {
+    'in_wishlist': lambda personal, product_id: int(product_id) in personal.wishlist_product_ids,
+    'has_cart_items': lambda personal, arg: personal.counts['cart_count'] > 0,
+    'has_wishlist_items': lambda personal, arg: personal.counts['wishlist_count'] > 0,
+}
+VALUES = {
+    'cart_count': lambda personal: str(personal.counts['cart_count']),
+    'wishlist_count': lambda personal: str(personal.counts['wishlist_count']),
+    'messages': Personalization.messages,
+}
+
+
+def personalization(request):
+    if not hasattr(request, '_personalization'):
+        request._personalization = Personalization(request)
+    return request._personalization
+
+
+def is_priming(request):
+    """True while ``request`` renders a page for the cache (holes become markers)."""
+    return getattr(request, '_page_cache_tags', None) is not None
+
+
+def condition_marker(name, arg, if_true, if_false):
+    return mark_safe(f'<!--personal:if {name} {arg}-->{if_true}<!--personal:else-->{if_false}<!--personal:endif-->')
+
+
+def value_marker(name):
+    return mark_safe(f'<!--personal:value {name}-->')
+
+
+def fill_holes(request, content):
+    personal = personalization(request)
+    content = CONDITION_RE.sub(
+        lambda match: match[3] if CONDITIONS[match[1]](personal, match[2]) else match[4], content)
+    content = VALUE_RE.sub(lambda match: VALUES[match[1]](personal), content)
+    if CSRF_MARKER in content:
+        content = content.replace(CSRF_MARKER, get_token(request))
+    return content
+
+
+# -------- Pages --------
+def audience(request):
+    user = request.user
+    if user.is_staff or user.is_superuser:
+        return 'staff'
+    return 'user' if user.is_authenticated else 'anon'
+
+
+def page_key(request):
+    query = urlencode(sorted((key, value) for key, values in request.GET.lists() for value in values))
+    digest = hashlib.md5(f'{request.path}?{query}'.encode()).hexdigest()
+    return f'shop:page:{audience(request)}:{digest}'
+
+
+def is_cacheable(request):
+    match = request.resolver_match
+    return (
+        request.method in ('GET', 'HEAD')
+        and match is not None and match.url_name in CACHED_VIEWS
+        and page_timeout() > 0
+        and cache_is_shared()
+    )
+
+
+def get_page(request):
+    """The cached page for ``request``, or None when missing or any of its tags was bumped."""
+    page = cache.get(page_key(request))
+    if page is None or current_versions(page['tags']) != page['tags']:
+        return None
+    return page
+
+
+def cached_response(request, page):
+    response = HttpResponse(fill_holes(request, page['content']))
+    for header, value in page['headers'].items():
+        response[header] = value
+    return get_conditional_response(
+        request,
+        etag=response.get('ETag'),
+        last_modified=parse_http_date_safe(response.get('Last-Modified', '')),
+        response=response,
+    )
+
+
+def start_priming(request):
+    request._page_cache_tags = {}
+    tag_page(request, *CACHED_VIEWS[request.resolver_match.url_name])
+
+
+def tag_page(request, *tags):
+    """Add invalidation tags to the page ``request`` is rendering (a no-op outside the page cache)."""
+    if is_priming(request):
+        for tag in tags:
+            # Versions are read before the data is, so a concurrent write makes the page stale
+            request._page_cache_tags.setdefault(tag, cache_version(tag))
+
+
+def finish_priming(request, response):
+    """Store ``response`` if it can be shared, then fill its holes for this request."""
+    tags, request._page_cache_tags = request._page_cache_tags, None
+    if response.streaming or not response.get('Content-Type', '').startswith('text/html'):
+        return response
+    content = response.content.decode(response.charset)
+    if response.status_code == 200 and not response.cookies and 'no-store' not in response.get('Cache-Control', ''):
+        page = {
+            'content': content,
+            'headers': {header: response[header] for header in STORED_HEADERS if response.has_header(header)},
+            'tags': tags,
+        }
+        cache.set(page_key(request), page, page_timeout())
+    response.content = fill_holes(request, content)
+    return response
+
+
+# -------- Invalidation --------
+def invalidate_pages(*tags):
+    """Bump ``tags`` once the current transaction commits."""
+    transaction.on_commit(partial(_bump_tags, tags))
+
+
+def _bump_tags(tags):
+    for tag in tags:
+        bump_cache_version(tag)
+
+
+def invalidate_product_pages(product_id, category_id=None):
+    tags = [PRODUCTS_TAG, product_tag(product_id)]
+    if category_id is not None:
+        # Detail pages of the category list it among the related products
+        tags.append(category_tag(category_id))
+    invalidate_pages(*tags)
+
+
+@receiver(pre_save, sender=Product)
+def product_moving(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_counts', None)
+    if loaded is not None and loaded[0] != instance.category_id:
+        invalidate_pages(category_tag(loaded[0]))
+
+
+@receiver([post_save, post_delete], sender=Product)
+def product_changed(sender, instance, **kwargs):
+    invalidate_product_pages(instance.pk, instance.category_id)
+
+
+@receiver([post_save, post_delete], sender=Review)
+@receiver([post_save, post_delete], sender=ProductImage)
+def product_content_changed(sender, instance, **kwargs):
+    category_id = Product.objects.filter(pk=instance.product_id).values_list('category_id', flat=True).first()
+    invalidate_product_pages(instance.product_id, category_id)
+
+
+@receiver([post_save, post_delete], sender=Category)
+def category_changed(sender, **kwargs):
+    invalidate_pages(CATEGORIES_TAG)
@@ -0,0 +1,190 @@
+import json
+from base64 import b64decode, b64encode
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import F, Q, QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class ProductCursorPagination(BasePagination):
+    """
+    Keyset pagination for the product API ordered by (-created_at, -id).
+
+    The cursor is an opaque token holding the (created_at, id) of the last row
+    on the previous page, so every page is an indexed range query on
+    product_created_keyset_idx no matter how deep the client scrolls (plus
+    one for the page where rows without a created_at begin). Views that set ``ranked = True``
+    (search results) are paged by offset in their existing order instead.
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+
+    def get_page_size(self, request):
+        default = getattr(settings, 'PRODUCT_API_PAGE_SIZE', 24)
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, default))
+        except (TypeError, ValueError):
+            size = default
+        return max(1, min(size, self.max_page_size))
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if getattr(view, 'ranked', False):
+            return self.paginate_ranked(queryset, request)
+
+        queryset = queryset.order_by(F('created_at').desc(nulls_last=True), '-id')
+        position = self.decode_cursor(request)
+        limit = self.page_size + 1
+        if position is None:
+            rows = list(queryset[:limit])
+        else:
+            try:
+                created_at, pk = position
+                pk = int(pk)
+                if created_at is not None:
+                    created_at = parse_datetime(created_at)
+                    if created_at is None:
+                        raise ValueError(position)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if created_at is None:
+                # Legacy rows without a timestamp sort last, ordered by id only
+                rows = list(queryset.filter(created_at__isnull=True, id__lt=pk)[:limit])
+            else:
+                # created_at <= cursor bounds a range scan of product_created_keyset_idx;
+                # the OR only trims the rows sharing the cursor's timestamp
+                rows = list(queryset.filter(
+                    Q(created_at__lt=created_at) | Q(id__lt=pk), created_at__lte=created_at,
+                )[:limit])
+                if len(rows) < limit:
+                    # The timestamped rows ran out: continue into the legacy ones
+                    rows += list(queryset.filter(created_at__isnull=True)[:limit - len(rows)])
+
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        self.next_position = self.encode_keyset(self.page[-1]) if self.has_next else None
+        return self.page
+
+    def paginate_ranked(self, queryset, request):
+        """
+        Search results arrive already ordered by rank and are bounded by
+        SEARCH_MAX_RESULTS, so they are paged by their offset in that order.
+        """
+        position = self.decode_cursor(request)
+        offset = 0
+        if position is not None:
+            try:
+                (offset,) = position
+                offset = int(offset)
+            except (TypeError, ValueError):
+                raise NotFound(self.invalid_cursor_message)
+            if offset < 0:
+                raise NotFound(self.invalid_cursor_message)
+
+        rows = list(queryset[offset:offset + self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        self.next_position = [offset + self.page_size] if self.has_next else None
+        return self.page
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(b64decode(encoded.encode('ascii')).decode('ascii'))
+        except (TypeError, ValueError, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(position, list):
+            raise NotFound(self.invalid_cursor_message)
+        return position
+
+    def encode_cursor(self, position):
+        token = json.dumps(position, separators=(',', ':'))
+        return b64encode(token.encode('ascii')).decode('ascii')
+
+    def encode_keyset(self, row):
+        # Rows are model instances or .values() dicts
+        if isinstance(row, dict):
+            created_at, pk = row['created_at'], row['id']
+        else:
+            created_at, pk = row.created_at, row.pk
+        return [created_at.isoformat() if created_at else None, pk]
+
+    def get_next_link(self):
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(self.next_position))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                    'format': 'uri',
+                },
+                'results': schema,
+            },
+        }
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Admin changelist paginator for tables with millions of rows.
+
+    An unfiltered changelist takes its row count from the database's table
+    statistics (PostgreSQL ``reltuples``, MySQL ``TABLE_ROWS``) instead of a
+    full ``COUNT(*)`` scan; filtered lists, small tables and backends without
+    statistics (SQLite) still count exactly.
+    """
+    exact_count_below = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.exact_count_below:
+                return estimate
+        return super().count
+
+
+def estimated_row_count(model, using='default'):
+    """Row count of ``model``'s table from planner statistics, or None if unavailable."""
+    connection = connections[using]
+    table = model._meta.db_table
+    if connection.vendor == 'postgresql':
+        sql, params = 'SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass', [table]
+    elif connection.vendor == 'mysql':
+        sql = ('SELECT table_rows FROM information_schema.tables '
+               'WHERE table_schema = DATABASE() AND table_name = %s')
+        params = [table]
+    else:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        row = cursor.fetchone()
+    # reltuples is -1 for tables that were never analyzed
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
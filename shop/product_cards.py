@@ -0,0 +1,52 @@
+"""
+Cached product cards for the product list and category pages.
+
+Rendering a card (URL reversal, ``intcomma``, ``truncatechars``, the
+``<picture>`` markup) costs more than the rest of those pages together, yet a
+card only changes when its product does. Card templates are rendered without
+a request or user and cached under ``(template, product id, updated_at)``;
+every write that changes what a card shows already bumps ``updated_at``
+(product saves, category renames, images, reviews), so old cards are simply
+never looked up again and expire after ``PRODUCT_CARD_TIMEOUT``.
+
+The per-user parts (wishlist heart, add-to-cart form with its CSRF token,
+login links with ``?next=``) stay in the page template: a card template marks
+where they go with ``USER_SLOT`` and is cached as the parts in between, which
+the page renders as ``card.parts.0``, its own markup, ``card.parts.1``, ...
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+USER_SLOT = '<!-- user -->'
+
+
+def card_timeout():
+    return getattr(settings, 'PRODUCT_CARD_TIMEOUT', 60 * 60 * 24)
+
+
+def card_key(template_name, product):
+    updated_at = product.updated_at.timestamp() if product.updated_at else ''
+    return f'shop:product_card:{template_name}:{product.pk}:{updated_at}'
+
+
+class ProductCard:
+    def __init__(self, product, parts):
+        self.product = product
+        self.parts = [mark_safe(part) for part in parts]
+
+
+def product_cards(products, template_name):
+    """``ProductCard`` for each of ``products``, rendering only the cards missing from the cache."""
+    products = list(products)
+    keys = [card_key(template_name, product) for product in products]
+    cached = cache.get_many(keys)
+    rendered = {}
+    for key, product in zip(keys, products):
+        if key not in cached:
+            rendered[key] = render_to_string(template_name, {'product': product}).split(USER_SLOT)
+    if rendered:
+        cache.set_many(rendered, card_timeout())
+    cached.update(rendered)
+    return [ProductCard(product, cached[key]) for key, product in zip(keys, products)]
@@ -0,0 +1,95 @@
+"""
+Per-request SQL query recording, N+1 detection and query budgets.
+
+``QueryRecorder`` hooks ``connection.execute_wrapper`` so it works with
+``DEBUG = False``. ``QueryBudgetMiddleware`` (shop.middleware) checks every
+request against ``settings.QUERY_BUDGETS`` (keyed by URL name) and flags
+query shapes repeated ``QUERY_REPEAT_THRESHOLD`` times or more: it logs a
+warning, or raises ``QueryBudgetExceeded`` when ``QUERY_BUDGET_RAISE`` is
+on (see ``enforce_query_budgets`` for tests).
+"""
+import re
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.test.utils import override_settings
+
+IN_LIST_RE = re.compile(r'\bIN \((?:%s, )*%s\)')
+IGNORED_PREFIXES = ('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def query_shape(sql):
+    """Normalise ``sql`` so the same query with different parameters compares equal."""
+    return IN_LIST_RE.sub('IN (...)', sql)
+
+
+class QueryRecorder:
+    """Context manager recording the SQL run on every database connection."""
+
+    def __init__(self):
+        self.queries = []
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if not sql.startswith(IGNORED_PREFIXES):
+            self.queries.append(sql)
+        return execute(sql, params, many, context)
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def repeated_shapes(self, threshold=None):
+        """``{shape: times}`` for query shapes run at least ``threshold`` times."""
+        if threshold is None:
+            threshold = getattr(settings, 'QUERY_REPEAT_THRESHOLD', 5)
+        shapes = Counter(query_shape(sql) for sql in self.queries)
+        return {shape: times for shape, times in shapes.items() if times >= threshold}
+
+    def problems(self, budget=None, threshold=None):
+        """Human readable list of budget / N+1 violations (empty when clean)."""
+        problems = []
+        if budget is not None and self.count > budget:
+            problems.append(f'{self.count} queries exceeds the budget of {budget}')
+        for shape, times in self.repeated_shapes(threshold).items():
+            problems.append(f'query repeated {times} times (possible N+1): {shape}')
+        return problems
+
+
+def budget_for(url_name):
+    return getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+
+
+@contextmanager
+def query_budget(max_queries=None, threshold=None):
+    """
+    Test helper: fail if the block runs more than ``max_queries`` queries or
+    repeats a query shape ``threshold`` times::
+
+        with query_budget(4):
+            self.client.get('/api/products/')
+    """
+    with QueryRecorder() as recorder:
+        yield recorder
+    problems = recorder.problems(max_queries, threshold)
+    if problems:
+        raise QueryBudgetExceeded('\n'.join(problems))
+
+
+# Decorate a TestCase (or test) to make QueryBudgetMiddleware raise instead of log
+enforce_query_budgets = override_settings(QUERY_BUDGET_RAISE=True)
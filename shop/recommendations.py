@@ -0,0 +1,191 @@
+"""
+Item-item recommendations from wishlists and carts.
+
+Every user's basket (the products in their wishlist or cart) counts as one
+co-occurrence of each pair of its products. The score of a pair is the
+cosine of their basket vectors::
+
+    score(i, j) = baskets with both / sqrt(baskets with i * baskets with j)
+
+so products in many baskets do not crowd out everything else. The
+``RECOMMENDATION_COUNT`` best neighbours of each product are stored in
+``Product.recommended_ids``, which ``Product.get_related_products`` reads
+without touching any basket table.
+
+The co-occurrence matrix is sparse and built one row per product: each basket
+adds its products to the row (a ``Counter``) of every product it holds.
+Baskets over ``RECOMMENDATION_MAX_BASKET`` products say little about any pair
+and would cost the square of their size, so they are skipped.
+
+The Wishlist and CartItem receivers below flag the product and the rest of
+the user's basket with ``recommendations_stale``; ``manage.py
+build_recommendations`` recomputes the flagged rows only (writes of many rows
+flag each basket once inside ``batched_basket_changes``). A changed basket
+also shifts, slightly, the scores other products have with the flagged ones;
+``build_recommendations --full`` recomputes every row (schedule it, e.g.
+nightly).
+
+Products nobody has wishlisted or carted yet have no recommendations;
+``related_products`` fills the gap with the products whose text reads most
+alike (``shop.search.similar_products``) before falling back to the category.
+"""
+import heapq
+import math
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db.models import Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import CartItem, Product, Wishlist
+from .page_cache import invalidate_pages, product_tag
+from .search import similar_products
+
+
+def recommendation_count():
+    return getattr(settings, 'RECOMMENDATION_COUNT', 8)
+
+
+def max_basket_size():
+    return getattr(settings, 'RECOMMENDATION_MAX_BASKET', 50)
+
+
+# -------- Reading --------
+def similar_fallback_ids(product_id, recommended_ids, limit=4):
+    """Content-similar products to fill in when fewer than ``limit`` recommendations are stored."""
+    if len(recommended_ids) >= limit:
+        return []
+    return similar_products(product_id, limit)
+
+
+def related_products(product, limit=4):
+    """``limit`` related products of ``product``: recommendations, then similar products, then its category."""
+    similar_ids = similar_fallback_ids(product.pk, product.recommended_ids, limit)
+    return product.get_related_products(limit, similar_ids)
+
+
+# -------- Building --------
+def load_baskets():
+    """``{user_id: {product_id}}`` from wishlists and carts, in one query."""
+    wishlist = Wishlist.objects.order_by().values_list('user_id', 'product_id')
+    cart = CartItem.objects.order_by().values_list('user_id', 'product_id')
+    baskets = {}
+    for user_id, product_id in wishlist.union(cart):
+        baskets.setdefault(user_id, set()).add(product_id)
+    return baskets
+
+
+def co_occurrence(baskets, product_ids):
+    """
+    ``(rows, basket_counts)``: the co-occurrence rows of ``product_ids``
+    (``{product_id: Counter({other_id: shared baskets})}``) and the number of
+    baskets holding each product.
+    """
+    limit = max_basket_size()
+    rows = {product_id: Counter() for product_id in product_ids}
+    basket_counts = Counter()
+    for items in baskets.values():
+        if len(items) > limit:
+            continue
+        basket_counts.update(items)
+        if len(items) > 1:
+            for product_id in items.intersection(rows):
+                rows[product_id].update(items)
+    for product_id, row in rows.items():
+        row.pop(product_id, None)
+    return rows, basket_counts
+
+
+def top_neighbours(row, basket_counts, count):
+    """The ``count`` best-scoring ids of one row, ties going to the lower id."""
+    # The row's own basket count divides every score alike, so it is left out
+    scores = ((shared / math.sqrt(basket_counts[other]), -other) for other, shared in row.items())
+    return [-negated_id for score, negated_id in heapq.nlargest(count, scores)]
+
+
+def compute_recommendations(baskets, product_ids):
+    """``{product_id: [neighbour ids, best first]}`` for ``product_ids``."""
+    rows, basket_counts = co_occurrence(baskets, product_ids)
+    count = recommendation_count()
+    return {product_id: top_neighbours(row, basket_counts, count) for product_id, row in rows.items()}
+
+
+def refresh_recommendations(full=False, batch_size=500):
+    """
+    Recompute the stale products' neighbours (every product's with ``full``)
+    and save those that changed. Returns ``(recomputed, changed)``.
+    """
+    products = Product.objects.all() if full else Product.objects.filter(recommendations_stale=True)
+    product_ids = list(products.values_list('pk', flat=True))
+    if not product_ids:
+        return 0, 0
+    # Cleared before the baskets are read, so basket changes made meanwhile flag the products again
+    Product.objects.filter(pk__in=product_ids, recommendations_stale=True).update(recommendations_stale=False)
+    recommendations = compute_recommendations(load_baskets(), product_ids)
+
+    changed = 0
+    for start in range(0, len(product_ids), batch_size):
+        batch = product_ids[start:start + batch_size]
+        stale = []
+        for product in Product.objects.filter(pk__in=batch).only('pk', 'recommended_ids'):
+            neighbours = recommendations[product.pk]
+            if neighbours != product.recommended_ids:
+                product.recommended_ids = neighbours
+                stale.append(product)
+        Product.objects.bulk_update(stale, ['recommended_ids'])
+        # Detail pages list the recommendations
+        invalidate_pages(*(product_tag(product.pk) for product in stale))
+        changed += len(stale)
+    return len(product_ids), changed
+
+
+# -------- Triggers --------
+_batch = threading.local()
+
+
+def mark_basket_stale(user_id, product_ids):
+    """Flag ``product_ids`` and the other products in the user's basket, in one UPDATE."""
+    basket = Q(pk__in=Wishlist.objects.filter(user_id=user_id).values('product_id'))
+    basket |= Q(pk__in=CartItem.objects.filter(user_id=user_id).values('product_id'))
+    Product.objects.filter(Q(pk__in=product_ids) | basket, recommendations_stale=False).update(
+        recommendations_stale=True
+    )
+
+
+def basket_changed(user_id, product_ids):
+    """Flag the basket now, or when the enclosing ``batched_basket_changes`` block ends."""
+    changes = getattr(_batch, 'changes', None)
+    if changes is None:
+        mark_basket_stale(user_id, product_ids)
+    else:
+        changes.setdefault(user_id, set()).update(product_ids)
+
+
+@contextmanager
+def batched_basket_changes():
+    """Flag each changed basket once at the end of the block instead of once per row."""
+    previous, _batch.changes = getattr(_batch, 'changes', None), {}
+    try:
+        yield
+        changes = _batch.changes
+    finally:
+        _batch.changes = previous
+    for user_id, product_ids in changes.items():
+        basket_changed(user_id, product_ids)
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_save, sender=Wishlist)
+def basket_item_added(sender, instance, created, **kwargs):
+    # A quantity change leaves the basket as it was
+    if created:
+        basket_changed(instance.user_id, [instance.product_id])
+
+
+@receiver(post_delete, sender=CartItem)
+@receiver(post_delete, sender=Wishlist)
+def basket_item_removed(sender, instance, **kwargs):
+    basket_changed(instance.user_id, [instance.product_id])
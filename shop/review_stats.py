@@ -0,0 +1,48 @@
+"""
+Recomputing the denormalized review aggregates on ``Product``.
+
+The ``Review`` receivers in ``shop.models`` keep ``review_count``,
+``rating_sum`` and the ``rating_<n>_count`` histogram current with ``F()``
+updates; writes that bypass signals (raw SQL, ``bulk_create``) can leave them
+drifted, which ``find_drift`` / ``repair_drift`` detect and fix in a couple of
+grouped queries.
+"""
+from django.db.models import Count, Q, Sum
+from django.utils import timezone
+
+from .models import Product, Review
+
+STATS_FIELDS = ['review_count', 'rating_sum'] + [f'rating_{stars}_count' for stars in range(1, 6)]
+
+
+def actual_review_stats():
+    """``{product_id: {field: value}}`` recomputed from the reviews table."""
+    rows = Review.objects.order_by().values('product_id').annotate(
+        review_count=Count('id'),
+        rating_sum=Sum('rating'),
+        **{f'rating_{stars}_count': Count('id', filter=Q(rating=stars)) for stars in range(1, 6)},
+    )
+    return {row.pop('product_id'): row for row in rows}
+
+
+def find_drift():
+    """Products whose stored aggregates differ from their reviews, with the correct values set."""
+    actual = actual_review_stats()
+    empty = dict.fromkeys(STATS_FIELDS, 0)
+    drifted = []
+    stored = Product.objects.order_by().only('id', *STATS_FIELDS)
+    for product in stored.iterator(chunk_size=2000):
+        expected = actual.get(product.pk, empty)
+        if any(getattr(product, field) != expected[field] for field in STATS_FIELDS):
+            for field in STATS_FIELDS:
+                setattr(product, field, expected[field])
+            drifted.append(product)
+    return drifted
+
+
+def repair_drift(products, batch_size=500):
+    now = timezone.now()
+    for product in products:
+        product.updated_at = now
+    Product.objects.bulk_update(products, STATS_FIELDS + ['updated_at'], batch_size=batch_size)
+    return len(products)
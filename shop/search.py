@@ -0,0 +1,404 @@
+"""
+In-process inverted index for product search with BM25 ranking.
+
+Products are tokenized over name, description and category name. The index
+is built lazily on first use (or loaded from the snapshot written by the
+``rebuild_search_index`` command), kept current by ``post_save`` /
+``post_delete`` receivers, and caught up with writes made by other worker
+processes through a ``(max(updated_at), count)`` check. The check runs when
+a product write has bumped the ``search`` cache version (``shop.
+cache_versions``) and otherwise at most every ``SEARCH_FRESHNESS_INTERVAL``
+seconds, which bounds how long writes that skip the receivers (bulk writes,
+or any write when the cache is not shared) take to show up.
+
+The same term vectors, weighted by TF-IDF, give the products most similar to
+a given one (cosine similarity): ``similar_products`` scores only the products
+sharing a term with it, through the postings of its terms, and skips terms
+held by more than ``SIMILAR_MAX_DF`` of the catalog, which match nearly
+everything and weigh almost nothing.
+"""
+import logging
+import math
+import heapq
+import pickle
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Max, When
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_versions import bump_cache_version, cache_is_shared, cache_version
+from .models import Category, Product
+
+logger = logging.getLogger(__name__)
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Field weights applied to term frequencies before BM25 scoring
+NAME_WEIGHT = 3.0
+CATEGORY_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# How many vocabulary terms the trailing (prefix) token may expand to
+MAX_PREFIX_EXPANSION = 100
+RESULT_CACHE_SIZE = 256
+
+# Share of products above which a term is ignored for similarity, and how
+# many similar products the API returns
+SIMILAR_MAX_DF = 0.5
+SIMILAR_RESULTS = 8
+
+
+NAMESPACE = 'search'
+
+
+def freshness_interval():
+    return getattr(settings, 'SEARCH_FRESHNESS_INTERVAL', 60)
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+class SearchIndex:
+    """Tokenized inverted index: term -> {product_id: weighted tf}."""
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.clear()
+
+    def clear(self):
+        self.postings = defaultdict(dict)
+        self.doc_terms = {}
+        self.doc_len = {}
+        self.total_len = 0.0
+        self.watermark = None
+        self.loaded = False
+        # When the catalog was last compared with the watermark, and the search version then
+        self.checked_at = None
+        self.checked_version = None
+        self._sorted_terms = None
+        self._forget_results()
+
+    def _forget_results(self):
+        self._results = {}
+        self._similar = {}
+        self._norms = {}
+
+    # -------- Building --------
+    def _index_row(self, pk, name, description, category_name):
+        self._remove(pk)
+        weights = defaultdict(float)
+        for field, weight in ((name, NAME_WEIGHT),
+                              (category_name, CATEGORY_WEIGHT),
+                              (description, DESCRIPTION_WEIGHT)):
+            for token in tokenize(field):
+                weights[token] += weight
+        for term, tf in weights.items():
+            if term not in self.postings:
+                self._sorted_terms = None
+            self.postings[term][pk] = tf
+        self.doc_terms[pk] = dict(weights)
+        length = sum(weights.values())
+        self.doc_len[pk] = length
+        self.total_len += length
+
+    def _remove(self, pk):
+        terms = self.doc_terms.pop(pk, None)
+        if terms is None:
+            return
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is not None:
+                docs.pop(pk, None)
+                if not docs:
+                    del self.postings[term]
+                    self._sorted_terms = None
+        self.total_len -= self.doc_len.pop(pk, 0.0)
+
+    def _index_queryset(self, queryset):
+        rows = queryset.values_list('id', 'name', 'description', 'category__name')
+        for row in rows.iterator(chunk_size=2000):
+            self._index_row(*row)
+
+    def rebuild(self, state=None):
+        with self.lock:
+            # Read before the rows, so writes made meanwhile are caught up later
+            state = state or _catalog_state()
+            self.clear()
+            self._index_queryset(Product.objects.all())
+            self.watermark = state
+            self.loaded = True
+            return len(self.doc_terms)
+
+    def add(self, product):
+        with self.lock:
+            if not self.loaded:
+                return
+            category_name = product.category.name if product.category_id else ''
+            self._index_row(product.pk, product.name, product.description, category_name)
+            self._forget_results()
+
+    def remove(self, pk):
+        with self.lock:
+            if not self.loaded:
+                return
+            self._remove(pk)
+            self._forget_results()
+
+    def ensure_fresh(self):
+        """Load or catch the index up with writes made by other processes."""
+        with self.lock:
+            version = cache_version(NAMESPACE) if cache_is_shared() else None
+            if (
+                self.loaded and self.checked_at is not None and version == self.checked_version
+                and time.monotonic() - self.checked_at < freshness_interval()
+            ):
+                return
+            state = _catalog_state()
+            checked_at = time.monotonic()
+            if self.loaded and state == self.watermark:
+                self.checked_at, self.checked_version = checked_at, version
+                return
+            if not self.loaded and not self.load_snapshot():
+                self.rebuild(state)
+                self.checked_at, self.checked_version = checked_at, version
+                return
+            last_modified = self.watermark[0]
+            changed = Product.objects.all()
+            if last_modified is not None:
+                changed = changed.filter(updated_at__gte=last_modified)
+            self._index_queryset(changed)
+            self._forget_results()
+            if len(self.doc_terms) != state[1]:
+                # Rows were deleted elsewhere; only a rebuild can drop them
+                self.rebuild(state)
+            else:
+                self.watermark = state
+            self.checked_at, self.checked_version = checked_at, version
+
+    # -------- Snapshots --------
+    def _snapshot_path(self):
+        return getattr(settings, 'SEARCH_INDEX_PATH', None)
+
+    def save_snapshot(self):
+        path = self._snapshot_path()
+        if not path:
+            return None
+        with self.lock:
+            data = {
+                'postings': dict(self.postings),
+                'doc_terms': self.doc_terms,
+                'doc_len': self.doc_len,
+                'total_len': self.total_len,
+                'watermark': self.watermark,
+            }
+            with open(path, 'wb') as fh:
+                pickle.dump(data, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        return path
+
+    def load_snapshot(self):
+        path = self._snapshot_path()
+        if not path:
+            return False
+        try:
+            with open(path, 'rb') as fh:
+                data = pickle.load(fh)
+        except FileNotFoundError:
+            return False
+        except Exception:
+            logger.warning('Ignoring unreadable search index snapshot at %s', path, exc_info=True)
+            return False
+        self.clear()
+        self.postings = defaultdict(dict, data['postings'])
+        self.doc_terms = data['doc_terms']
+        self.doc_len = data['doc_len']
+        self.total_len = data['total_len']
+        self.watermark = data['watermark']
+        self.loaded = True
+        return True
+
+    # -------- Querying --------
+    def _expand_prefix(self, prefix):
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+        terms = []
+        i = bisect_left(self._sorted_terms, prefix)
+        while i < len(self._sorted_terms) and len(terms) < MAX_PREFIX_EXPANSION:
+            term = self._sorted_terms[i]
+            if not term.startswith(prefix):
+                break
+            terms.append(term)
+            i += 1
+        return terms
+
+    def search(self, query, limit=None, candidates=None):
+        """
+        Return product ids matching every query token, best BM25 score first.
+        The last token also matches as a prefix so results update per keystroke.
+        ``candidates`` restricts the results to those ids before ``limit`` applies.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        key = ' '.join(tokens)
+        with self.lock:
+            ranked = self._results.get(key)
+            if ranked is None:
+                ranked = self._rank(tokens)
+                if len(self._results) >= RESULT_CACHE_SIZE:
+                    self._results.clear()
+                self._results[key] = ranked
+        if candidates is not None:
+            ranked = [pk for pk in ranked if pk in candidates]
+        return ranked if limit is None else ranked[:limit]
+
+    def _rank(self, tokens):
+        """Every id matching ``tokens``, best score first. Call with the lock held."""
+        groups = [[t] for t in tokens[:-1]] + [self._expand_prefix(tokens[-1])]
+        n_docs = len(self.doc_terms)
+        avg_len = self.total_len / n_docs if n_docs else 0.0
+        scores = None
+        for group in groups:
+            group_scores = defaultdict(float)
+            for term in group:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+                for pk, tf in docs.items():
+                    norm = K1 * (1 - B + B * self.doc_len[pk] / avg_len)
+                    group_scores[pk] += idf * tf * (K1 + 1) / (tf + norm)
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {pk: s + group_scores[pk] for pk, s in scores.items() if pk in group_scores}
+            if not scores:
+                break
+
+        return sorted(scores or {}, key=lambda pk: (-scores[pk], -pk))
+
+    def _idf(self, term, n_docs):
+        return math.log((1 + n_docs) / (1 + len(self.postings[term]))) + 1
+
+    def _norm(self, pk, n_docs, max_df):
+        """Length of the TF-IDF vector of ``pk``, over the terms used for similarity."""
+        norm = self._norms.get(pk)
+        if norm is None:
+            norm = self._norms[pk] = math.sqrt(sum(
+                (tf * self._idf(term, n_docs)) ** 2
+                for term, tf in self.doc_terms[pk].items() if len(self.postings[term]) <= max_df
+            ))
+        return norm
+
+    def similar(self, pk, limit):
+        """Ids of the ``limit`` products closest to ``pk`` by TF-IDF cosine similarity, best first."""
+        key = (pk, limit)
+        with self.lock:
+            if key in self._similar:
+                return self._similar[key]
+            terms = self.doc_terms.get(pk)
+            if not terms:
+                return []
+            n_docs = len(self.doc_terms)
+            max_df = max(2, int(SIMILAR_MAX_DF * n_docs))
+            dot = defaultdict(float)
+            for term, tf in terms.items():
+                docs = self.postings[term]
+                if len(docs) > max_df:
+                    continue
+                weight = tf * self._idf(term, n_docs) ** 2
+                for other, other_tf in docs.items():
+                    dot[other] += weight * other_tf
+            dot.pop(pk, None)
+            # The norm of pk divides every score alike, so it is left out
+            scores = ((value / self._norm(other, n_docs, max_df), -other) for other, value in dot.items())
+            ranked = [-negated_id for score, negated_id in heapq.nlargest(limit, scores)]
+            if len(self._similar) >= RESULT_CACHE_SIZE:
+                self._similar.clear()
+            self._similar[key] = ranked
+            return ranked
+
+
+def _catalog_state():
+    state = Product.objects.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return state['last_modified'], state['count']
+
+
+index = SearchIndex()
+
+
+def search_products(query, candidates=None, capped=True):
+    """
+    Ranked list of product ids matching ``query``, at most SEARCH_MAX_RESULTS
+    unless ``capped`` is false. With ``candidates`` only those ids are ranked,
+    so the cap is spent on products that pass the caller's other filters.
+    """
+    index.ensure_fresh()
+    limit = getattr(settings, 'SEARCH_MAX_RESULTS', 500) if capped else None
+    return index.search(query, limit=limit, candidates=candidates)
+
+
+def similar_products(product_id, limit=SIMILAR_RESULTS):
+    """Ids of the products whose name, description and category read most like ``product_id``'s."""
+    index.ensure_fresh()
+    return index.similar(product_id, limit)
+
+
+def rank_queryset(queryset, ids):
+    """Restrict ``queryset`` to ``ids`` and order it by their position."""
+    if not ids:
+        return queryset.none()
+    ranking = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(ids)],
+                   output_field=IntegerField())
+    return queryset.filter(pk__in=ids).order_by(ranking)
+
+
+def search_queryset(queryset, query, ranked=True):
+    """
+    Restrict ``queryset`` to the products matching ``query``, best first.
+    An already filtered queryset is searched within its own rows, so matches
+    it excludes never use up the result cap. With ``ranked`` false every match
+    is kept, unordered, for counting them.
+    """
+    if not ranked:
+        return queryset.filter(pk__in=search_products(query, capped=False))
+    candidates = None
+    if queryset.query.has_filters():
+        candidates = set(queryset.order_by().values_list('pk', flat=True))
+    return rank_queryset(queryset, search_products(query, candidates))
+
+
+# -------- Incremental updates --------
+def invalidate_search_index():
+    """Make every process check the catalog for changes before its next search."""
+    transaction.on_commit(lambda: bump_cache_version(NAMESPACE))
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, **kwargs):
+    index.add(instance)
+    invalidate_search_index()
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    index.remove(instance.pk)
+    invalidate_search_index()
+
+
+@receiver(post_save, sender=Category)
+def category_renamed(sender, instance, created, **kwargs):
+    # Products are indexed under their category name; the rename bumps their updated_at
+    if not created:
+        invalidate_search_index()
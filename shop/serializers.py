@@ -1,24 +1,129 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
-from .models import Category, Product, Wishlist, CartItem, Review
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri, iri_to_uri
+from .models import Category, ImageVariantsMixin, Product, Wishlist, CartItem, Review
+
+
+# -------- Sparse fieldsets --------
+def parse_field_paths(value):
+    """Turn ``"id,product.name,product.price"`` into ``{'id': {}, 'product': {'name': {}, 'price': {}}}``."""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in path.strip().split('.'):
+            if part:
+                node = node.setdefault(part, {})
+    return tree
+
+
+class DynamicFieldsMixin:
+    """
+    Lets API clients trim serializer output through the query string:
+
+    ``?fields=id,name,category.name``  only emit these fields (dotted paths
+                                        reach into nested serializers)
+    ``?compact=1``                      only emit ``Meta.compact_fields``
+    ``?expand=category``                add fields back on top of compact mode
+
+    Only the representation is trimmed; writable fields still validate.
+    """
+
+    @property
+    def _readable_fields(self):
+        if not hasattr(self, '_sparse_readable_fields'):
+            self._sparse_readable_fields = self.select_readable_fields(list(super()._readable_fields))
+        return self._sparse_readable_fields
+
+    def _field_path(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            if not isinstance(node.parent, serializers.ListSerializer):
+                path.append(node.field_name)
+            node = node.parent
+        return list(reversed(path))
+
+    def select_readable_fields(self, fields):
+        request = self.context.get('request')
+        if request is None:
+            return fields
+        params = request.query_params
+        path = self._field_path()
+
+        selected = parse_field_paths(params.get('fields'))
+        for name in path:
+            selected = selected.get(name) or {}
+        if selected:
+            return [field for field in fields if field.field_name in selected]
+
+        compact_fields = getattr(self.Meta, 'compact_fields', None)
+        if compact_fields is None or params.get('compact', '').lower() not in ['true', '1', 'yes']:
+            return fields
+        expand = parse_field_paths(params.get('expand'))
+        for name in path:
+            expand = expand.get(name) or {}
+        return [field for field in fields
+                if field.field_name in compact_fields or field.field_name in expand]
 
 
 # -------- Category --------
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = ['id', 'name']
+        compact_fields = ['id', 'name']
 
 
 # -------- Product --------
-class ProductSerializer(serializers.ModelSerializer):
+def image_variant_payload(name, variants, media_url):
+    """``image_variants`` entries for the API, with ``media_url`` turning file names into URLs."""
+    return [
+        {'url': media_url(variant['name']), 'width': variant['width'],
+         'height': variant['height'], 'format': variant['format']}
+        for variant in ImageVariantsMixin.current_variants(name, variants)
+    ]
+
+
+def webp_srcset(variants):
+    return ', '.join(f"{variant['url']} {variant['width']}w" for variant in variants if variant['format'] == 'webp')
+
+
+def image_manifest_payload(manifest, product_name, media_url):
+    """The stored images of ``Product.image_manifest``, main image first; uploads still processing are left out."""
+    images = []
+    for entry in manifest:
+        if not entry['image']:
+            continue
+        variants = image_variant_payload(entry['image'], entry['image_variants'], media_url)
+        default_alt = f"{product_name} - Main Image" if entry['is_main'] else f"{product_name} - Image {entry['order']}"
+        images.append({
+            'url': media_url(entry['image']),
+            'alt_text': entry['alt_text'] or default_alt,
+            'order': entry['order'],
+            'is_main': entry['is_main'],
+            'variants': variants,
+            'srcset': webp_srcset(variants),
+        })
+    return images
+
+
+class ProductSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     category = CategorySerializer(read_only=True)
     category_name = serializers.SerializerMethodField()
     image_url = serializers.SerializerMethodField()
+    image_variants = serializers.SerializerMethodField()
+    srcset = serializers.SerializerMethodField()
+    images = serializers.SerializerMethodField()
+    avg_rating = serializers.FloatField(read_only=True)
 
     class Meta:
         model = Product
-        fields = ['id', 'name', 'description', 'price', 'stock', 'image', 'image_url', 'category', 'category_name']
+        fields = ['id', 'name', 'description', 'price', 'stock', 'image', 'image_url', 'image_variants', 'srcset',
+                  'images', 'category', 'category_name', 'review_count', 'avg_rating']
+        read_only_fields = ['review_count']
+        compact_fields = ['id', 'name', 'price', 'stock', 'image_url', 'srcset', 'category_name', 'review_count',
+                          'avg_rating']
 
     def get_category_name(self, obj):
         return obj.category.name if obj.category_id else None
@@ -30,9 +135,96 @@ class ProductSerializer(serializers.ModelSerializer):
             return request.build_absolute_uri(url) if request else url
         return None
 
+    def media_url(self, name):
+        request = self.context.get('request')
+        url = Product._meta.get_field('image').storage.url(name)
+        return request.build_absolute_uri(url) if request else url
+
+    def get_image_variants(self, obj):
+        return image_variant_payload(obj.image.name, obj.image_variants, self.media_url)
+
+    def get_srcset(self, obj):
+        return webp_srcset(self.get_image_variants(obj))
+
+    def get_images(self, obj):
+        return image_manifest_payload(obj.image_manifest, obj.name, self.media_url)
+
+
+class ProductRowSerializer:
+    """
+    Read-only fast path for product lists.
+
+    Works on ``.values()`` rows instead of model instances, resolves media
+    URLs against a prefix computed once per request and builds plain dicts,
+    producing the same output as ``ProductSerializer(many=True)`` (including
+    ``?fields=`` / ``?compact=`` selection) at a fraction of the cost.
+    """
+    values_fields = (
+        'id', 'name', 'description', 'price', 'stock', 'image', 'image_variants', 'image_manifest',
+        'created_at', 'category_id', 'category__name', 'review_count', 'rating_sum',
+    )
+
+    def __init__(self, context=None):
+        self.context = context or {}
+        # Reuse ProductSerializer's own field selection for this request
+        product = ProductSerializer(many=True, context=self.context).child
+        self.fields = [field.field_name for field in product._readable_fields]
+        self.category_fields = (
+            [field.field_name for field in product.fields['category']._readable_fields]
+            if 'category' in self.fields else []
+        )
+        self.price_field = product.fields['price']
+        self.storage = Product._meta.get_field('image').storage
+        self.url_prefix = self._url_prefix(self.context.get('request'))
+
+    def _url_prefix(self, request):
+        """Prefix for media URLs, or None when the storage needs per-file ``url()``."""
+        if getattr(self.storage.url, '__func__', None) is not FileSystemStorage.url:
+            return None
+        base_url = self.storage.base_url
+        if request is not None and base_url.startswith('/') and not base_url.startswith('//'):
+            return request.build_absolute_uri('/')[:-1] + base_url
+        return base_url
+
+    def media_url(self, name):
+        if not name:
+            return None
+        if self.url_prefix is None:
+            url = self.storage.url(name)
+            request = self.context.get('request')
+            return request.build_absolute_uri(url) if request else url
+        return iri_to_uri(self.url_prefix + filepath_to_uri(name).lstrip('/'))
+
+    def to_representation(self, row):
+        image_url = self.media_url(row['image'])
+        image_variants = image_variant_payload(row['image'], row['image_variants'], self.media_url)
+        category_name = row['category__name'] if row['category_id'] else None
+        data = {
+            'id': row['id'],
+            'name': row['name'],
+            'description': row['description'],
+            'price': self.price_field.to_representation(row['price']),
+            'stock': row['stock'],
+            'image': image_url,
+            'image_url': image_url,
+            'image_variants': image_variants,
+            'srcset': webp_srcset(image_variants),
+            'images': image_manifest_payload(row['image_manifest'], row['name'], self.media_url),
+            'category': {'id': row['category_id'], 'name': category_name},
+            'category_name': category_name,
+            'review_count': row['review_count'],
+            'avg_rating': Product.average_rating(row['review_count'], row['rating_sum']),
+        }
+        data['category'] = {name: data['category'][name] for name in self.category_fields}
+        return {name: data[name] for name in self.fields}
+
+    def serialize(self, rows):
+        """Serialize an iterable of ``values(*values_fields)`` rows."""
+        return [self.to_representation(row) for row in rows]
+
 
 # -------- Wishlist --------
-class WishlistSerializer(serializers.ModelSerializer):
+class WishlistSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
@@ -41,10 +233,11 @@ class WishlistSerializer(serializers.ModelSerializer):
     class Meta:
         model = Wishlist
         fields = ['id', 'product', 'product_id']
+        compact_fields = ['id', 'product']
 
 
 # -------- Cart --------
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     product = ProductSerializer(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
@@ -54,15 +247,52 @@ class CartItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = CartItem
         fields = ['id', 'product', 'product_id', 'quantity', 'total_price']
+        compact_fields = ['id', 'product', 'quantity', 'total_price']
 
     def get_total_price(self, obj):
         return obj.get_total_price()
 
 
+class CartLineSerializer(serializers.Serializer):
+    id = serializers.IntegerField()
+    product_id = serializers.IntegerField()
+    name = serializers.CharField(source='product.name')
+    price = serializers.DecimalField(source='product.price', max_digits=10, decimal_places=2)
+    quantity = serializers.IntegerField()
+    line_total = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class CartSummarySerializer(serializers.Serializer):
+    items = CartLineSerializer(many=True)
+    line_count = serializers.IntegerField()
+    item_count = serializers.IntegerField()
+    total = serializers.DecimalField(max_digits=14, decimal_places=2)
+
+
+class CartBatchOperationSerializer(serializers.Serializer):
+    OPS = ['add', 'set', 'remove']
+
+    op = serializers.ChoiceField(choices=OPS)
+    product_id = serializers.IntegerField(min_value=1)
+    # 0 is only accepted by "set", where it removes the product
+    quantity = serializers.IntegerField(min_value=0, required=False)
+
+    def validate(self, attrs):
+        if attrs['op'] == 'set' and 'quantity' not in attrs:
+            raise serializers.ValidationError({'quantity': 'This field is required for "set".'})
+        if attrs['op'] == 'add' and attrs.get('quantity') == 0:
+            raise serializers.ValidationError({'quantity': 'Ensure this value is greater than or equal to 1.'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = serializers.ListField(
+        child=CartBatchOperationSerializer(), allow_empty=False, max_length=100
+    )
 
 
 # -------- Review --------
-class ReviewSerializer(serializers.ModelSerializer):
+class ReviewSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = serializers.StringRelatedField(read_only=True)
     product_id = serializers.PrimaryKeyRelatedField(
         queryset=Product.objects.all(), source='product', write_only=True
@@ -71,10 +301,11 @@ class ReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = Review
         fields = ['id', 'user', 'rating', 'comment', 'created_at', 'product_id']
+        compact_fields = ['id', 'user', 'rating', 'created_at']
 
 
 # -------- User Signup --------
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     password = serializers.CharField(write_only=True)
     email = serializers.EmailField(required=True)
     first_name = serializers.CharField(required=True)
@@ -0,0 +1,128 @@
+"""
+Unique slug allocation for Category and Product.
+
+Instead of probing ``base``, ``base-1``, ``base-2``... with one ``exists()``
+query each, the taken ``base`` / ``base-N`` slugs are fetched with a single
+prefix query and the first free one is picked in memory. ``SlugAllocator``
+does the same for many names at once (bulk imports, ``fix_slugs``), and
+``save_with_unique_slug`` retries when a concurrent insert claims the slug
+between allocation and the write.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+MAX_ATTEMPTS = 3
+# Bases per prefix query in bulk mode, keeping the OR-ed WHERE clause bounded
+PREFIX_QUERY_CHUNK = 100
+
+
+def base_slug(name, prefix, pk=None):
+    """``slugify(name)``, or ``<prefix>-<pk>`` for names with nothing sluggable."""
+    return slugify(name) or f"{prefix}-{pk or 'new'}"
+
+
+def taken_slugs(model, bases, exclude_pk=None):
+    """Slugs of ``model`` equal to one of ``bases`` or starting with ``base-``."""
+    condition = Q()
+    for base in bases:
+        condition |= Q(slug=base) | Q(slug__startswith=f'{base}-')
+    queryset = model._default_manager.order_by().filter(condition)
+    if exclude_pk is not None:
+        queryset = queryset.exclude(pk=exclude_pk)
+    return set(queryset.values_list('slug', flat=True))
+
+
+def first_free(base, taken):
+    if base not in taken:
+        return base
+    counter = 1
+    while f'{base}-{counter}' in taken:
+        counter += 1
+    return f'{base}-{counter}'
+
+
+class SlugAllocator:
+    """
+    Allocates unique slugs for ``model`` in memory. ``reserve(bases)`` loads
+    the taken slugs for many bases in a few prefix queries; ``allocate``
+    then needs no queries and remembers what it handed out.
+    """
+
+    def __init__(self, model, prefix, exclude_pk=None):
+        self.model = model
+        self.prefix = prefix
+        self.exclude_pk = exclude_pk
+        self.taken = set()
+        self.loaded_bases = set()
+
+    def reserve(self, bases):
+        bases = [base for base in dict.fromkeys(bases) if base not in self.loaded_bases]
+        for start in range(0, len(bases), PREFIX_QUERY_CHUNK):
+            chunk = bases[start:start + PREFIX_QUERY_CHUNK]
+            self.taken |= taken_slugs(self.model, chunk, self.exclude_pk)
+            self.loaded_bases.update(chunk)
+
+    def claim(self, slug):
+        """Mark an explicit ``slug`` as used; False if it was already handed out."""
+        if slug in self.taken:
+            return False
+        self.taken.add(slug)
+        return True
+
+    def base(self, name, pk=None):
+        return base_slug(name, self.prefix, pk)
+
+    def allocate(self, name, pk=None):
+        base = self.base(name, pk)
+        if base not in self.loaded_bases:
+            self.reserve([base])
+        slug = first_free(base, self.taken)
+        self.taken.add(slug)
+        return slug
+
+    def assign(self, objs, source='name'):
+        """Give every object in ``objs`` a unique ``slug`` built from ``source``."""
+        objs = list(objs)
+        self.reserve(self.base(getattr(obj, source), obj.pk) for obj in objs)
+        for obj in objs:
+            obj.slug = self.allocate(getattr(obj, source), obj.pk)
+        return objs
+
+
+def save_with_unique_slug(instance, save, prefix, *args, **kwargs):
+    """
+    Allocate ``instance.slug`` from its name and call ``save(*args, **kwargs)``,
+    re-allocating if another writer took the slug in the meantime.
+    """
+    model = type(instance)
+    for attempt in range(MAX_ATTEMPTS):
+        allocator = SlugAllocator(model, prefix, exclude_pk=instance.pk)
+        instance.slug = allocator.allocate(instance.name, instance.pk)
+        try:
+            with transaction.atomic():
+                return save(*args, **kwargs)
+        except IntegrityError:
+            conflict = model._default_manager.filter(slug=instance.slug).exclude(pk=instance.pk).exists()
+            if not conflict or attempt == MAX_ATTEMPTS - 1:
+                raise
+
+
+def bulk_assign_slugs(model, objs, prefix, update_fields=('slug',), batch_size=500):
+    """
+    Allocate slugs for ``objs`` and write them with ``bulk_update`` in
+    batches, re-allocating a batch that loses a race. Returns the count.
+    """
+    objs = list(objs)
+    for start in range(0, len(objs), batch_size):
+        batch = objs[start:start + batch_size]
+        for attempt in range(MAX_ATTEMPTS):
+            SlugAllocator(model, prefix).assign(batch)
+            try:
+                with transaction.atomic():
+                    model._default_manager.bulk_update(batch, list(update_fields))
+                break
+            except IntegrityError:
+                if attempt == MAX_ATTEMPTS - 1:
+                    raise
+    return len(objs)
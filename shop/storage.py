@@ -0,0 +1,60 @@
+"""
+Content-addressed media storage.
+
+Every file saved through ``ContentAddressedStorage`` is named after the
+SHA-256 of its bytes, ``content/<2 hex>/<64 hex>.<ext>``, whatever name or
+``upload_to`` directory it was saved under. The same image uploaded twice, as
+a main image and an additional image or for two products, is stored once, and
+since a name can never point at different bytes, media URLs are served with a
+far-future ``Cache-Control: immutable`` (``views.media_file``).
+
+Because a file may be shared by several rows, nothing deletes files when a
+row changes or goes away; ``manage.py gc_media`` removes files that no row
+references any more. Files stored before this backend keep their names until
+``manage.py rehash_media`` moves them.
+"""
+import hashlib
+import os
+import posixpath
+import re
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+CONTENT_DIR = 'content'
+CONTENT_NAME_RE = re.compile(rf'^{CONTENT_DIR}/[0-9a-f]{{2}}/[0-9a-f]{{64}}(\.[a-z0-9]+)?$')
+
+
+def is_content_addressed(name):
+    return bool(CONTENT_NAME_RE.match(name or ''))
+
+
+def content_name(digest, name):
+    extension = posixpath.splitext(name)[1].lower()
+    return f'{CONTENT_DIR}/{digest[:2]}/{digest}{extension}'
+
+
+@deconstructible(path='shop.storage.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    """FileSystemStorage that names files by the hash of their content."""
+
+    def get_available_name(self, name, max_length=None):
+        # Identical names mean identical content, so an existing file is reused
+        return name
+
+    def _save(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk if isinstance(chunk, bytes) else chunk.encode())
+        name = content_name(digest.hexdigest(), name)
+        if self.exists(name):
+            # Refresh the mtime so gc_media, which spares recently modified
+            # files, cannot collect a file that is being referenced again
+            os.utime(self.path(name))
+            return name
+        # Write under a temporary name and rename, so a concurrent save of the
+        # same content can never expose a partially written file
+        temporary = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temporary), self.path(name))
+        return name
@@ -0,0 +1,69 @@
+"""
+Template tags for the personal parts of pages cached by ``shop.page_cache``::
+
+    {% personal 'in_wishlist' product.id %}...{% else %}...{% endpersonal %}
+    {% personal_value 'cart_count' %}
+
+Outside the page cache they render like ``{% if %}`` and ``{{ }}``; while a
+page is rendered for the cache they emit markers filled in per request.
+Conditions must not be nested.
+"""
+from django import template
+
+from shop import page_cache
+
+register = template.Library()
+
+
+def _name(bits, registry):
+    name = bits[1].strip('"\'')
+    if name not in registry:
+        raise template.TemplateSyntaxError(f'{bits[0]}: unknown name {name!r}')
+    return name
+
+
+class PersonalNode(template.Node):
+    def __init__(self, name, arg, nodelist_true, nodelist_false):
+        self.name = name
+        self.arg = arg
+        self.nodelist_true = nodelist_true
+        self.nodelist_false = nodelist_false
+
+    def render(self, context):
+        request = context.get('request')
+        if request is None:
+            return self.nodelist_false.render(context)
+        arg = self.arg.resolve(context) if self.arg is not None else ''
+        if page_cache.is_priming(request):
+            return page_cache.condition_marker(
+                self.name, arg, self.nodelist_true.render(context), self.nodelist_false.render(context))
+        if page_cache.CONDITIONS[self.name](page_cache.personalization(request), arg):
+            return self.nodelist_true.render(context)
+        return self.nodelist_false.render(context)
+
+
+@register.tag
+def personal(parser, token):
+    bits = token.split_contents()
+    if len(bits) not in (2, 3):
+        raise template.TemplateSyntaxError(f'{bits[0]} takes a condition name and an optional argument')
+    name = _name(bits, page_cache.CONDITIONS)
+    arg = parser.compile_filter(bits[2]) if len(bits) == 3 else None
+    nodelist_true = parser.parse(('else', 'endpersonal'))
+    nodelist_false = template.NodeList()
+    if parser.next_token().contents == 'else':
+        nodelist_false = parser.parse(('endpersonal',))
+        parser.delete_first_token()
+    return PersonalNode(name, arg, nodelist_true, nodelist_false)
+
+
+@register.simple_tag(takes_context=True)
+def personal_value(context, name):
+    if name not in page_cache.VALUES:
+        raise template.TemplateSyntaxError(f'personal_value: unknown name {name!r}')
+    request = context.get('request')
+    if request is None:
+        return ''
+    if page_cache.is_priming(request):
+        return page_cache.value_marker(name)
+    return page_cache.VALUES[name](page_cache.personalization(request))
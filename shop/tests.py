@@ -1,3 +1,841 @@
-from django.test import TestCase
+import io
+import os
+import re
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import Client, TestCase, override_settings
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from .cache_versions import bump_cache_version, cache_version
+from .dashboard_stats import get_dashboard_stats
+from .media_files import delete_files, find_orphans
+from .models import CartItem, Category, Product, ProductImage, Review, Wishlist
+from .page_cache import CATEGORIES_TAG, PRODUCTS_TAG
+from .pagination import ProductCursorPagination
+from .query_budget import QueryBudgetExceeded, enforce_query_budgets, query_budget
+from .search import index, search_products
+from .serializers import ProductRowSerializer, ProductSerializer
+from .slugs import bulk_assign_slugs, save_with_unique_slug, taken_slugs
+from .user_counts import get_user_counts
+
+
+def png_bytes(color='red', size=(40, 30)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class MediaTestCase(TestCase):
+    """Runs against an empty MEDIA_ROOT with image processing done inline."""
+
+    def setUp(self):
+        from .search import index
+        index.clear()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(
+            MEDIA_ROOT=self.media_root, SEARCH_INDEX_PATH=None, IMAGE_VARIANT_WORKERS=0, PAGE_CACHE_TIMEOUT=0,
+        )
+        self.settings_override.enable()
+        self.category = Category.objects.create(name='Media')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+
+# -------- Media garbage collection --------
+class GarbageCollectionTests(MediaTestCase):
+    def create_product(self, name, color='red'):
+        with self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(
+                name=name, price=10, stock=1, category=self.category,
+                image=SimpleUploadedFile(f'{name}.png', png_bytes(color)),
+            )
+        product.refresh_from_db()
+        return product
+
+    def age(self, name, seconds):
+        path = default_storage.path(name)
+        then = time.time() - seconds
+        os.utime(path, (then, then))
+
+    def test_reupload_refreshes_mtime(self):
+        product = self.create_product('first')
+        self.age(product.image.name, 3600)
+        self.create_product('second')
+        self.assertGreater(os.path.getmtime(default_storage.path(product.image.name)), time.time() - 60)
+
+    def test_file_referenced_again_after_scan_is_kept(self):
+        product = self.create_product('first')
+        name = product.image.name
+        product.delete()
+        self.age(name, 7200)
+        orphans = [orphan for orphan, size in find_orphans(self.media_root, 2, 3600)]
+        self.assertIn(name, orphans)
+
+        # The same content is uploaded again while the collection runs
+        self.create_product('again')
+        deleted, kept, failed = delete_files(default_storage, orphans, 2, 3600)
+        self.assertIn(name, kept)
+        self.assertNotIn(name, deleted)
+        self.assertTrue(os.path.exists(default_storage.path(name)))
+
+    def test_unreferenced_old_files_are_deleted(self):
+        product = self.create_product('gone')
+        name = product.image.name
+        product.delete()
+        self.age(name, 7200)
+        orphans = [orphan for orphan, size in find_orphans(self.media_root, 2, 3600)]
+        deleted, kept, failed = delete_files(default_storage, orphans, 2, 3600)
+        self.assertIn(name, deleted)
+        self.assertFalse(os.path.exists(default_storage.path(name)))
+
+
+# -------- Shared cache --------
+@override_settings(SEARCH_INDEX_PATH=None, PAGE_CACHE_TIMEOUT=600)
+class SharedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('shopper', password='pw')
+        self.product = Product.objects.create(
+            name='Cable', price=10, stock=5, category=Category.objects.create(name='Cables'),
+        )
+
+    @override_settings(SHARED_CACHE=True)
+    def test_pages_are_cached_with_a_shared_cache(self):
+        self.client.get('/')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/').status_code, 200)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_pages_are_not_cached_without_a_shared_cache(self):
+        self.client.get('/')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/').status_code, 200)
+        self.assertTrue(queries.captured_queries)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_counts_are_read_from_the_database_without_a_shared_cache(self):
+        self.assertEqual(get_user_counts(self.user)['cart_count'], 0)
+        # Written without running the on_commit increment, as another process would
+        CartItem.objects.create(user=self.user, product=self.product, quantity=1)
+        self.assertEqual(get_user_counts(self.user)['cart_count'], 1)
+
+
+# -------- Page cache --------
+HEART_RE = re.compile(r'action="/toggle-wishlist/([\w-]+)/".*?title="(Remove from|Add to) Wishlist"', re.S)
+BADGE_RE = re.compile(r'text-white px-1">([^<]*)</span>')
+CSRF_RE = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+
+
+@override_settings(SHARED_CACHE=True, PAGE_CACHE_TIMEOUT=600)
+class PageCacheHoleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Cables')
+        self.products = [
+            Product.objects.create(name=f'Cable {i}', price=10, stock=5, category=self.category) for i in range(3)
+        ]
+        self.url = f'/category/{self.category.slug}/'
+        self.alice = User.objects.create_user('alice', password='pw')
+        self.bob = User.objects.create_user('bob', password='pw')
+        for product in self.products:
+            CartItem.objects.create(user=self.alice, product=product, quantity=1)
+        for product in self.products[:2]:
+            Wishlist.objects.create(user=self.alice, product=product)
+        Wishlist.objects.create(user=self.bob, product=self.products[2])
+        self.client.force_login(self.alice)
+        self.bob_client = Client(enforce_csrf_checks=True)
+        self.bob_client.force_login(self.bob)
+
+    def hearts(self, content):
+        return {slug for slug, state in HEART_RE.findall(content) if state == 'Remove from'}
+
+    def test_page_primed_for_one_user_is_personal_for_another(self):
+        alice_page = self.client.get(self.url).content.decode()
+        self.assertEqual(self.hearts(alice_page), {self.products[0].slug, self.products[1].slug})
+        self.assertEqual(set(BADGE_RE.findall(alice_page)), {'2', '3'})
+        # Renamed without invalidating: Bob must get the stored page
+        Product.objects.filter(pk=self.products[0].pk).update(name='Renamed')
+
+        bob_page = self.bob_client.get(self.url).content.decode()
+        self.assertIn('Cable 0', bob_page)
+        self.assertNotIn('Renamed', bob_page)
+        self.assertEqual(self.hearts(bob_page), {self.products[2].slug})
+        self.assertEqual(set(BADGE_RE.findall(bob_page)), {'1'})
+        self.assertNotIn('<!--personal', bob_page)
+        self.assertNotIn('page-cache-csrf-token', bob_page)
+
+        toggle = f'/toggle-wishlist/{self.products[0].slug}/'
+        alice_token = CSRF_RE.search(alice_page)[1]
+        self.assertEqual(self.bob_client.post(toggle, {'csrfmiddlewaretoken': alice_token}).status_code, 403)
+        bob_token = CSRF_RE.search(bob_page)[1]
+        self.assertEqual(self.bob_client.post(toggle, {'csrfmiddlewaretoken': bob_token}).status_code, 302)
+
+    def test_flash_message_is_a_hole(self):
+        self.client.get(self.url)
+        page = self.bob_client.get(self.url).content.decode()
+        token = CSRF_RE.search(page)[1]
+        self.bob_client.post(f'/toggle-wishlist/{self.products[0].slug}/', {'csrfmiddlewaretoken': token})
+
+        page = self.bob_client.get(self.url).content.decode()
+        self.assertIn('Added Cable 0 to your wishlist.', page)
+        self.assertEqual(self.hearts(page), {self.products[0].slug, self.products[2].slug})
+        self.assertNotIn('<!--personal', page)
+        self.assertNotIn('Added Cable 0', self.bob_client.get(self.url).content.decode())
+        self.assertNotIn('Added Cable 0', self.client.get(self.url).content.decode())
+
+    def assertRefreshed(self, url, write, expected):
+        anon = Client()
+        self.assertNotIn(expected, anon.get(url).content.decode())
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        self.assertIn(expected, anon.get(url).content.decode())
+
+    def test_product_write_invalidates(self):
+        product = self.products[0]
+
+        def rename():
+            product.name = 'Braided Cable'
+            product.save()
+        self.assertRefreshed(self.url, rename, 'Braided Cable')
+
+    def test_review_write_invalidates(self):
+        product = self.products[0]
+        self.assertRefreshed(
+            f'/product/{product.slug}/',
+            lambda: Review.objects.create(user=self.bob, product=product, rating=5, comment='Sturdy'),
+            '1 review',
+        )
+
+    def test_category_write_invalidates(self):
+        def rename():
+            self.category.name = 'Leads'
+            self.category.save()
+        self.assertRefreshed(self.url, rename, 'Leads - JEE TECH')
+
+
+# -------- Catalog import --------
+@override_settings(SEARCH_INDEX_PATH=None)
+class ImportCatalogTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        handle, self.path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as fh:
+            fh.write('name,category,price,stock\nCable,Cables,10,2\nPlug,Plugs,5,40\n')
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_import_refreshes_dashboard_stats_and_pages(self):
+        self.assertEqual(get_dashboard_stats().product_count, 0)
+        versions = [cache_version(PRODUCTS_TAG), cache_version(CATEGORIES_TAG)]
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_catalog', self.path, stdout=io.StringIO())
+
+        stats = get_dashboard_stats()
+        self.assertEqual((stats.product_count, stats.low_stock_count), (2, 1))
+        self.assertNotEqual(cache_version(PRODUCTS_TAG), versions[0])
+        self.assertNotEqual(cache_version(CATEGORIES_TAG), versions[1])
+
+
+# -------- Stranded uploads --------
+class ResumeUploadsTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.staging = tempfile.mkdtemp()
+        self.staging_override = override_settings(UPLOAD_STAGING_DIR=self.staging)
+        self.staging_override.enable()
+        self.product = Product.objects.create(name='Lamp', price=10, stock=1, category=self.category)
+
+    def tearDown(self):
+        self.staging_override.disable()
+        shutil.rmtree(self.staging)
+        super().tearDown()
+
+    def strand(self, model, pk, content, age=3600):
+        """Stage ``content`` for the row as the request would, without the on_commit processing."""
+        staged = f'token{pk}/photo.png'
+        path = os.path.join(self.staging, *staged.split('/'))
+        os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as fh:
+            fh.write(content)
+        then = time.time() - age
+        os.utime(path, (then, then))
+        model.objects.filter(pk=pk).update(pending_image=staged)
+        return staged
+
+    def resume(self, *args):
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('resume_uploads', *args, stdout=out, stderr=io.StringIO())
+        return out.getvalue()
+
+    def test_stranded_upload_is_stored(self):
+        self.strand(Product, self.product.pk, png_bytes())
+        self.assertIn('Stored 1 pending uploads, discarded 0', self.resume())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.pending_image, '')
+        self.assertTrue(self.product.image.name.startswith('content/'))
+
+    def test_recent_upload_is_left_to_the_pool(self):
+        self.strand(Product, self.product.pk, png_bytes(), age=0)
+        self.assertIn('Stored 0 pending uploads', self.resume())
+        self.product.refresh_from_db()
+        self.assertNotEqual(self.product.pending_image, '')
+
+    def test_invalid_or_missing_uploads_are_discarded(self):
+        image = ProductImage.objects.create(product=self.product)
+        self.strand(ProductImage, image.pk, b'not an image')
+        Product.objects.filter(pk=self.product.pk).update(pending_image='gone/photo.png')
+        with self.assertLogs('shop.uploads', 'WARNING'):
+            self.assertIn('Stored 0 pending uploads, discarded 2', self.resume())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.pending_image, '')
+        self.assertFalse(ProductImage.objects.filter(pk=image.pk).exists())
+
+
+# -------- Search freshness --------
+@override_settings(SEARCH_INDEX_PATH=None, SHARED_CACHE=True, SEARCH_FRESHNESS_INTERVAL=60)
+class SearchFreshnessTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        index.clear()
+        self.product = Product.objects.create(
+            name='Novel', price=5, stock=1, category=Category.objects.create(name='Books'),
+        )
+        search_products('novel')
+
+    def rename_elsewhere(self):
+        """Rename the product as another process would: the receivers of this one do not run."""
+        Product.objects.filter(pk=self.product.pk).update(name='Headphone stand', updated_at=timezone.now())
+
+    def test_catalog_is_not_checked_again_within_the_interval(self):
+        with self.assertNumQueries(0):
+            search_products('novel')
+
+    def test_version_bump_triggers_a_check(self):
+        self.rename_elsewhere()
+        self.assertEqual(search_products('headphone'), [])
+        bump_cache_version('search')
+        self.assertEqual(search_products('headphone'), [self.product.pk])
+
+    @override_settings(SEARCH_FRESHNESS_INTERVAL=0)
+    def test_writes_skipping_the_receivers_show_after_the_interval(self):
+        self.rename_elsewhere()
+        self.assertEqual(search_products('headphone'), [self.product.pk])
+
+
+@override_settings(SEARCH_MAX_RESULTS=3, SHARED_CACHE=False)
+class SearchCapTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        index.clear()
+        self.a = Category.objects.create(name='Tools')
+        self.b = Category.objects.create(name='Toys')
+        self.toy = Product.objects.create(name='Widget', price=5, stock=1, category=self.b)
+        for i in range(5):
+            Product.objects.create(name='Widget', price=50, stock=1, category=self.a)
+        search_products('widget')
+
+    def test_cap_applies_after_the_category_filter(self):
+        response = self.client.get('/api/products/', {'name': 'widget', 'category': self.b.pk})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.toy.pk])
+        response = self.client.get('/products/', {'name': 'widget', 'category': self.b.pk})
+        self.assertEqual([product.pk for product in response.context['page_obj']], [self.toy.pk])
+
+    def test_cap_applies_after_the_price_filter(self):
+        response = self.client.get('/api/products/', {'name': 'widget', 'price_max': 10})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.toy.pk])
+
+    def test_unfiltered_search_is_capped(self):
+        response = self.client.get('/api/products/', {'name': 'widget'})
+        self.assertEqual(len(response.json()['results']), 3)
+
+    def test_facets_count_every_match(self):
+        counts = {row['id']: row['count'] for row in self.client.get(
+            '/api/products/facets/', {'name': 'widget', 'category': self.b.pk},
+        ).json()['categories']}
+        self.assertEqual(counts, {self.a.pk: 5, self.b.pk: 1})
+        response = self.client.get('/products/', {'name': 'widget'})
+        counts = {row['id']: row['count'] for row in response.context['facets']['categories']}
+        self.assertEqual(counts, {self.a.pk: 5, self.b.pk: 1})
+
+
+# -------- Query budgets --------
+def seed_catalog(test):
+    test.categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+    test.products = [
+        Product.objects.create(
+            name=f'Product {i}', description='A product', price=10 + i, stock=i, category=test.categories[i % 3],
+            is_featured=i % 2 == 0,
+        )
+        for i in range(15)
+    ]
+    test.user = User.objects.create_user('shopper', password='pw')
+    test.staff = User.objects.create_user('staff', password='pw', is_staff=True, is_superuser=True)
+    for product in test.products[:6]:
+        CartItem.objects.create(user=test.user, product=product, quantity=2)
+        Wishlist.objects.create(user=test.user, product=product)
+        Review.objects.create(user=test.user, product=product, rating=4, comment='Good')
+
+
+@enforce_query_budgets
+@override_settings(SEARCH_INDEX_PATH=None, SHARED_CACHE=True)
+class QueryBudgetTests(TestCase):
+    def setUp(self):
+        seed_catalog(self)
+        product, category = self.products[0], self.categories[0]
+        batch = {'operations': [
+            {'op': 'add', 'product_id': self.products[7].pk, 'quantity': 1},
+            {'op': 'set', 'product_id': self.products[1].pk, 'quantity': 5},
+            {'op': 'remove', 'product_id': self.products[2].pk},
+        ]}
+        # URL name: (client, method, path, data); every budget in QUERY_BUDGETS needs a request here
+        self.requests = {
+            'home': ('anon', 'get', '/', None),
+            'product_list': ('anon', 'get', '/products/?name=product', None),
+            'product_detail': ('user', 'get', f'/product/{product.slug}/', None),
+            'category_products': ('anon', 'get', f'/category/{category.slug}/', None),
+            'cart': ('user', 'get', '/cart/', None),
+            'wishlist': ('user', 'get', '/wishlist/', None),
+            'profile': ('user', 'get', '/profile/', None),
+            'about': ('anon', 'get', '/about/', None),
+            'checkout_whatsapp': ('user', 'get', '/checkout/whatsapp/', None),
+            'admin_dashboard': ('staff', 'get', '/admin-dashboard/', None),
+            'admin_products': ('staff', 'get', '/admin-dashboard/products/?search=product', None),
+            'api_products': ('anon', 'get', '/api/products/?name=product', None),
+            'api_product_facets': ('anon', 'get', '/api/products/facets/', None),
+            'api_featured_products': ('anon', 'get', '/api/products/featured/', None),
+            'api_product_detail': ('anon', 'get', f'/api/products/{product.pk}/', None),
+            'api_product_related': ('anon', 'get', f'/api/products/{product.pk}/related/', None),
+            'api_product_similar': ('anon', 'get', f'/api/products/{product.pk}/similar/', None),
+            'api_categories': ('anon', 'get', '/api/categories/', None),
+            'api_wishlist': ('jwt', 'get', '/api/wishlist/', None),
+            'api_cart': ('jwt', 'get', '/api/cart/', None),
+            'api_cart_batch': ('jwt', 'post', '/api/cart/batch/', batch),
+            'api_cart_summary': ('jwt', 'get', '/api/cart/summary/', None),
+            'api_checkout_whatsapp': ('jwt', 'get', '/api/checkout/whatsapp/', None),
+        }
+
+    def request(self, who, method, path, data):
+        self.client.logout()
+        kwargs = {}
+        if who in ('user', 'staff'):
+            self.client.force_login(self.user if who == 'user' else self.staff)
+        elif who == 'jwt':
+            kwargs['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        if data is not None:
+            kwargs.update(data=data, content_type='application/json')
+        return getattr(self.client, method)(path, **kwargs)
+
+    def test_every_budget_is_exercised(self):
+        self.assertEqual(set(self.requests), set(settings.QUERY_BUDGETS))
+
+    def test_views_stay_within_budget_with_cold_caches(self):
+        for url_name, (who, method, path, data) in self.requests.items():
+            # Public pages are budgeted for signed-in visitors too, who skip the page cache
+            audiences = ('anon', 'user') if who == 'anon' else (who,)
+            for audience in audiences:
+                for shared in (True, False):
+                    with self.subTest(url_name, who=audience, shared_cache=shared), self.settings(SHARED_CACHE=shared):
+                        # Budgets cover the rebuild of every cache the view reads
+                        cache.clear()
+                        index.clear()
+                        response = self.request(audience, method, path, data)
+                        self.assertLess(response.status_code, 400)
+
+    def test_overrun_raises(self):
+        with override_settings(QUERY_BUDGETS={'api_products': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get('/api/products/')
+
+    @override_settings(QUERY_BUDGET_RAISE=False, QUERY_BUDGETS={'api_products': 0})
+    def test_overrun_is_logged(self):
+        with self.assertLogs('shop.query_budget', 'WARNING') as logs:
+            self.assertEqual(self.client.get('/api/products/').status_code, 200)
+        self.assertIn('exceeds the budget of 0', logs.output[0])
+
+    def test_repeated_queries_are_reported(self):
+        with self.assertRaisesMessage(QueryBudgetExceeded, 'possible N+1'):
+            with query_budget():
+                for product in Product.objects.all():
+                    product.category.name
+
+
+# -------- Image manifest --------
+class ImageManifestTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.product = Product.objects.create(name='Lamp', price=10, stock=1, category=self.category)
+        self.product = Product.objects.get(pk=self.product.pk)
+
+    def test_save_without_image_change_skips_the_rebuild(self):
+        self.product.price = 12
+        with CaptureQueriesContext(connection) as queries:
+            self.product.save()
+        self.assertFalse([query for query in queries.captured_queries if 'shop_productimage' in query['sql']])
+
+    def test_save_does_not_write_back_a_stale_manifest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.product, image=SimpleUploadedFile('extra.png', png_bytes()))
+        self.assertEqual(self.product.image_manifest, [])
+        self.product.name = 'Desk lamp'
+        self.product.save()
+        self.assertEqual(len(Product.objects.get(pk=self.product.pk).image_manifest), 1)
+
+    def test_main_image_change_rebuilds_the_manifest(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.image = SimpleUploadedFile('main.png', png_bytes('blue'))
+            self.product.save()
+        manifest = Product.objects.get(pk=self.product.pk).image_manifest
+        self.assertEqual([entry['image'] for entry in manifest], [self.product.image.name])
+
+
+# -------- Product API pagination --------
+@override_settings(SHARED_CACHE=False)
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Books')
+        self.products = [
+            Product.objects.create(name=f'Book {i}', price=5, stock=1, category=category) for i in range(7)
+        ]
+
+    def stamp(self, *created_at):
+        for product, value in zip(self.products, created_at):
+            Product.objects.filter(pk=product.pk).update(created_at=value)
+
+    def walk(self, page_size=3):
+        ids, url = [], f'/api/products/?page_size={page_size}'
+        while url:
+            body = self.client.get(url).json()
+            self.assertLessEqual(len(body['results']), page_size)
+            ids += [row['id'] for row in body['results']]
+            url = body['next']
+        return ids
+
+    def test_pages_follow_creation_order(self):
+        now = timezone.now()
+        self.stamp(*[now - timedelta(minutes=i) for i in range(7)])
+        self.assertEqual(self.walk(), [product.pk for product in self.products])
+
+    def test_duplicate_timestamps_are_ordered_by_id(self):
+        now = timezone.now()
+        self.stamp(*[now - timedelta(minutes=i // 3) for i in range(7)])
+        p = self.products
+        expected = [p[2], p[1], p[0], p[5], p[4], p[3], p[6]]
+        for page_size in (1, 2, 3):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(page_size), [product.pk for product in expected])
+
+    def test_rows_without_created_at_come_last(self):
+        now = timezone.now()
+        self.stamp(now, None, now - timedelta(minutes=1), None, None, now, now - timedelta(minutes=2))
+        p = self.products
+        expected = [p[5], p[0], p[2], p[6], p[4], p[3], p[1]]
+        for page_size in (1, 2, 3, 4):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(self.walk(page_size), [product.pk for product in expected])
+
+    def test_invalid_cursors_are_not_found(self):
+        for cursor in ('not base64!', 'eyJhIjoxfQ==', 'WyJub3QgYSBkYXRlIiwxXQ==', 'WzFd', 'W251bGwsIngiXQ=='):
+            with self.subTest(cursor=cursor):
+                response = self.client.get('/api/products/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+    def test_page_size_is_clamped(self):
+        paginator = ProductCursorPagination()
+        factory = APIRequestFactory()
+        for given, expected in (('0', 1), ('-5', 1), ('1000', 100), ('many', 24), ('7', 7)):
+            with self.subTest(page_size=given), self.settings(PRODUCT_API_PAGE_SIZE=24):
+                request = Request(factory.get('/api/products/', {'page_size': given}))
+                self.assertEqual(paginator.get_page_size(request), expected)
+
+
+# -------- Product serializers --------
+class ProductRowSerializerTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        with self.captureOnCommitCallbacks(execute=True):
+            pictured = Product.objects.create(
+                name='Camera', description='Mirrorless', price='1499.50', stock=3, category=self.category,
+                image=SimpleUploadedFile('camera.png', png_bytes('blue', (900, 600))),
+            )
+            ProductImage.objects.create(
+                product=pictured, alt_text='Back', order=1, image=SimpleUploadedFile('back.png', png_bytes('green')),
+            )
+        Product.objects.create(name='Strap', price=9, stock=0, category=self.category, review_count=2, rating_sum=7)
+        self.user = User.objects.create_user('reviewer', password='pw')
+
+    def render_both(self, query=''):
+        request = Request(APIRequestFactory().get(f'/api/products/{query}'))
+        context = {'request': request}
+        products = Product.objects.select_related('category').order_by('pk')
+        rows = products.values(*ProductRowSerializer.values_fields)
+        return (
+            JSONRenderer().render(ProductRowSerializer(context=context).serialize(rows)),
+            JSONRenderer().render(ProductSerializer(products, many=True, context=context).data),
+        )
+
+    def test_rows_serialize_like_the_model_serializer(self):
+        fast, full = self.render_both()
+        self.assertIn(b'"srcset":"http://testserver/media/content/', fast)
+        self.assertEqual(fast, full)
+
+    def test_field_selection_matches(self):
+        for query in ('?compact=1', '?compact=1&expand=images,category', '?fields=id,category.name,images'):
+            with self.subTest(query):
+                fast, full = self.render_both(query)
+                self.assertEqual(fast, full)
+
+
+# -------- Cart batch API --------
+@override_settings(SEARCH_INDEX_PATH=None)
+class CartBatchAPITests(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name='Parts')
+        self.products = [
+            Product.objects.create(name=f'Part {i}', price=10 * (i + 1), stock=10, category=category) for i in range(4)
+        ]
+        self.user = User.objects.create_user('shopper', password='pw')
+        CartItem.objects.create(user=self.user, product=self.products[0], quantity=1)
+        CartItem.objects.create(user=self.user, product=self.products[1], quantity=3)
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def post(self, *operations):
+        return self.client.post(
+            '/api/cart/batch/', {'operations': list(operations)}, content_type='application/json', **self.auth,
+        )
+
+    def cart(self):
+        return dict(CartItem.objects.filter(user=self.user).values_list('product_id', 'quantity'))
+
+    def test_mixed_operations(self):
+        p0, p1, p2, p3 = (product.pk for product in self.products)
+        response = self.post(
+            {'op': 'add', 'product_id': p0, 'quantity': 2},
+            {'op': 'set', 'product_id': p2, 'quantity': 4},
+            {'op': 'remove', 'product_id': p1},
+            {'op': 'add', 'product_id': p3},
+            {'op': 'remove', 'product_id': p3},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {p0: 3, p2: 4})
+        self.assertEqual({item['product']['id']: item['quantity'] for item in response.json()}, {p0: 3, p2: 4})
+
+    def test_set_to_zero_removes(self):
+        p0, p1 = self.products[0].pk, self.products[1].pk
+        response = self.post({'op': 'set', 'product_id': p1, 'quantity': 0})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart(), {p0: 1})
+
+    def test_add_zero_is_rejected(self):
+        response = self.post({'op': 'add', 'product_id': self.products[2].pk, 'quantity': 0})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unknown_product_changes_nothing(self):
+        before = self.cart()
+        response = self.post(
+            {'op': 'set', 'product_id': self.products[0].pk, 'quantity': 5},
+            {'op': 'add', 'product_id': 999999},
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertIn('999999', response.json()['detail'])
+        self.assertEqual(self.cart(), before)
+
+    def test_conflict_returns_409(self):
+        with mock.patch.object(CartItem.objects, 'bulk_create', side_effect=IntegrityError):
+            response = self.post({'op': 'add', 'product_id': self.products[2].pk})
+        self.assertEqual(response.status_code, 409)
+
+    def test_failed_operation_rolls_back_the_batch(self):
+        before = self.cart()
+        # The insert succeeds, then the update fails
+        with mock.patch.object(CartItem.objects, 'bulk_update', side_effect=IntegrityError):
+            response = self.post(
+                {'op': 'add', 'product_id': self.products[2].pk},
+                {'op': 'set', 'product_id': self.products[0].pk, 'quantity': 7},
+                {'op': 'remove', 'product_id': self.products[1].pk},
+            )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.cart(), before)
+
+
+# -------- Review statistics --------
+@override_settings(SEARCH_INDEX_PATH=None)
+class ReviewStatsTests(TestCase):
+    def setUp(self):
+        self.product = Product.objects.create(
+            name='Kettle', price=20, stock=4, category=Category.objects.create(name='Kitchen'),
+        )
+        self.users = [User.objects.create_user(f'reviewer{i}', password='pw') for i in range(2)]
+
+    def stats(self):
+        product = Product.objects.get(pk=self.product.pk)
+        return product.review_count, product.rating_sum, [product.rating_histogram[5 - stars][1] for stars in range(1, 6)]
+
+    def test_create_and_delete(self):
+        first = Review.objects.create(user=self.users[0], product=self.product, rating=5, comment='Great')
+        Review.objects.create(user=self.users[1], product=self.product, rating=2, comment='Leaks')
+        self.assertEqual(self.stats(), (2, 7, [0, 1, 0, 0, 1]))
+        first.delete()
+        self.assertEqual(self.stats(), (1, 2, [0, 1, 0, 0, 0]))
+
+    def test_rating_edit_moves_the_review_between_buckets(self):
+        Review.objects.create(user=self.users[0], product=self.product, rating=5, comment='Great')
+        review = Review.objects.get()
+        review.rating = 3
+        review.save()
+        self.assertEqual(self.stats(), (1, 3, [0, 0, 1, 0, 0]))
+        review.comment = 'Fine'
+        review.save()
+        self.assertEqual(self.stats(), (1, 3, [0, 0, 1, 0, 0]))
+
+    def test_stale_product_save_keeps_the_counters(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Review.objects.create(user=self.users[0], product=self.product, rating=4, comment='Good')
+        stale.price = 25
+        stale.save()
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(product.price, 25)
+        self.assertEqual(self.stats(), (1, 4, [0, 0, 0, 1, 0]))
+
+    def test_stale_product_save_keeps_the_recommendations(self):
+        stale = Product.objects.get(pk=self.product.pk)
+        Product.objects.filter(pk=self.product.pk).update(recommended_ids=[7, 8], recommendations_stale=True)
+        stale.name = 'Electric kettle'
+        stale.save()
+        product = Product.objects.get(pk=self.product.pk)
+        self.assertEqual((product.name, product.recommended_ids, product.recommendations_stale),
+                         ('Electric kettle', [7, 8], True))
+
+
+# -------- Category counts --------
+@override_settings(SEARCH_INDEX_PATH=None)
+class CategoryCountsTests(TestCase):
+    def setUp(self):
+        self.audio, self.video = Category.objects.create(name='Audio'), Category.objects.create(name='Video')
+
+    def counts(self, category):
+        category = Category.objects.get(pk=category.pk)
+        return category.product_count, category.in_stock_count
+
+    def create(self, stock, category=None):
+        return Product.objects.create(name='Speaker', price=10, stock=stock, category=category or self.audio)
+
+    def test_create_and_delete(self):
+        in_stock, sold_out = self.create(3), self.create(0)
+        self.assertEqual(self.counts(self.audio), (2, 1))
+        in_stock.delete()
+        self.assertEqual(self.counts(self.audio), (1, 0))
+        Product.objects.get(pk=sold_out.pk).delete()
+        self.assertEqual(self.counts(self.audio), (0, 0))
+
+    def test_category_move(self):
+        product = Product.objects.get(pk=self.create(3).pk)
+        product.category = self.video
+        product.save()
+        self.assertEqual(self.counts(self.audio), (0, 0))
+        self.assertEqual(self.counts(self.video), (1, 1))
+
+    def test_stock_crossing_zero(self):
+        product = Product.objects.get(pk=self.create(2).pk)
+        product.stock = 0
+        product.save()
+        self.assertEqual(self.counts(self.audio), (1, 0))
+        product.stock = 5
+        product.save()
+        self.assertEqual(self.counts(self.audio), (1, 1))
+        product.stock = 4
+        product.save()
+        self.assertEqual(self.counts(self.audio), (1, 1))
+
+    def test_stale_category_save_keeps_the_counters(self):
+        stale = Category.objects.get(pk=self.audio.pk)
+        self.create(3)
+        stale.name = 'Hi-fi'
+        stale.save()
+        self.assertEqual(Category.objects.get(pk=self.audio.pk).name, 'Hi-fi')
+        self.assertEqual(self.counts(self.audio), (1, 1))
+
+
+# -------- Slugs --------
+class SlugTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Lighting')
+
+    def create(self, name, **fields):
+        return Product.objects.create(name=name, price=5, stock=1, category=self.category, **fields)
+
+    def test_base_then_counter_then_gaps(self):
+        self.assertEqual([self.create('Desk Lamp').slug for _ in range(3)], ['desk-lamp', 'desk-lamp-1', 'desk-lamp-2'])
+        Product.objects.filter(slug='desk-lamp-1').delete()
+        self.assertEqual(self.create('Desk Lamp').slug, 'desk-lamp-1')
+        self.assertEqual(self.create('Desk Lamp').slug, 'desk-lamp-3')
+
+    def test_base_that_prefixes_other_slugs(self):
+        self.create('Lamp Shade')
+        self.create('Lamp Shade')
+        self.assertEqual(self.create('Lamp').slug, 'lamp')
+        self.assertEqual(self.create('Lamp').slug, 'lamp-1')
+        self.assertEqual(self.create('Lamp Shade').slug, 'lamp-shade-2')
+
+    def test_unsluggable_name_uses_the_prefix(self):
+        product = self.create('!!!')
+        self.assertEqual(product.slug, 'product-new')
+        self.assertEqual(self.create('???').slug, 'product-new-1')
+
+    def test_conflicting_insert_is_retried(self):
+        self.create('Lamp')
+        calls = []
+
+        def stale_once(*args, **kwargs):
+            # The first allocation misses the row above, as if it were inserted concurrently
+            calls.append(args)
+            return set() if len(calls) == 1 else taken_slugs(*args, **kwargs)
+
+        with mock.patch('shop.slugs.taken_slugs', side_effect=stale_once):
+            product = self.create('Lamp')
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(product.slug, 'lamp-1')
+        self.assertEqual(Product.objects.filter(slug__startswith='lamp').count(), 2)
+
+    def test_other_integrity_errors_are_not_retried(self):
+        product = Product(name='Lamp', price=5, stock=1, category=self.category)
+        save = mock.Mock(side_effect=IntegrityError('NOT NULL constraint failed'))
+        with self.assertRaises(IntegrityError):
+            save_with_unique_slug(product, save, 'product')
+        self.assertEqual(save.call_count, 1)
+
+    def test_bulk_assignment_across_batches(self):
+        self.create('Lamp')
+        products = [self.create('Lamp' if i % 2 else 'Bulb') for i in range(5)]
+        Product.objects.filter(pk__in=[product.pk for product in products]).update(slug=None)
+        for product in products:
+            product.slug = None
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(bulk_assign_slugs(Product, products, 'product', batch_size=2), 5)
+        slugs = {product.pk: product.slug for product in products}
+        self.assertEqual(dict(Product.objects.filter(pk__in=slugs).values_list('pk', 'slug')), slugs)
+        self.assertEqual(sorted(slugs.values()), ['bulb', 'bulb-1', 'bulb-2', 'lamp-1', 'lamp-2'])
+        # One prefix query and one bulk update per batch
+        selects = [query for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertEqual(len(selects), 3)
@@ -0,0 +1,242 @@
+"""
+Off-request processing of product image uploads.
+
+``admin_product_add``/``admin_product_edit`` used to decode, verify and write
+every uploaded image while the request waited. Their forms now only check the
+extension and move the upload into ``UPLOAD_STAGING_DIR`` (a rename when the
+upload was already spooled to disk), recording it in the row's
+``pending_image`` field. After the transaction commits, the staged file is
+handed to the image process pool (``shop.image_variants.get_executor``),
+which decodes it fully, rejects anything Pillow cannot read, applies and then
+strips EXIF, caps its size at ``IMAGE_UPLOAD_MAX_DIMENSION`` and recompresses
+it. The parent process stores the result in ``image``, clears
+``pending_image`` and queues the resized variants.
+
+Until then templates show a placeholder (``ImageVariantsMixin.image_processing``).
+Uploads that turn out not to be images are dropped and logged; a new
+ProductImage row without any stored image is deleted with it.
+
+A process that dies before the pool finishes leaves ``pending_image`` set;
+``manage.py resume_uploads`` (run it on deploy) processes those rows again.
+"""
+import io
+import logging
+import os
+import posixpath
+import tempfile
+import time
+import uuid
+from functools import partial
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.move import file_move_safe
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from .home_feed import invalidate_home_feed
+from .image_manifest import rebuild_image_manifest
+from .image_variants import get_executor, schedule_variants, worker_count
+from .models import Product, ProductImage
+from .page_cache import invalidate_product_pages
+
+logger = logging.getLogger(__name__)
+
+# Formats kept as uploaded; anything else Pillow can decode is stored as PNG
+KEPT_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp'}
+
+
+def staging_dir():
+    return getattr(settings, 'UPLOAD_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'jeetech-uploads'))
+
+
+def max_dimension():
+    return getattr(settings, 'IMAGE_UPLOAD_MAX_DIMENSION', 2560)
+
+
+def upload_quality():
+    return getattr(settings, 'IMAGE_UPLOAD_QUALITY', 85)
+
+
+def staged_path(staged):
+    return os.path.join(staging_dir(), *staged.split('/'))
+
+
+# -------- Staging (runs in the request) --------
+def stage_upload(upload):
+    """
+    Move ``upload`` into the staging area without decoding it and return its
+    staged name, ``<token>/<original file name>``.
+    """
+    # Keep the end of long names so the extension survives
+    staged = f'{uuid.uuid4().hex}/{os.path.basename(upload.name)[-100:]}'
+    path = staged_path(staged)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    if hasattr(upload, 'temporary_file_path'):
+        file_move_safe(upload.temporary_file_path(), path)
+    else:
+        with open(path, 'wb') as destination:
+            for chunk in upload.chunks():
+                destination.write(chunk)
+    return staged
+
+
+def discard_staged(staged):
+    path = staged_path(staged)
+    try:
+        os.remove(path)
+        os.rmdir(os.path.dirname(path))
+    except OSError:
+        pass
+
+
+# -------- Processing (runs in the worker processes) --------
+def process_upload(path, max_size, quality):
+    """
+    Decode the image at ``path`` and re-encode it without metadata.
+
+    Returns ``(content, extension)``; raises ValueError when the file is not
+    an image Pillow can fully decode.
+    """
+    try:
+        with Image.open(path) as source:
+            image_format = source.format
+            source.load()
+            # Bake the EXIF orientation into the pixels; the tags are not re-saved
+            image = ImageOps.exif_transpose(source)
+            icc_profile = source.info.get('icc_profile')
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as exc:
+        raise ValueError(f'not a valid image ({exc})') from exc
+
+    image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+    extension = KEPT_FORMATS.get(image_format, 'png')
+    image_format = image_format if image_format in KEPT_FORMATS else 'PNG'
+    options = {
+        'JPEG': {'quality': quality, 'optimize': True, 'progressive': True},
+        'PNG': {'optimize': True},
+        'WEBP': {'quality': quality, 'method': 4},
+    }[image_format]
+    if icc_profile:
+        options['icc_profile'] = icc_profile
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA', 'L', 'LA', 'P'):
+        image = image.convert('RGBA')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue(), extension
+
+
+# -------- Storing (runs in the web process) --------
+def touch_product(model, pk):
+    product_id = pk if model is Product else model.objects.filter(pk=pk).values_list('product_id', flat=True).first()
+    Product.objects.filter(pk=product_id).update(updated_at=timezone.now())
+    rebuild_image_manifest(product_id)
+    invalidate_product_pages(product_id)
+    transaction.on_commit(invalidate_home_feed)
+
+
+def store_upload(model, pk, staged, processed):
+    """
+    Save the processed image as the row's ``image`` unless another upload
+    replaced ``staged`` meanwhile. Returns the stored name, or None.
+    """
+    content, extension = processed
+    field = model._meta.get_field('image')
+    stem = posixpath.splitext(staged.split('/', 1)[1])[0]
+    name = field.storage.save(field.generate_filename(None, f'{stem}.{extension}'), ContentFile(content))
+
+    with transaction.atomic():
+        updated = model.objects.filter(pk=pk, pending_image=staged).update(image=name, pending_image='')
+        if updated:
+            touch_product(model, pk)
+    discard_staged(staged)
+    if not updated:
+        # The stored file may be shared; unreferenced files are left to gc_media
+        return None
+    schedule_variants(model, pk, name)
+    return name
+
+
+def reject_upload(model, pk, staged, error):
+    logger.warning('Discarded upload %s for %s %s: %s', staged, model.__name__, pk, error)
+    with transaction.atomic():
+        pending = model.objects.filter(pk=pk, pending_image=staged)
+        if model is ProductImage and pending.filter(image='').exists():
+            # The row only existed for this upload
+            pending.delete()
+        elif pending.update(pending_image=''):
+            touch_product(model, pk)
+    discard_staged(staged)
+
+
+def finish_upload(model, pk, staged, result):
+    """Store or reject a staged upload; ``result`` returns ``process_upload``'s value."""
+    try:
+        processed = result()
+    except ValueError as exc:
+        reject_upload(model, pk, staged, exc)
+        return None
+    return store_upload(model, pk, staged, processed)
+
+
+def _finish_processed(model, pk, staged, future):
+    # Runs on the pool's result thread, which keeps its own DB connection
+    close_old_connections()
+    try:
+        finish_upload(model, pk, staged, future.result)
+    except Exception:
+        logger.exception('Could not store upload %s for %s %s', staged, model.__name__, pk)
+    finally:
+        close_old_connections()
+
+
+def schedule_upload(model, pk, staged):
+    """Process a staged upload in the image process pool (inline without workers)."""
+    args = (staged_path(staged), max_dimension(), upload_quality())
+    if worker_count() == 0:
+        finish_upload(model, pk, staged, partial(process_upload, *args))
+        return
+    future = get_executor().submit(process_upload, *args)
+    future.add_done_callback(partial(_finish_processed, model, pk, staged))
+
+
+# -------- Recovery --------
+def stranded_uploads(grace_seconds):
+    """
+    ``(model, pk, staged)`` for the rows still waiting on an upload staged
+    more than ``grace_seconds`` ago, or whose staged file is gone.
+    """
+    cutoff = time.time() - grace_seconds
+    for model in (Product, ProductImage):
+        for pk, staged in model.objects.exclude(pending_image='').values_list('pk', 'pending_image').iterator():
+            try:
+                if os.path.getmtime(staged_path(staged)) > cutoff:
+                    continue  # Probably still in the pool
+            except OSError:
+                pass
+            yield model, pk, staged
+
+
+def resume_upload(model, pk, staged):
+    """Process a stranded upload inline. Returns the stored name, or None when it was rejected."""
+    path = staged_path(staged)
+    if not os.path.exists(path):
+        # e.g. the staging directory was cleared by a reboot
+        reject_upload(model, pk, staged, 'staged file is missing')
+        return None
+    return finish_upload(model, pk, staged, partial(process_upload, path, max_dimension(), upload_quality()))
+
+
+# -------- Triggers --------
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImage)
+def upload_staged(sender, instance, **kwargs):
+    staged = instance.pending_image
+    if staged and getattr(instance, '_scheduled_upload', None) != staged:
+        instance._scheduled_upload = staged
+        transaction.on_commit(partial(schedule_upload, sender, instance.pk, staged))
@@ -0,0 +1,87 @@
+"""
+Per-user cart and wishlist counts kept in the cache.
+
+Counts are read with one ``get_many`` and computed from the database only on
+a miss. ``CartItem`` / ``Wishlist`` receivers then keep them current with
+atomic ``incr`` / ``decr`` after each commit, so every write path (views,
+API, admin) is covered; bulk writes that skip signals call ``set_cart_count``
+or ``forget_user_counts`` instead. Without a shared cache (``SHARED_CACHE``)
+the counts are read from the database on every request.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_versions import cache_is_shared
+from .models import CartItem, Wishlist
+
+COUNTS_TIMEOUT = 60 * 60
+CART_KEY = 'shop:cart_count:{}'
+WISHLIST_KEY = 'shop:wishlist_count:{}'
+
+
+def get_user_counts(user):
+    """``{'cart_count', 'wishlist_count'}`` for an authenticated ``user``."""
+    if not cache_is_shared():
+        # Another process's increments would never reach this process's copy
+        return {
+            'cart_count': CartItem.objects.filter(user=user).count(),
+            'wishlist_count': Wishlist.objects.filter(user=user).count(),
+        }
+    cart_key, wishlist_key = CART_KEY.format(user.pk), WISHLIST_KEY.format(user.pk)
+    cached = cache.get_many([cart_key, wishlist_key])
+    counts = {
+        'cart_count': cached.get(cart_key),
+        'wishlist_count': cached.get(wishlist_key),
+    }
+    missing = {}
+    if counts['cart_count'] is None:
+        counts['cart_count'] = missing[cart_key] = CartItem.objects.filter(user=user).count()
+    if counts['wishlist_count'] is None:
+        counts['wishlist_count'] = missing[wishlist_key] = Wishlist.objects.filter(user=user).count()
+    if missing:
+        cache.set_many(missing, COUNTS_TIMEOUT)
+    return counts
+
+
+def adjust_count(key, delta):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        pass  # Not cached; the next read computes it
+
+
+def set_cart_count(user, count):
+    cache.set(CART_KEY.format(user.pk), count, COUNTS_TIMEOUT)
+
+
+def forget_user_counts(user):
+    cache.delete_many([CART_KEY.format(user.pk), WISHLIST_KEY.format(user.pk)])
+
+
+# -------- Incremental updates --------
+def _on_commit_adjust(key, delta):
+    transaction.on_commit(lambda: adjust_count(key, delta))
+
+
+@receiver(post_save, sender=CartItem)
+def cart_item_added(sender, instance, created, **kwargs):
+    if created:
+        _on_commit_adjust(CART_KEY.format(instance.user_id), 1)
+
+
+@receiver(post_delete, sender=CartItem)
+def cart_item_removed(sender, instance, **kwargs):
+    _on_commit_adjust(CART_KEY.format(instance.user_id), -1)
+
+
+@receiver(post_save, sender=Wishlist)
+def wishlist_item_added(sender, instance, created, **kwargs):
+    if created:
+        _on_commit_adjust(WISHLIST_KEY.format(instance.user_id), 1)
+
+
+@receiver(post_delete, sender=Wishlist)
+def wishlist_item_removed(sender, instance, **kwargs):
+    _on_commit_adjust(WISHLIST_KEY.format(instance.user_id), -1)
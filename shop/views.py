@@ -3,16 +3,30 @@ from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib import messages
-from django.db.models import Avg, Count, Q, Sum
+from django.db.models import Q
 from django.core.paginator import Paginator
 from django.http import JsonResponse
 from django.views.decorators.http import require_POST
+from django.views.static import serve
 from django.conf import settings
+from django.utils import timezone
 from urllib.parse import quote
 from django.contrib.auth.models import User
 from .models import Product, Category, Wishlist, CartItem, Review, UserProfile
 from .forms import SignUpForm, ReviewForm, AddToCartForm, UpdateCartForm, UserProfileForm, ProductForm, CategoryForm, ProductImageFormSet
 from .filters import ProductFilter
+from .search import rank_queryset, search_products
+from .facets import product_facets
+from .cart_summary import cart_summary, cart_totals
+from .dashboard_stats import get_dashboard_stats
+from .slugs import bulk_assign_slugs
+from .storage import is_content_addressed
+from .home_feed import get_home_feed
+from .product_cards import product_cards
+from .recommendations import related_products
+from .page_cache import category_tag, product_tag, tag_page
+from .user_counts import get_user_counts
+from .conditional import conditional_page, product_list_validators, product_detail_validators
 
 from django.contrib.auth.views import LoginView
 from django.contrib import messages
@@ -34,26 +48,22 @@ class CustomLoginView(LoginView):
         messages.error(self.request, 'Invalid username or password. Please try again.')
         return super().form_invalid(form)
 
+# Reviews rendered on the product detail page, newest first
+REVIEWS_SHOWN = 20
+
 def home(request):
-    featured_products = Product.objects.filter(is_featured=True, stock__gt=0)[:8]
-    categories = Category.objects.annotate(product_count=Count('products'))[:6]
-    latest_products = Product.objects.filter(stock__gt=0)[:8]
-    
-    # Add wishlist information for authenticated users
-    wishlist_product_ids = []
-    if request.user.is_authenticated:
-        wishlist_product_ids = list(Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True))
+    feed = get_home_feed()
     
     context = {
-        'featured_products': featured_products,
-        'categories': categories,
-        'latest_products': latest_products,
-        'wishlist_product_ids': wishlist_product_ids,
+        'featured_products': feed['featured_products'],
+        'categories': feed['categories'],
+        'latest_products': feed['latest_products'],
     }
     return render(request, 'index.html', context)
 
+@conditional_page(product_list_validators)
 def product_list(request):
-    products = Product.objects.filter(stock__gt=0)
+    products = Product.objects.filter(stock__gt=0).select_related('category')
     product_filter = ProductFilter(request.GET, queryset=products)
     products = product_filter.qs
     
@@ -61,19 +71,22 @@ def product_list(request):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Add wishlist information for authenticated users
-    wishlist_product_ids = []
-    if request.user.is_authenticated:
-        wishlist_product_ids = list(Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True))
+    # Facet counts span every category, so drop the category filter for them
+    facet_params = request.GET.copy()
+    category = facet_params.pop('category', [None])[0]
+    facet_filter = ProductFilter(facet_params, queryset=Product.objects.filter(stock__gt=0), ranked=False)
+    facets = product_facets(facet_filter.qs, category=category)
     
     context = {
         'filter': product_filter,
         'page_obj': page_obj,
         'products': page_obj,
-        'wishlist_product_ids': wishlist_product_ids,
+        'cards': product_cards(page_obj, 'shop/product_card.html'),
+        'facets': facets,
     }
     return render(request, 'shop/product_list.html', context)
 
+@conditional_page(product_detail_validators)
 def product_detail(request, slug):
     # Try to get by slug first, then by ID if slug fails
     try:
@@ -84,13 +97,15 @@ def product_detail(request, slug):
             product = get_object_or_404(Product, id=int(slug))
         except (ValueError, Product.DoesNotExist):
             product = get_object_or_404(Product, slug=slug)
-    reviews = product.reviews.all()
-    avg_rating = reviews.aggregate(Avg('rating'))['rating__avg'] or 0
+    tag_page(request, product_tag(product.pk), category_tag(product.category_id))
+    # Rating summary comes from the aggregates stored on the product; only the latest reviews are loaded
+    reviews = product.reviews.select_related('user')[:REVIEWS_SHOWN]
+    avg_rating = product.avg_rating or 0
     
     # Check if user has already reviewed
     user_review = None
     if request.user.is_authenticated:
-        user_review = reviews.filter(user=request.user).first()
+        user_review = product.reviews.filter(user=request.user).first()
     
     # Handle review form submission
     if request.method == 'POST' and request.user.is_authenticated:
@@ -111,15 +126,9 @@ def product_detail(request, slug):
     # Add to cart form
     cart_form = AddToCartForm()
     
-    # Check if product is in user's wishlist
-    in_wishlist = False
-    if request.user.is_authenticated:
-        in_wishlist = Wishlist.objects.filter(user=request.user, product=product).exists()
-    
-    # Related products
-    related_products = Product.objects.filter(
-        category=product.category
-    ).exclude(id=product.id)[:4]
+    # Related products: co-occurrence recommendations, then similar products, then the same category
+    related = list(related_products(product))
+    tag_page(request, *(product_tag(item.pk) for item in related))
     
     context = {
         'product': product,
@@ -128,8 +137,7 @@ def product_detail(request, slug):
         'review_form': form,
         'cart_form': cart_form,
         'user_review': user_review,
-        'in_wishlist': in_wishlist,
-        'related_products': related_products,
+        'related_products': related,
     }
     return render(request, 'shop/product_detail.html', context)
 
@@ -169,7 +177,7 @@ def add_to_cart(request, slug):
                 messages.success(request, f'Added {product.name} to your cart.')
             
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-                cart_count = CartItem.objects.filter(user=request.user).count()
+                cart_count = get_user_counts(request.user)['cart_count']
                 return JsonResponse({'success': True, 'cart_count': cart_count})
             return redirect('cart')
     
@@ -177,12 +185,11 @@ def add_to_cart(request, slug):
 
 @login_required
 def cart(request):
-    cart_items = CartItem.objects.filter(user=request.user)
-    total = sum(item.get_total_price() for item in cart_items)
+    summary = cart_summary(request.user)
     
     context = {
-        'cart_items': cart_items,
-        'total': total,
+        'cart_items': summary['items'],
+        'total': summary['total'],
     }
     return render(request, 'shop/cart.html', context)
 
@@ -212,22 +219,19 @@ def remove_from_cart(request, item_id):
 
 @login_required
 def checkout_whatsapp(request):
-    cart_items = CartItem.objects.filter(user=request.user)
+    summary = cart_summary(request.user)
     
-    if not cart_items:
+    if not summary['items']:
         messages.warning(request, 'Your cart is empty.')
         return redirect('cart')
     
     # Build WhatsApp message
     message = f"Hello! I would like to order from JEETECH:\n\n"
-    total = 0
     
-    for item in cart_items:
-        item_total = item.get_total_price()
-        total += item_total
-        message += f"• {item.product.name} (Qty: {item.quantity}) - Rs.{item_total}\n"
+    for item in summary['items']:
+        message += f"• {item.product.name} (Qty: {item.quantity}) - Rs.{item.line_total}\n"
     
-    message += f"\nTotal: Rs.{total}\n"
+    message += f"\nTotal: Rs.{summary['total']}\n"
     message += f"Customer: {request.user.get_full_name() or request.user.username}\n"
     message += f"Thank you!"
     
@@ -247,7 +251,9 @@ def checkout_whatsapp(request):
 
 @login_required
 def wishlist(request):
-    wishlist_items = Wishlist.objects.filter(user=request.user)
+    wishlist_items = Wishlist.objects.filter(user=request.user).select_related(
+        'product__category'
+    )
     
     context = {
         'wishlist_items': wishlist_items,
@@ -279,7 +285,7 @@ def toggle_wishlist(request, slug):
 
     # If AJAX request, return JSON (avoid page refresh)
     if request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        wishlist_count = Wishlist.objects.filter(user=request.user).count()
+        wishlist_count = get_user_counts(request.user)['wishlist_count']
         return JsonResponse({
             'success': True,
             'in_wishlist': in_wishlist,
@@ -322,16 +328,11 @@ def category_products(request, slug):
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
     
-    # Wishlist info
-    wishlist_product_ids = []
-    if request.user.is_authenticated:
-        wishlist_product_ids = list(Wishlist.objects.filter(user=request.user).values_list('product_id', flat=True))
-    
     context = {
         'category': category,
         'page_obj': page_obj,
         'products': page_obj,
-        'wishlist_product_ids': wishlist_product_ids,
+        'cards': product_cards(page_obj, 'shop/category_product_card.html'),
     }
     return render(request, 'shop/category_products.html', context)
 
@@ -351,15 +352,15 @@ def profile_view(request):
         form = UserProfileForm(instance=profile, user=request.user)
     
     # Get user's recent orders, wishlist, and cart stats
-    cart_items = CartItem.objects.filter(user=request.user)
+    totals = cart_totals(request.user)
     wishlist_items = Wishlist.objects.filter(user=request.user)
     
     context = {
         'form': form,
         'profile': profile,
-        'cart_items_count': cart_items.count(),
+        'cart_items_count': totals['line_count'],
         'wishlist_items_count': wishlist_items.count(),
-        'cart_total': sum(item.get_total_price() for item in cart_items),
+        'cart_total': totals['total'],
     }
     return render(request, 'shop/profile.html', context)
 
@@ -373,13 +374,11 @@ def fix_product_slugs(request):
         messages.error(request, 'Access denied.')
         return redirect('home')
     
-    from django.utils.text import slugify
-    
-    products_fixed = 0
-    for product in Product.objects.all():
-        if not product.slug or product.slug == 'None':
-            product.save()  # This will trigger the improved save method
-            products_fixed += 1
+    products = list(Product.objects.filter(Q(slug__isnull=True) | Q(slug='') | Q(slug='None')).only('id', 'name', 'slug').order_by('id'))
+    now = timezone.now()
+    for product in products:
+        product.updated_at = now
+    products_fixed = bulk_assign_slugs(Product, products, 'product', update_fields=('slug', 'updated_at'))
     
     messages.success(request, f'Fixed slugs for {products_fixed} products.')
     return redirect('product_list')
@@ -390,32 +389,35 @@ def logout_view(request):
     messages.success(request, 'You have been successfully logged out.')
     return redirect('home')
 
+def media_file(request, path):
+    """Serve uploaded media; content-addressed files never change, so they are cached forever"""
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if is_content_addressed(path):
+        response['Cache-Control'] = f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}, immutable'
+    return response
+
 # Admin Dashboard Views
 @staff_member_required
 def admin_dashboard(request):
     """Admin dashboard with statistics"""
-    # Get statistics
-    total_products = Product.objects.count()
-    total_customers = User.objects.filter(is_staff=False).count()
-    total_orders = CartItem.objects.values('user').distinct().count()
-    low_stock_products = Product.objects.filter(stock__lt=10).count()
+    # Statistics are read from the row shop.dashboard_stats keeps current
+    stats = get_dashboard_stats()
     
     # Recent products
-    recent_products = Product.objects.order_by('-created_at')[:5]
+    recent_products = Product.objects.select_related('category').order_by('-created_at')[:5]
     
     # Top categories by product count
-    top_categories = Category.objects.annotate(
-        product_count=Count('products')
-    ).order_by('-product_count')[:5]
+    top_categories = Category.objects.order_by('-product_count')[:5]
     
     # Recent customers
     recent_customers = User.objects.filter(is_staff=False).order_by('-date_joined')[:5]
     
     context = {
-        'total_products': total_products,
-        'total_customers': total_customers,
-        'total_orders': total_orders,
-        'low_stock_products': low_stock_products,
+        'total_products': stats.product_count,
+        'total_customers': stats.customer_count,
+        'total_orders': stats.cart_user_count,
+        'low_stock_products': stats.low_stock_count,
+        'stats_updated_at': stats.updated_at,
         'recent_products': recent_products,
         'top_categories': top_categories,
         'recent_customers': recent_customers,
@@ -425,16 +427,12 @@ def admin_dashboard(request):
 @staff_member_required
 def admin_products(request):
     """Admin products management"""
-    products = Product.objects.all().order_by('-created_at')
+    products = Product.objects.select_related('category').order_by('-created_at')
     
     # Search functionality
     search_query = request.GET.get('search')
     if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
+        products = rank_queryset(products, search_products(search_query))
     
     # Pagination
     paginator = Paginator(products, 20)
@@ -525,6 +523,13 @@ def admin_product_delete(request, product_id):
     context = {'product': product}
     return render(request, 'shop/admin_product_delete.html', context)
 
+def uploads_note(form, formset):
+    """Message suffix for images staged by the product forms (processed by shop.uploads)."""
+    staged = [f for f in [form, *formset.forms] if f.instance.pk and f.instance.pending_image]
+    if not staged:
+        return ''
+    return f' {len(staged)} image(s) are being processed and will appear shortly.'
+
 @staff_member_required
 def admin_product_add(request):
     """Add new product with multiple images and category creation"""
@@ -540,7 +545,7 @@ def admin_product_add(request):
                 formset.instance = product
                 formset.save()
             
-            messages.success(request, f'Product "{product.name}" created successfully!')
+            messages.success(request, f'Product "{product.name}" created successfully!{uploads_note(form, formset)}')
             return redirect('admin_products')
         else:
             messages.error(request, 'Please correct the errors below.')
@@ -571,7 +576,7 @@ def admin_product_edit(request, product_id):
             if formset.is_valid():
                 formset.save()
             
-            messages.success(request, f'Product "{product.name}" updated successfully!')
+            messages.success(request, f'Product "{product.name}" updated successfully!{uploads_note(form, formset)}')
             return redirect('admin_products')
         else:
             messages.error(request, 'Please correct the errors below.')
@@ -1,4 +1,4 @@
-const { useEffect, useState, useMemo, useCallback } = React;
+const { useEffect, useState, useMemo, useCallback, useRef } = React;
 
 // --- Auth helpers ---
 const tokenKey = 'jwt_access';
@@ -110,7 +110,7 @@ function FeaturedProductsGrid({ go }) {
     
     console.log('Fetching featured products...');
     
-    fetch('/api/products/featured/')
+    fetch('/api/products/featured/?compact=1')
       .then(r => {
         console.log('Featured products response:', r.status, r.statusText);
         if (!r.ok) {
@@ -129,7 +129,8 @@ function FeaturedProductsGrid({ go }) {
         // If no featured products, try regular products as fallback
         if (products.length === 0) {
           console.log('No featured products, trying regular products...');
-          return fetch('/api/products/')
+          // One cursor page of exactly the six cards shown, rather than a full page cut down
+          return fetch('/api/products/?compact=1&page_size=6')
             .then(r => r.ok ? r.json() : Promise.reject(r))
             .then(fallbackData => {
               const fallbackProducts = Array.isArray(fallbackData) ? fallbackData.slice(0, 6) : fallbackData.results?.slice(0, 6) || [];
@@ -222,29 +223,52 @@ function ProductGrid({ go }) {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
   const [params, setParams] = useState({});
-  const [isInitialLoad, setIsInitialLoad] = useState(true);
+  const [nextUrl, setNextUrl] = useState(null);
+  const [loadingMore, setLoadingMore] = useState(false);
+  // Bumped on every filter change so responses for the previous filters are dropped
+  const requestId = useRef(0);
+  const sentinel = useRef(null);
 
   function reload(p={}) {
-    // Prevent multiple simultaneous requests
-    if (loading && !isInitialLoad) return;
-    
     const usp = new URLSearchParams();
     for (const k in p) if (p[k]) usp.set(k, p[k]);
+    usp.set('compact', '1');
     const qs = usp.toString();
-    
+    const id = ++requestId.current;
+
     setLoading(true);
+    setLoadingMore(false);
     setError(null);
-    
+    setItems([]);
+    setNextUrl(null);
+
     fetch('/api/products/' + (qs ? `?${qs}` : ''))
       .then(r => r.ok ? r.json() : Promise.reject(r))
-      .then(data => { 
-        setItems(Array.isArray(data) ? data : data.results || []); 
-        setIsInitialLoad(false);
+      .then(data => {
+        if (id !== requestId.current) return;
+        setItems(Array.isArray(data) ? data : data.results || []);
+        setNextUrl(Array.isArray(data) ? null : data.next || null);
       })
-      .catch(() => setError('Failed to load products'))
-      .finally(() => setLoading(false));
+      .catch(() => { if (id === requestId.current) setError('Failed to load products'); })
+      .finally(() => { if (id === requestId.current) setLoading(false); });
   }
 
+  // Follows the cursor the API handed back with the last page
+  const loadMore = useCallback(() => {
+    if (!nextUrl || loading || loadingMore) return;
+    const id = requestId.current;
+    setLoadingMore(true);
+    fetch(nextUrl)
+      .then(r => r.ok ? r.json() : Promise.reject(r))
+      .then(data => {
+        if (id !== requestId.current) return;
+        setItems(prev => prev.concat(data.results || []));
+        setNextUrl(data.next || null);
+      })
+      .catch(() => { if (id === requestId.current) setError('Failed to load more products'); })
+      .finally(() => { if (id === requestId.current) setLoadingMore(false); });
+  }, [nextUrl, loading, loadingMore]);
+
   useEffect(() => { 
     // Only reload if params actually changed
     const timeoutId = setTimeout(() => {
@@ -253,6 +277,17 @@ function ProductGrid({ go }) {
     
     return () => clearTimeout(timeoutId);
   }, [params]);
+
+  // Infinite scroll: load the next page once the end of the grid comes into view
+  useEffect(() => {
+    const el = sentinel.current;
+    if (!el || !nextUrl || !('IntersectionObserver' in window)) return;
+    const observer = new IntersectionObserver(entries => {
+      if (entries.some(e => e.isIntersecting)) loadMore();
+    }, { rootMargin: '400px' });
+    observer.observe(el);
+    return () => observer.disconnect();
+  }, [nextUrl, loadMore]);
   
   // Only run fade animation when items actually change, not on every render
   useFadeInOnMount([items.length]);
@@ -280,12 +315,12 @@ function ProductGrid({ go }) {
       .catch(()=>{});
   };
 
-  if (loading) return <p className="glass-blur" style={{padding:12}}>Loading products…</p>;
-  if (error) return <p className="glass-blur" style={{padding:12}}>{error}</p>;
-
+  // Filters stay mounted while a page loads so the search box keeps its text
   return (
     <>
       <Filters onChange={handleParamsChange} />
+      {loading && <p className="glass-blur" style={{padding:12}}>Loading products…</p>}
+      {error && <p className="glass-blur" style={{padding:12}}>{error}</p>}
       <div className="grid">
         {items.map(item => (
           <ProductCard key={item.id || item.pk} product={item}
@@ -294,6 +329,13 @@ function ProductGrid({ go }) {
             onDetails={() => go(`#/product/${item.id}`)} />
         ))}
       </div>
+      {nextUrl && !loading && (
+        <div ref={sentinel} style={{textAlign:'center', padding:16}}>
+          <button className="btn btn-outline" onClick={loadMore} disabled={loadingMore}>
+            {loadingMore ? 'Loading…' : 'Load more'}
+          </button>
+        </div>
+      )}
     </>
   );
 }
@@ -329,7 +371,7 @@ function ProductDetail({ id, go }) {
 
 function WishlistPage({ go }) {
   const [items, setItems] = useState([]);
-  const load = () => authFetch('/api/wishlist/').then(r=>{ if(r.status===401){go('#/login');return [];} return r.json();}).then(setItems);
+  const load = () => authFetch('/api/wishlist/?compact=1').then(r=>{ if(r.status===401){go('#/login');return [];} return r.json();}).then(setItems);
   useEffect(load, []);
   useFadeInOnMount([items]);
 
@@ -350,14 +392,37 @@ function WishlistPage({ go }) {
 
 function CartPage({ go }) {
   const [items, setItems] = useState([]);
-  const load = () => authFetch('/api/cart/').then(r=>{ if(r.status===401){go('#/login');return [];} return r.json();}).then(setItems);
+  const load = () => authFetch('/api/cart/?compact=1').then(r=>{ if(r.status===401){go('#/login');return [];} return r.json();}).then(setItems);
   useEffect(load, []);
 
-  const updateQty = (id, quantity) => authFetch(`/api/cart/${id}/`, { method:'PATCH', body: JSON.stringify({ quantity }) }).then(load);
-  const remove = (id) => authFetch(`/api/cart/${id}/`, { method:'DELETE' }).then(load);
+  // Queue quantity changes/removals and send them as one batch request
+  const pending = useRef([]);
+  const flushTimer = useRef(null);
+  const flush = () => {
+    const operations = pending.current;
+    pending.current = [];
+    if (!operations.length) return;
+    authFetch('/api/cart/batch/?compact=1', { method:'POST', body: JSON.stringify({ operations }) })
+      .then(r => r.ok ? r.json().then(setItems) : load());
+  };
+  const queue = (op) => {
+    pending.current.push(op);
+    clearTimeout(flushTimer.current);
+    flushTimer.current = setTimeout(flush, 300);
+  };
+  useEffect(() => () => { clearTimeout(flushTimer.current); flush(); }, []);
+
+  const updateQty = (it, quantity) => {
+    setItems(items => items.map(x => x.id === it.id ? Object.assign({}, x, { quantity }) : x));
+    queue({ op: 'set', product_id: it.product.id, quantity });
+  };
+  const remove = (it) => {
+    setItems(items => items.filter(x => x.id !== it.id));
+    queue({ op: 'remove', product_id: it.product.id });
+  };
   const checkout = () => authFetch('/api/checkout/whatsapp/').then(r=>r.json()).then(data => { if (data.wa_url) window.open(data.wa_url, '_blank'); });
 
-  const total = useMemo(() => items.reduce((s, it) => s + (Number(it.line_total)||0), 0), [items]);
+  const total = useMemo(() => items.reduce((s, it) => s + (Number(it.total_price)||0), 0), [items]);
   useFadeInOnMount([items]);
 
   return (
@@ -368,8 +433,8 @@ function CartPage({ go }) {
         <div key={it.id} className="fade-in" data-animate style={{display:'grid', gridTemplateColumns:'1fr auto auto auto', gap:10, alignItems:'center', padding:'8px 0', borderBottom:'1px solid var(--stroke)'}}>
           <span>{it.product.name}</span>
           <span>₹{Number(it.product.price).toFixed(2)}</span>
-          <input type="number" min="1" value={it.quantity} onChange={e=>updateQty(it.id, parseInt(e.target.value||'1'))} className="glass-input" style={{width:70}} />
-          <button onClick={()=>remove(it.id)}>Remove</button>
+          <input type="number" min="1" value={it.quantity} onChange={e=>updateQty(it, Math.max(1, parseInt(e.target.value||'1')))} className="glass-input" style={{width:70}} />
+          <button onClick={()=>remove(it)}>Remove</button>
         </div>
       ))}
       <div style={{display:'flex', justifyContent:'space-between', marginTop:12}}>